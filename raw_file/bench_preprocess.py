@@ -0,0 +1,67 @@
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_preprocessing import extract_features, extract_features_reference
+
+WARDS = ['渋谷区', '新宿区', '港区', '世田谷区', '目黒区', '品川区', '中野区', '杉並区']
+LINES = ['ＪＲ山手線', '東京メトロ銀座線', '東急東横線', '京王井の頭線', '小田急線', '東京メトロ日比谷線']
+STATIONS = ['渋谷駅', '表参道駅', '中目黒駅', '下北沢駅', '代々木上原駅', '恵比寿駅', '五反田駅']
+LAYOUTS = ['ワンルーム', '1R', '1K', '1DK', '1LDK', '2K', '2DK', '2LDK', '3LDK', '1SLDK']
+
+def synthetic_raw(n_rows, seed=0):
+    """スクレイピング結果と同じ形式の生データをランダムに作る"""
+    rng = np.random.default_rng(seed)
+    ages = rng.integers(0, 50, n_rows)
+    floors = rng.integers(2, 30, n_rows)
+    transportation = [f'{rng.choice(LINES)}/{rng.choice(STATIONS)} 歩{rng.integers(1, 20)}分' for _ in range(200)]
+    return pd.DataFrame({
+        'building_name': [f'ビル{i}' for i in range(n_rows)],
+        'address': ['東京都' + WARDS[w] + f'神南{c}' for w, c in zip(rng.integers(0, len(WARDS), n_rows),
+                                                                 rng.integers(1, 6, n_rows))],
+        'transportation_1': rng.choice(transportation, n_rows),
+        'transportation_2': rng.choice(transportation, n_rows),
+        'transportation_3': rng.choice(transportation, n_rows),
+        'age': np.where(ages == 0, '新築', np.char.add(np.char.add('築', ages.astype(str)), '年')),
+        'floors': np.char.add(np.char.add('地上', floors.astype(str)), '階建'),
+        'rent': rng.uniform(5, 30, n_rows).round(1),
+        'admin_fee': rng.integers(0, 15, n_rows) * 1000.0,
+        'layout': rng.choice(LAYOUTS, n_rows),
+        'area': rng.uniform(15, 80, n_rows).round(2),
+    })
+
+def best_time(func, df, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def same_values(expected, result):
+    """列の並びと値が一致するか（文字列列の dtype の違いは無視する）"""
+    try:
+        pd.testing.assert_frame_equal(expected, result, check_dtype=False)
+    except AssertionError:
+        return False
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="前処理の文字列特徴量抽出を元の実装と比較する")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 300_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'reference':>11} {'fast':>9} {'speedup':>8}  same")
+    for n_rows in args.sizes:
+        df = synthetic_raw(n_rows)
+        reference_time, expected = best_time(extract_features_reference, df, args.repeat)
+        fast_time, result = best_time(extract_features, df, args.repeat)
+        same = same_values(expected, result)
+        print(f"{n_rows:>10} {reference_time:>10.3f}s {fast_time:>8.3f}s {reference_time / fast_time:>7.1f}x  {same}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+
+import hashlib
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import lightgbm as lgb
+import numpy as np
+from sklearn.model_selection import KFold
+
+from metrics import METRICS
+
+# ハイパーパラメータ探索の試行結果（1行1試行のJSONL）と、探索で選ばれたパラメータの保存先
+TRIALS_PATH = 'data/cv_trials.jsonl'
+BEST_PARAMS_PATH = 'data/best_params.json'
+
+# ビン分割に関わるパラメータ。Datasetは1回だけ作るので、探索では変えない
+DATASET_PARAMS = {'max_bin': 255, 'feature_pre_filter': False, 'verbose': -1}
+
+# LGBMRegressor(random_state=42) の既定値に合わせる
+BASE_PARAMS = {'objective': 'regression', 'learning_rate': 0.1, 'num_leaves': 31, 'seed': 42, 'verbose': -1}
+NUM_BOOST_ROUND = 100
+
+# 早期終了の判定に使う、訓練データから取り分ける割合（評価するfoldの行は判定に使わない）
+STOPPING_FRACTION = 0.1
+
+# (分布, 下限, 上限)
+SEARCH_SPACE = {
+    'learning_rate': ('log', 0.02, 0.2),
+    'num_leaves': ('int', 15, 255),
+    'min_data_in_leaf': ('int', 5, 100),
+    'feature_fraction': ('float', 0.5, 1.0),
+    'bagging_fraction': ('float', 0.5, 1.0),
+    'lambda_l2': ('log', 1e-3, 10.0),
+}
+
+def sample_params(trial_id, seed=42):
+    """試行番号から決まるパラメータを返す（再開しても同じ試行は同じパラメータになる）"""
+    rng = random.Random(f'{seed}-{trial_id}')
+    params = dict(BASE_PARAMS, bagging_freq=1)
+    for name, (kind, low, high) in SEARCH_SPACE.items():
+        if kind == 'int':
+            params[name] = rng.randint(low, high)
+        elif kind == 'log':
+            params[name] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+        else:
+            params[name] = rng.uniform(low, high)
+    return params
+
+def thread_budget(n_jobs=None):
+    return n_jobs if n_jobs and n_jobs > 0 else os.cpu_count() or 1
+
+def search_key(dataset_fingerprint, n_splits, random_state, n_trials, min_rounds, max_rounds, eta,
+               early_stopping_rounds, seed):
+    """試行結果を再利用してよい条件（学習データ・探索範囲・fold・halvingの設定）のハッシュ"""
+    config = {'dataset': dataset_fingerprint, 'search_space': SEARCH_SPACE, 'base_params': BASE_PARAMS,
+              'dataset_params': DATASET_PARAMS, 'n_splits': n_splits, 'random_state': random_state,
+              'n_trials': n_trials, 'min_rounds': min_rounds, 'max_rounds': max_rounds, 'eta': eta,
+              'early_stopping_rounds': early_stopping_rounds, 'stopping_fraction': STOPPING_FRACTION, 'seed': seed}
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+class TrialStore:
+    """探索の試行結果をJSONLに追記し、中断後の再開時に読み込む
+    key (search_key) とパラメータが一致する結果だけを再利用する（データや探索の設定を変えた場合は学習し直す）
+    """
+
+    def __init__(self, path=TRIALS_PATH, restart=False, key=None):
+        self.path = path
+        self.key = key
+        self.records = {}
+        if restart and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        if record.get('key') == key:
+                            self.records[record['trial'], record['rounds']] = record
+
+    def get(self, trial, rounds, params):
+        record = self.records.get((trial, rounds))
+        return record if record and record['params'] == params else None
+
+    def add(self, record):
+        record = dict(record, key=self.key)
+        self.records[record['trial'], record['rounds']] = record
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+
+class CVEngine:
+    """LightGBMの交差検証と、successive halvingによるハイパーパラメータ探索
+
+    特徴量のビン分割（Dataset）は全データで1回だけ行い、各foldはその部分集合として作る。
+    fold・試行は1つの作業キューに並べ、n_jobs のスレッドを threads_per_task ずつ割り当てて
+    並列に学習する（LightGBMは学習中GILを解放する）。RMSEは家賃（万円）のスケールで求める。
+    早期終了は訓練データから取り分けた行で判定する。評価するfoldの行で判定すると、その行に合わせて
+    木の数を選ぶことになり、RMSEが楽観的になる（探索では早期終了しやすい設定が有利になる）。
+    """
+
+    def __init__(self, X, y, n_splits=5, random_state=42, n_jobs=None, threads_per_task=1):
+        self.X = X
+        self.y = np.asarray(y, dtype=float)
+        self.n_jobs = thread_budget(n_jobs)
+        self.threads_per_task = max(1, min(threads_per_task, self.n_jobs))
+        self.random_state = random_state
+        self.data = lgb.Dataset(X, self.y, params=DATASET_PARAMS, free_raw_data=False).construct()
+        kf = KFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+        self.folds = list(kf.split(X))
+
+    @property
+    def workers(self):
+        return max(1, self.n_jobs // self.threads_per_task)
+
+    def map(self, func, tasks):
+        """func(*task) をスレッドの予算内で並列に実行し、結果を tasks の順に返す"""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(lambda task: func(*task), tasks))
+
+    def stopping_split(self, train_index):
+        """train_index を (学習に使う行, 早期終了の判定に使う行) に分ける（同じ train_index なら同じ分け方）"""
+        rng = np.random.default_rng([self.random_state, len(train_index)])
+        shuffled = rng.permutation(train_index)
+        n_stop = max(1, int(round(len(train_index) * STOPPING_FRACTION)))
+        return np.sort(shuffled[n_stop:]), np.sort(shuffled[:n_stop])
+
+    def fit(self, params, train_index, num_boost_round, early_stopping_rounds=None):
+        """train_index の行で学習する。(booster, 使った木の数) を返す
+        early_stopping_rounds を指定した場合は train_index の一部を取り分けて早期終了の判定に使い、残りで学習する
+        """
+        valid_sets, callbacks = [], []
+        if early_stopping_rounds:
+            train_index, stop_index = self.stopping_split(train_index)
+            # 部分集合は親のビンをそのまま使う。スレッド間で共有しないよう、作業ごとに作る
+            valid_sets = [self.data.subset(stop_index).construct()]
+            callbacks = [lgb.early_stopping(early_stopping_rounds, verbose=False)]
+        train_set = self.data.subset(train_index).construct()
+        with METRICS.timer('model.fit'):
+            booster = lgb.train(dict(params, num_threads=self.threads_per_task), train_set, num_boost_round,
+                                valid_sets=valid_sets, callbacks=callbacks)
+        return booster, booster.best_iteration or num_boost_round
+
+    def predict_rmse(self, booster, index, num_iteration):
+        """index の行の (RMSE, 予測家賃)。どちらも家賃（万円）のスケール"""
+        with METRICS.timer('model.predict'):
+            pred = np.expm1(booster.predict(self.X.iloc[index], num_iteration=num_iteration,
+                                            num_threads=self.threads_per_task))
+        return float(np.sqrt(np.mean((pred - np.expm1(self.y[index])) ** 2))), pred
+
+    def train_fold(self, params, fold, num_boost_round, early_stopping_rounds=None):
+        """1つのfoldを学習し、(RMSE, 使った木の数, 検証データの予測家賃) を返す"""
+        train_index, val_index = self.folds[fold]
+        booster, best_iteration = self.fit(params, train_index, num_boost_round, early_stopping_rounds)
+        rmse, pred = self.predict_rmse(booster, val_index, best_iteration)
+        return rmse, best_iteration, pred
+
+    def evaluate(self, candidates, num_boost_round, early_stopping_rounds=None, on_result=None,
+                 keep_predictions=False):
+        """候補 {名前: パラメータ} を全foldで並列に評価し、{名前: 結果} を返す
+        on_result は候補の全foldが終わるたびに (名前, 結果) で呼ばれる
+        keep_predictions=True の場合は結果の oof_pred に全行の out-of-fold 予測（万円）を入れる
+        """
+        tasks = [(name, fold) for name in candidates for fold in range(len(self.folds))]
+        fold_results = {name: {} for name in candidates}
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.train_fold, candidates[name], fold, num_boost_round,
+                                       early_stopping_rounds): (name, fold) for name, fold in tasks}
+            for future in as_completed(futures):
+                name, fold = futures[future]
+                fold_results[name][fold] = future.result()
+                if len(fold_results[name]) == len(self.folds):
+                    scores = [fold_results[name][i] for i in range(len(self.folds))]
+                    rmse = [score for score, _, _ in scores]
+                    results[name] = {'rmse': float(np.mean(rmse)), 'rmse_std': float(np.std(rmse)),
+                                     'fold_rmse': rmse, 'best_iterations': [it for _, it, _ in scores]}
+                    if keep_predictions:
+                        results[name]['oof_pred'] = self._out_of_fold([pred for _, _, pred in scores])
+                    if on_result:
+                        on_result(name, results[name])
+        return results
+
+    def _out_of_fold(self, fold_preds):
+        oof = np.empty(len(self.y))
+        for (_, val_index), pred in zip(self.folds, fold_preds):
+            oof[val_index] = pred
+        return oof
+
+    def cross_validate(self, params=BASE_PARAMS, num_boost_round=NUM_BOOST_ROUND, early_stopping_rounds=None,
+                       keep_predictions=False):
+        return self.evaluate({'cv': params}, num_boost_round, early_stopping_rounds,
+                             keep_predictions=keep_predictions)['cv']
+
+    def successive_halving(self, n_trials=27, min_rounds=50, max_rounds=1000, eta=3, early_stopping_rounds=50,
+                           store=None, seed=42, log=print):
+        """n_trials 個のパラメータを少ない木の数で評価し、上位 1/eta だけを eta 倍の木の数で評価し直す
+        試行結果は store に保存され、同じ (試行, 木の数) は再開時に学習しない
+        """
+        store = store or TrialStore()
+        candidates = list(range(n_trials))
+        rounds = min_rounds
+        while True:
+            params = {trial: sample_params(trial, seed) for trial in candidates}
+            todo = {trial: params[trial] for trial in candidates if not store.get(trial, rounds, params[trial])}
+            log(f'Rung with {rounds} rounds: {len(candidates)} trials ({len(candidates) - len(todo)} already done)')
+
+            def save(trial, result):
+                store.add(dict(result, trial=trial, rounds=rounds, params=todo[trial]))
+                log(f'  trial {trial}: RMSE {result["rmse"]:.4f} (best iterations {result["best_iterations"]})')
+
+            self.evaluate(todo, rounds, early_stopping_rounds, on_result=save)
+            candidates.sort(key=lambda trial: store.get(trial, rounds, params[trial])['rmse'])
+            if len(candidates) == 1 or rounds >= max_rounds:
+                break
+            candidates = candidates[:max(1, len(candidates) // eta)]
+            rounds = min(rounds * eta, max_rounds)
+        return store.get(candidates[0], rounds, params[candidates[0]])
+
+def save_best_params(record, path=BEST_PARAMS_PATH):
+    """探索で選ばれたパラメータと、foldの最適な木の数の平均を保存する"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'params': record['params'], 'num_boost_round': int(np.mean(record['best_iterations'])),
+                   'rmse': record['rmse']}, f, indent=1)
+
+def load_best_params(path=BEST_PARAMS_PATH):
+    """保存済みのパラメータと木の数。なければ既定値"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            best = json.load(f)
+    except (OSError, ValueError):
+        return dict(BASE_PARAMS), NUM_BOOST_ROUND
+    return best['params'], best['num_boost_round']
@@ -1,11 +1,115 @@
 
+import argparse
+import json
+import os
+import re
+import time
 import pandas as pd
 import warnings
 import numpy as np
 
+from dataset import read_raw, write_processed, PROCESSED_PATH, NON_FEATURE_COLUMNS
+from station_index import StationIndex, STATION_INDEX_PATH
+from geocoder import CITY_PATTERN
+from geo_index import GeoIndex, GEO_INDEX_PATH, NEIGHBOR_COLUMNS
+from metrics import METRICS, add_arguments as add_metrics_arguments, instrument
+
 warnings.filterwarnings('ignore')
 
-def preprocess(df):
+# 学習済みの前処理（カテゴリの語彙・欠損値の補完値・列の並び）の保存先
+PIPELINE_PATH = 'data/feature_pipeline.json'
+
+CATEGORICAL_FEATURES = ['city', 'line']
+MEDIAN_FILL_FEATURES = ['age_years', 'total_floors', 'walk_minutes']
+RAW_TEXT_COLUMNS = [
+    'building_name', 'address', 'transportation_1', 'transportation_2',
+    'transportation_3', 'age', 'floors', 'layout', 'area'
+]
+
+AGE_PATTERN = re.compile(r'(\d+)')
+FLOORS_PATTERN = re.compile(r'(\d+)階建')
+WALK_PATTERN = re.compile(r'歩(\d+)分')
+ROOMS_PATTERN = re.compile(r'(\d+)')
+LAYOUT_LETTERS = ['L', 'D', 'K', 'S', 'R']
+
+def _lookup(series, parse, dtypes):
+    """列のユニークな値ごとに1回だけ parse を呼び、結果を型付きの配列として全行に展開する
+    parse は1つの値（欠損はNone）から dtypes と同じ数の値のタプルを返す関数
+    """
+    codes, uniques = pd.factorize(series)
+    # 最後の要素は欠損値 (code = -1) 用
+    parsed = [parse(value) for value in uniques] + [parse(None)]
+    return [np.array([values[i] for values in parsed], dtype=dtype)[codes] for i, dtype in enumerate(dtypes)]
+
+def _first_int(pattern, value):
+    match = pattern.search(value) if value is not None else None
+    return float(match.group(1)) if match else np.nan
+
+def _parse_age(value):
+    return (0.0 if value == '新築' else _first_int(AGE_PATTERN, value),)
+
+def _parse_floors(value):
+    return (_first_int(FLOORS_PATTERN, value),)
+
+def _parse_layout(value):
+    letters = tuple(value is not None and letter in value for letter in LAYOUT_LETTERS)
+    rooms = _first_int(ROOMS_PATTERN, value)
+    return letters + (1.0 if np.isnan(rooms) else rooms,)
+
+def _parse_transportation(value):
+    if value is None:
+        return np.nan, '不明'
+    return _first_int(WALK_PATTERN, value), value.split('/')[0]
+
+def _parse_address(value):
+    match = CITY_PATTERN.match(value) if value is not None else None
+    return (match.group(1) if match else '不明',)
+
+def extract_features(df):
+    """生データの文字列から特徴量を取り出す（データに依存する値は使わない）
+
+    文字列の列は値の種類が少ないので、列ごとに1回だけユニークな値を解析し、その結果を
+    全行に展開する。結果は extract_features_reference と同じ。
+    """
+    index = df.index
+    columns = {col: df[col] for col in df.columns if col not in RAW_TEXT_COLUMNS}
+
+    def add(names, arrays):
+        for name, values in zip(names, arrays):
+            columns[name] = pd.Series(values, index=index)
+
+    # 1. 築年数 (age) から数値（年数）を抽出。新築の場合は0年とする
+    add(['age_years'], _lookup(df['age'], _parse_age, [float]))
+
+    # 2. 建物階数 (floors) から数値（地上階数）を抽出
+    add(['total_floors'], _lookup(df['floors'], _parse_floors, [float]))
+
+    # 3. 交通アクセス (transportation_1) から駅徒歩分数と路線名を抽出 (最も近いもの)
+    add(['walk_minutes', 'line'], _lookup(df['transportation_1'], _parse_transportation, [float, object]))
+
+    # 4. 面積 (area) を数値に変換（スクレイパーから1件ずつ渡す場合は文字列のこともある）
+    columns['area_m2'] = pd.to_numeric(df['area'], errors='coerce')
+
+    # 5. 間取り (layout) をダミー変数と部屋数に変換
+    add([f'has_{letter}' for letter in LAYOUT_LETTERS] + ['layout_rooms'],
+        _lookup(df['layout'], _parse_layout, [int] * len(LAYOUT_LETTERS) + [float]))
+
+    # 6. 住所(address)から市区町村を抽出
+    add(['city'], _lookup(df['address'], _parse_address, [object]))
+
+    # rent_logを追加 (モデリング用)
+    if 'rent' in df.columns:
+        columns['rent_log'] = np.log1p(pd.to_numeric(df['rent'], errors='coerce'))
+
+    # 元の実装と同じ列の並びにする
+    order = [col for col in df.columns if col not in RAW_TEXT_COLUMNS] + [
+        'age_years', 'total_floors', 'walk_minutes', 'area_m2'] + [
+        f'has_{letter}' for letter in LAYOUT_LETTERS] + ['layout_rooms', 'city', 'line']
+    order += [col for col in columns if col not in order]
+    return pd.DataFrame({col: columns[col] for col in order}, index=index)
+
+def extract_features_reference(df):
+    """extract_features の元の実装（列ごとに正規表現を適用する）。結果の確認とベンチマーク用"""
     # コピーを作成して元のDataFrameを変更しないようにする
     df_processed = df.copy()
 
@@ -31,46 +135,154 @@ def preprocess(df):
     df_processed['has_S'] = df_processed['layout'].str.contains('S').astype(int)
     df_processed['has_R'] = df_processed['layout'].str.contains('R').astype(int)
     df_processed['layout_rooms'] = df_processed['layout'].str.extract(r'(\d+)').astype(float)
-    df_processed['layout_rooms'].fillna(1, inplace=True)
+    df_processed['layout_rooms'] = df_processed['layout_rooms'].fillna(1)
 
     # 6. 住所(address)から市区町村を抽出
-    df_processed['city'] = df['address'].str.extract(r'東京都(.*?[市区])')
-    df_processed['city'].fillna('不明', inplace=True)
+    df_processed['city'] = df['address'].str.extract(CITY_PATTERN.pattern, expand=False)
+    df_processed['city'] = df_processed['city'].fillna('不明')
 
     # 7. 交通アクセス(transportation_1)から路線名を抽出
     df_processed['line'] = df['transportation_1'].str.split('/').str[0]
-    df_processed['line'].fillna('不明', inplace=True)
-
-    # 8. カテゴリカル変数をOne-Hotエンコーディング
-    categorical_features = ['city', 'line']
-    df_processed = pd.get_dummies(df_processed, columns=categorical_features, dummy_na=False)
-
-    # 9. 不要な列を削除
-    df_processed = df_processed.drop([
-        'building_name', 'address', 'transportation_1', 'transportation_2',
-        'transportation_3', 'age', 'floors', 'layout', 'area'
-    ], axis=1)
+    df_processed['line'] = df_processed['line'].fillna('不明')
 
-    # 10. 欠損値の処理
-    for col in ['age_years', 'total_floors', 'walk_minutes']:
-        df_processed[col].fillna(df_processed[col].median(), inplace=True)
+    # 8. 不要な列を削除
+    df_processed = df_processed.drop([col for col in RAW_TEXT_COLUMNS if col in df_processed.columns], axis=1)
 
     # rent_logを追加 (モデリング用)
-    df_processed['rent_log'] = np.log1p(df['rent'])
+    if 'rent' in df.columns:
+        df_processed['rent_log'] = np.log1p(df['rent'])
 
     return df_processed
 
+class FeaturePipeline:
+    """fit時にカテゴリの語彙と欠損値の補完値を固定し、どのデータも同じ列の並びに変換する前処理
+
+    city / line は語彙を固定したpandasのcategory型（整数コード）で持つ。学習時に
+    なかった値は欠損になる。JSONに保存できるので、新しい物件を1件ずつ変換することもできる。
+    交通アクセス3件分の駅の特徴量は StationIndex から、住所の座標と近傍の家賃の特徴量は GeoIndex から作る。
+    """
+
+    def __init__(self):
+        self.vocabularies = {}
+        self.medians = {}
+        self.feature_columns = []
+        self.stations = StationIndex()
+        self.geo = GeoIndex()
+
+    def _features(self, df):
+        return pd.concat([extract_features(df), self.stations.transform(df), self.geo.transform(df)], axis=1)
+
+    def fit(self, df):
+        self.stations.fit(df)
+        self.geo.fit(df)
+        features = self._features(df)
+        for col in CATEGORICAL_FEATURES:
+            self.vocabularies[col] = sorted(features[col].dropna().unique().tolist())
+        for col in MEDIAN_FILL_FEATURES:
+            median = features[col].median()
+            self.medians[col] = None if pd.isna(median) else float(median)
+        self.feature_columns = [
+            col for col in features.columns
+            if col not in NON_FEATURE_COLUMNS
+            and (col in CATEGORICAL_FEATURES or pd.api.types.is_numeric_dtype(features[col]))
+        ]
+        return self
+
+    def transform(self, df):
+        """生データ（DataFrame、または1件分のdict）を学習時と同じ列の並びに変換する
+        特徴量の後ろに、入力にあれば目的変数・行ID・パーティション列などをそのまま残す
+        """
+        if isinstance(df, dict):
+            df = pd.DataFrame([df])
+        features = self._features(df)
+        # 列ごとに変換してから最後に1回だけDataFrameを組み立てる（1件ずつの予測でも速いように）
+        columns = {col: features[col] for col in features.columns}
+
+        # 9. カテゴリ変数を固定した語彙の整数コードに変換
+        for col in CATEGORICAL_FEATURES:
+            columns[col] = pd.Series(pd.Categorical(columns[col], categories=self.vocabularies[col]),
+                                     index=features.index)
+
+        # 10. 欠損値の処理（fit時の中央値で補完）
+        for col, median in self.medians.items():
+            if median is not None:
+                columns[col] = columns[col].fillna(median)
+
+        # 入力に列がなければ欠損として追加する（詳細ページの項目が取れなかった物件など）
+        # JSONやCSVから1件ずつ渡された数値が文字列のこともあるので数値に揃える
+        for col in self.feature_columns:
+            if col not in columns:
+                columns[col] = pd.Series(np.nan, index=features.index)
+            elif col not in CATEGORICAL_FEATURES and not pd.api.types.is_numeric_dtype(columns[col]):
+                columns[col] = pd.to_numeric(columns[col], errors='coerce')
+        passthrough = [col for col in columns if col not in self.feature_columns]
+        return pd.DataFrame({col: columns[col] for col in self.feature_columns + passthrough}, index=features.index)
+
+    def fit_transform(self, df):
+        """学習データの変換。駅の家賃中央値と近傍の家賃は自分の家賃を含まないよう out-of-fold で求める"""
+        features = self.fit(df).transform(df)
+        if 'rent' in df.columns:
+            features['station_median_rent'] = self.stations.out_of_fold_station_rent(df)
+            if self.geo.neighbor_columns:
+                features[NEIGHBOR_COLUMNS] = self.geo.out_of_fold_neighbors(df)
+        return features
+
+    def save(self, path=PIPELINE_PATH, station_index_path=STATION_INDEX_PATH, geo_index_path=GEO_INDEX_PATH):
+        self.stations.save(station_index_path)
+        self.geo.save(geo_index_path)
+        # 索引のパスはこのファイルからの相対パスで持つ（ディレクトリごと移動しても読めるように）
+        directory = os.path.dirname(path) or '.'
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'vocabularies': self.vocabularies, 'medians': self.medians,
+                       'feature_columns': self.feature_columns,
+                       'station_index': os.path.relpath(station_index_path, directory),
+                       'geo_index': os.path.relpath(geo_index_path, directory)},
+                      f, ensure_ascii=False, indent=1)
+
+    @classmethod
+    def load(cls, path=PIPELINE_PATH):
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+        pipeline = cls()
+        pipeline.vocabularies = state['vocabularies']
+        pipeline.medians = state['medians']
+        pipeline.feature_columns = state['feature_columns']
+        pipeline.stations = StationIndex.load(os.path.join(os.path.dirname(path), state['station_index']))
+        # 位置の特徴量より前に保存した前処理には geo_index がない（その列はモデルも使っていない）
+        if 'geo_index' in state:
+            pipeline.geo = GeoIndex.load(os.path.join(os.path.dirname(path), state['geo_index']))
+        return pipeline
+
+def preprocess(df):
+    """全データで前処理を学習し、そのまま変換した結果を返す"""
+    return FeaturePipeline().fit_transform(df)
+
 def main():
+    parser = argparse.ArgumentParser(description="生データの前処理を学習・実行し、前処理済みのデータと前処理を保存する")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    instrument('preprocess', args.metrics_report, args.profile)
+
     # データを読み込む
-    df = pd.read_csv('data/suumo_data.csv')
+    with METRICS.timer('preprocess.read'):
+        df = read_raw()
 
-    # 前処理を実行
-    df_clean = preprocess(df)
+    # 前処理を学習して実行
+    start = time.perf_counter()
+    pipeline = FeaturePipeline()
+    df_clean = pipeline.fit_transform(df)
+    elapsed = time.perf_counter() - start
+    METRICS.observe('preprocess.fit_transform', elapsed)
+    METRICS.incr('preprocess.rows', len(df))
+    METRICS.set('preprocess.rows_per_sec', len(df) / elapsed)
 
-    # 前処理済みのデータを保存
-    output_path = 'data/suumo_data_cleaned.csv'
-    df_clean.to_csv(output_path, index=False, encoding='utf-8-sig')
-    print(f'Preprocessed data saved to {output_path}')
+    # 前処理済みのデータと学習済みの前処理を保存
+    with METRICS.timer('preprocess.write'):
+        write_processed(df_clean)
+        pipeline.save()
+    print(f'Preprocessed {len(df)} rows in {elapsed:.2f}s ({len(df) / elapsed:.0f} rows/s)')
+    print(f'Preprocessed data saved to {PROCESSED_PATH}')
+    print(f'Feature pipeline saved to {PIPELINE_PATH} (station index: {STATION_INDEX_PATH}, geo index: {GEO_INDEX_PATH})')
 
 if __name__ == '__main__':
     main()
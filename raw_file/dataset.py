@@ -0,0 +1,210 @@
+
+import argparse
+import os
+import shutil
+from datetime import date
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from metrics import add_arguments as add_metrics_arguments, instrument
+
+# スクレイピング結果（生データ）とpreprocess後のデータの保存先
+RAW_PATH = 'data/raw'
+PROCESSED_PATH = 'data/processed'
+
+# 取得日とエリア（市区）でパーティションを切る
+PARTITION_COLS = ['scrape_date', 'area_name']
+
+# 行の対応付けに使うID。生データと前処理済みデータの両方に残す
+ROW_ID = 'row_id'
+
+# Parquetファイルの名前。pyarrow の既定はランダムなuuidなので、同じデータなら同じファイルになるよう固定する
+BASENAME_TEMPLATE = 'part-{i}.parquet'
+
+# 価格の列（scraping/listing_store.py の PRICE_FIELDS）。取り込み時はこれが変わった物件だけを追加する
+PRICE_COLUMNS = ['rent', 'admin_fee', 'deposit', 'gratuity']
+
+# 特徴量に含めない列（目的変数、行ID、パーティション列）
+NON_FEATURE_COLUMNS = ['rent', 'rent_log', ROW_ID] + PARTITION_COLS
+
+AMENITY_COLUMNS = [
+    'has_separate_bath_toilet', 'has_reheating', 'has_bathroom_dryer', 'has_autolock', 'has_tv_intercom',
+    'has_delivery_box', 'has_pet_allowed', 'has_musical_instruments_allowed', 'has_free_internet',
+    'has_system_kitchen', 'has_gas_stove_gt2', 'is_top_floor', 'is_corner_room',
+]
+
+# 生データのスキーマ（scraping/suumo_scraper.py の OUTPUT_COLUMNS に対応）
+RAW_SCHEMA = pa.schema(
+    [(ROW_ID, pa.int64())]
+    + [(col, pa.string()) for col in ['building_name', 'address', 'transportation_1', 'transportation_2',
+                                      'transportation_3', 'age', 'floors']]
+    + [('rent', pa.float64()), ('admin_fee', pa.float64()), ('deposit', pa.float64()),
+       ('gratuity', pa.float64()), ('layout', pa.string()), ('area', pa.float64())]
+    + [(col, pa.string()) for col in ['detail_url', 'structure', 'floor_number', 'direction']]
+    + [(col, pa.int8()) for col in AMENITY_COLUMNS]
+    + [(col, pa.string()) for col in PARTITION_COLS]
+)
+
+# 住所の先頭の市区（例: 渋谷区, 横浜市）
+AREA_NAME_PATTERN = r'^(?:東京都|神奈川県)?(.+?[市区])'
+
+def area_name_from_address(address):
+    """住所から市区（例: 渋谷区, 横浜市）を取り出す。パーティションのキーに使う"""
+    names = address.astype(str).str.extract(AREA_NAME_PATTERN, expand=False)
+    return names.fillna('不明')
+
+def _table(df, schema):
+    """スキーマの列順・型に揃えたArrowテーブルを作る。スキーマにない列は捨てる"""
+    columns = {}
+    for field in schema:
+        if field.name in df.columns:
+            values = df[field.name]
+            if pa.types.is_floating(field.type) or pa.types.is_integer(field.type):
+                values = pd.to_numeric(values, errors='coerce')
+            columns[field.name] = pa.array(values, type=field.type, from_pandas=True)
+        else:
+            columns[field.name] = pa.nulls(len(df), type=field.type)
+    return pa.table(columns, schema=schema)
+
+def _next_row_id(path):
+    """既存データの row_id の最大値+1（row_id列だけを読む）"""
+    if not os.path.exists(path):
+        return 0
+    ids = ds.dataset(path, format='parquet', partitioning='hive').to_table(columns=[ROW_ID]).column(ROW_ID)
+    return 0 if len(ids) == 0 else pc.max(ids).as_py() + 1
+
+def write_raw(df, path=RAW_PATH, scrape_date=None):
+    """生データを取得日・エリアごとのParquetに保存する。同じ取得日・エリアのパーティションは置き換える"""
+    df = df.copy()
+    first_id = _next_row_id(path)
+    df[ROW_ID] = range(first_id, first_id + len(df))
+    df['scrape_date'] = str(scrape_date or date.today())
+    df['area_name'] = area_name_from_address(df['address'])
+    pq.write_to_dataset(_table(df, RAW_SCHEMA), path, partition_cols=PARTITION_COLS,
+                        existing_data_behavior='delete_matching', basename_template=BASENAME_TEMPLATE)
+    return df[ROW_ID]
+
+def processed_schema(df):
+    """前処理済みデータの明示的なスキーマ
+    ダミー変数はbool、数値はfloat64、category型は整数コード+語彙の辞書型、それ以外は文字列
+    """
+    fields = []
+    for col, dtype in df.dtypes.items():
+        if col == ROW_ID:
+            fields.append((col, pa.int64()))
+        elif isinstance(dtype, pd.CategoricalDtype):
+            fields.append((col, pa.dictionary(pa.int32(), pa.string())))
+        elif pd.api.types.is_bool_dtype(dtype):
+            fields.append((col, pa.bool_()))
+        elif pd.api.types.is_numeric_dtype(dtype):
+            fields.append((col, pa.float64()))
+        else:
+            fields.append((col, pa.string()))
+    return pa.schema(fields)
+
+def write_processed(df, path=PROCESSED_PATH):
+    """前処理済みデータを保存する。前処理は全件から作り直すので既存のデータは消す"""
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    partition_cols = [col for col in PARTITION_COLS if col in df.columns]
+    pq.write_to_dataset(_table(df, processed_schema(df)), path, partition_cols=partition_cols or None,
+                        basename_template=BASENAME_TEMPLATE)
+
+def _read(path, columns, filters):
+    df = pd.read_parquet(path, engine='pyarrow', columns=columns, filters=filters)
+    # パーティション列はcategoryで返ってくるので文字列に戻す
+    for col in PARTITION_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype(str)
+    if ROW_ID in df.columns:
+        df = df.sort_values(ROW_ID, kind='stable').reset_index(drop=True)
+    return df
+
+def latest_listings(df):
+    """同じ物件 (detail_url) は最後の取得日の行だけを残す。detail_url のない行はそのまま残す"""
+    order = df.sort_values(['scrape_date', ROW_ID], kind='stable')
+    keep = order['detail_url'].isna() | ~order.duplicated('detail_url', keep='last')
+    return df.loc[order.index[keep.to_numpy()]].sort_index()
+
+def read_raw(columns=None, filters=None, path=RAW_PATH, latest_only=True):
+    """生データを読み込む。columns で列を、filters（例: [('area_name', '=', '渋谷区')]）で行を絞り込む
+    取り込みのたびに取得日のパーティションが増えるので、latest_only=True の場合は同じ物件 (detail_url) を
+    最後の取得日の1行にまとめる（全取得日の行が要る場合は False）
+    """
+    if not latest_only:
+        return _read(path, columns, filters)
+    key_columns = ['detail_url', 'scrape_date', ROW_ID]
+    read_columns = None if columns is None else list(dict.fromkeys(list(columns) + key_columns))
+    df = latest_listings(_read(path, read_columns, filters)).reset_index(drop=True)
+    return df if columns is None else df[list(columns)]
+
+def read_processed(columns=None, filters=None, path=PROCESSED_PATH):
+    """前処理済みデータを読み込む。row_id順に並ぶので、同じ filters で読んだ生データと行が対応する"""
+    return _read(path, columns, filters)
+
+def processed_schema_of(path=PROCESSED_PATH):
+    """データを読まずに保存済みのスキーマだけを返す"""
+    return ds.dataset(path, format='parquet', partitioning='hive').schema
+
+def feature_columns(path=PROCESSED_PATH):
+    """数値・bool・カテゴリ（辞書型）の列のうち、目的変数・行ID・パーティション列以外を特徴量とする"""
+    return [field.name for field in processed_schema_of(path)
+            if field.name not in NON_FEATURE_COLUMNS
+            and (pa.types.is_floating(field.type) or pa.types.is_integer(field.type)
+                 or pa.types.is_boolean(field.type) or pa.types.is_dictionary(field.type))]
+
+def load_features(target='rent_log', extra_columns=(), filters=None, path=PROCESSED_PATH):
+    """(特徴量X, 目的変数y, extra_columnsのDataFrame) を返す。必要な列だけを読む"""
+    features = feature_columns(path)
+    extra = [col for col in extra_columns if col not in features and col != target]
+    df = read_processed(columns=features + [target, ROW_ID] + extra, filters=filters, path=path)
+    return df[features], df[target], df[[ROW_ID] + extra]
+
+def changed_listings(df, path=RAW_PATH, scrape_date=None):
+    """df のうち、取得日 scrape_date より前のデータにない物件と、価格の変わった物件だけを返す
+    CSVは同じ物件の行を価格が変わるたびに追記するので、先に detail_url ごとの最後の行にまとめる
+    """
+    df = df[df['detail_url'].isna() | ~df.duplicated('detail_url', keep='last')]
+    if not os.path.exists(path):
+        return df
+    # 同じ取得日の取り込みはパーティションごと置き換えるので、比べるのはそれより前のデータ
+    previous = read_raw(columns=['detail_url'] + PRICE_COLUMNS, path=path,
+                        filters=[('scrape_date', '<', str(scrape_date or date.today()))])
+    previous = previous.dropna(subset=['detail_url']).set_index('detail_url')
+    known = df['detail_url'].isin(previous.index)
+    changed = ~known
+    if known.any():
+        old = previous.loc[df.loc[known, 'detail_url'], PRICE_COLUMNS].to_numpy(dtype=float)
+        new = df.loc[known].reindex(columns=PRICE_COLUMNS).apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+        same = ((old == new) | (pd.isna(old) & pd.isna(new))).all(axis=1)
+        changed[known] = ~same
+    return df[changed]
+
+def import_csv(csv_path, path=RAW_PATH, scrape_date=None):
+    """スクレイピング結果のCSV（utf-8-sig）を生データのParquetに取り込み、(追加した行数, CSVの行数) を返す
+    取り込むのは前回までにない物件と価格の変わった物件だけ（取得日ごとに全件を書くとデータが取得日の数だけ増える）
+    """
+    df = pd.read_csv(csv_path, encoding='utf-8-sig')
+    changed = changed_listings(df, path=path, scrape_date=scrape_date)
+    if len(changed):
+        write_raw(changed, path=path, scrape_date=scrape_date)
+    return len(changed), len(df)
+
+def main():
+    parser = argparse.ArgumentParser(description="スクレイピング結果のCSVをParquetのデータセットに取り込む")
+    parser.add_argument('csv_path', nargs='?', default='data/suumo_data_final.csv')
+    parser.add_argument('--scrape-date', default=None, help="取得日 (YYYY-MM-DD)。省略時は今日")
+    parser.add_argument('--output', default=RAW_PATH)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    instrument('import', args.metrics_report, args.profile)
+
+    n_rows, n_csv_rows = import_csv(args.csv_path, path=args.output, scrape_date=args.scrape_date)
+    print(f'Imported {n_rows} new or re-priced rows ({n_csv_rows} rows in {args.csv_path}) into {args.output}')
+
+if __name__ == '__main__':
+    main()
@@ -1,43 +1,42 @@
 
 
 import pandas as pd
-import numpy as np
-import lightgbm as lgb
 import warnings
 
+from dataset import read_processed, read_raw, ROW_ID
+from model_registry import load_model, dataset_fingerprint
+from metrics import instrument
+
 warnings.filterwarnings('ignore', category=UserWarning)
 
 def find_bargains():
-    # データを読み込む
+    # 表示する列を定義
+    display_columns = [
+        'address', 'building_name', 'age', 'floors', 'layout', 'area',
+        'actual_rent', 'predicted_rent', 'discount_rate'
+    ]
+
+    # 登録済みモデルの out-of-fold 予測を読み込む（生データは表示に使う列だけを読む）
+    # 学習に使った物件自身を含まないモデルの予測なので、学習データへの当てはまりの良し悪しに左右されない
     try:
-        df_clean = pd.read_csv('data/suumo_data_cleaned.csv')
-        df_raw = pd.read_csv('data/suumo_data.csv')
+        model = load_model()
+        df_oof = model.out_of_fold()
+        df_keys = read_processed(columns=[ROW_ID, 'rent'])
+        df_raw = read_raw(columns=[ROW_ID] + display_columns[:6])
     except FileNotFoundError as e:
         print(f"Error: {e}. Please make sure the data files exist.")
         return
-
-    # 特徴量 (X) とターゲット (y) を定義
-    if 'rent' not in df_clean.columns or 'rent_log' not in df_clean.columns:
-        print("Error: 'rent' or 'rent_log' column not found in cleaned data.")
+    except KeyError as e:
+        print(f"Error: {e} column not found in cleaned data.")
         return
-        
-    X = df_clean.drop(['rent', 'rent_log'], axis=1)
-    y = df_clean['rent_log']
 
-    print("Training model on the entire dataset...")
-    # LightGBMモデルをデータ全体で学習
-    lgb_reg = lgb.LGBMRegressor(random_state=42)
-    lgb_reg.fit(X, y)
-
-    print("Predicting rent for all properties...")
-    # 全データの家賃を予測
-    all_pred_log = lgb_reg.predict(X)
-    all_pred = np.expm1(all_pred_log)
+    print(f"Using model {model.version} (CV RMSE {model.meta['cv_rmse']:.4f})")
+    if model.meta['dataset_fingerprint'] != dataset_fingerprint():
+        print("Warning: processed data has changed since this model was trained. Run train_model.py to refresh it.")
 
     # 元のデータに予測結果を結合
-    df_result = df_raw.copy()
-    df_result['actual_rent'] = df_clean['rent']
-    df_result['predicted_rent'] = all_pred
+    df_result = df_oof.merge(df_keys, on=ROW_ID, how='inner').merge(df_raw, on=ROW_ID, how='left')
+    df_result['actual_rent'] = df_result['rent']
     df_result['difference'] = df_result['actual_rent'] - df_result['predicted_rent']
     df_result['discount_rate'] = df_result['difference'] / df_result['actual_rent']
 
@@ -45,14 +44,8 @@ def find_bargains():
     df_bargain = df_result.sort_values("discount_rate", ascending=True)
 
     # 結果の表示
-    print("\n--- 割安物件ランキング TOP 20 (新モデル) ---")
-    
-    # 表示する列を定義
-    display_columns = [
-        'address', 'building_name', 'age', 'floors', 'layout', 'area',
-        'actual_rent', 'predicted_rent', 'discount_rate'
-    ]
-    
+    print("\n--- 割安物件ランキング TOP 20 (out-of-fold) ---")
+
     # カラムの存在を確認
     display_columns = [col for col in display_columns if col in df_bargain.columns]
 
@@ -63,5 +56,6 @@ def find_bargains():
     print(df_bargain[display_columns].head(20).to_string(index=False))
 
 if __name__ == '__main__':
+    # 計測値は環境変数 METRICS_REPORT / METRICS_PROFILE で指定した先に書き出す
+    instrument('bargains')
     find_bargains()
-
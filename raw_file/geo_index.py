@@ -0,0 +1,203 @@
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from sklearn.model_selection import KFold
+
+from geocoder import Gazetteer, GAZETTEER_DIR, LEVEL_TOWN
+
+# 学習データの物件の座標と家賃（近傍の集計用）の保存先
+GEO_INDEX_PATH = 'data/geo_index.npz'
+
+# 距離を測る主要駅（緯度, 経度）
+HUBS = {
+    'tokyo': (35.6812, 139.7671),
+    'shinjuku': (35.6896, 139.7006),
+    'shibuya': (35.6580, 139.7016),
+    'shinagawa': (35.6285, 139.7388),
+    'yokohama': (35.4658, 139.6223),
+}
+
+# 近傍の家賃を集計する物件数
+NEIGHBORS = 20
+
+EARTH_RADIUS_KM = 6371.0
+# KD-tree 用の平面座標（km）。対象は首都圏だけなので、北緯35.6度での経度1度の長さで近似する
+KM_PER_DEG_LAT = 110.9
+KM_PER_DEG_LON = 110.9 * np.cos(np.radians(35.6))
+
+NEIGHBOR_COLUMNS = ['neighbor_median_rent', 'neighbor_rent_per_sqm', 'neighbor_distance_km']
+
+# 近傍の集計に使う座標の精度の下限。市区町村の代表点では同じエリアの物件がすべて1点に重なり、
+# 近傍はエリア全体と変わらない（町丁目の索引がなければ、近傍の特徴量は作らない）
+MIN_NEIGHBOR_LEVEL = LEVEL_TOWN
+
+def haversine_km(lat, lon, lat2, lon2):
+    lat, lon, lat2, lon2 = (np.radians(v) for v in (lat, lon, lat2, lon2))
+    a = np.sin((lat2 - lat) / 2) ** 2 + np.cos(lat) * np.cos(lat2) * np.sin((lon2 - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def _project(lat, lon):
+    return np.column_stack([np.asarray(lat) * KM_PER_DEG_LAT, np.asarray(lon) * KM_PER_DEG_LON])
+
+def _neighbor_points(lat, lon, level):
+    """近傍の集計用の平面座標。精度が MIN_NEIGHBOR_LEVEL に満たない点はNaN"""
+    precise = level >= MIN_NEIGHBOR_LEVEL
+    return _project(np.where(precise, lat, np.nan), np.where(precise, lon, np.nan))
+
+def _rent_arrays(df):
+    """(家賃, 1㎡あたりの家賃)。取れない物件はNaN"""
+    rent = pd.to_numeric(df['rent'], errors='coerce').to_numpy(dtype=float)
+    area = pd.to_numeric(df['area'], errors='coerce').to_numpy(dtype=float) if 'area' in df.columns \
+        else np.full(len(df), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return rent, np.where(area > 0, rent / area, np.nan)
+
+def _group_median(groups, values, n_groups):
+    """groups (0 .. n_groups-1) ごとの values の中央値。NaNは除き、値が1つもないグループはNaN"""
+    keep = ~np.isnan(values)
+    groups, values = groups[keep], values[keep]
+    values = values[np.lexsort((values, groups))]
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    result = np.full(n_groups, np.nan)
+    has = counts > 0
+    low = starts[has] + (counts[has] - 1) // 2
+    high = starts[has] + counts[has] // 2
+    result[has] = (values[low] + values[high]) / 2
+    return result
+
+class _Neighbors:
+    """学習データの物件を座標ごとにまとめた KD-tree
+
+    同じ町丁目の物件は同じ代表点になり座標が重なるので、木は重ならない座標だけで作る。近い座標から順に
+    物件が k 件以上になるまで集め、最後の座標にある物件はすべて含める（同じ座標の物件から選ばない）。
+    """
+
+    def __init__(self, points, rent, rent_per_sqm):
+        locations, inverse, counts = np.unique(points, axis=0, return_inverse=True, return_counts=True)
+        order = np.argsort(inverse.ravel(), kind='stable')
+        self.rent = rent[order]
+        self.rent_per_sqm = rent_per_sqm[order]
+        self.starts = np.concatenate([[0], np.cumsum(counts)])
+        self.tree = cKDTree(locations)
+
+    def stats(self, points, k):
+        """points の各点の近傍 k 件の (家賃の中央値, ㎡単価の中央値, k件目までの距離)。座標のない点はNaN"""
+        result = np.full((len(points), len(NEIGHBOR_COLUMNS)), np.nan)
+        valid = ~np.isnan(points).any(axis=1)
+        if not valid.any():
+            return result
+        # 問い合わせも重ならない座標ごとに1回だけ行う。k か所あれば物件は必ず k 件以上ある
+        queries, inverse = np.unique(points[valid], axis=0, return_inverse=True)
+        n_locations = min(k, self.tree.n)
+        distance, index = self.tree.query(queries, k=n_locations)
+        distance, index = distance.reshape(-1, n_locations), index.reshape(-1, n_locations)
+        sizes = self.starts[index + 1] - self.starts[index]
+        # 物件数の累計が k 件に届く座標まで使う
+        n_used = np.minimum((np.cumsum(sizes, axis=1) < k).sum(axis=1) + 1, n_locations)
+        # (問い合わせ, 物件) の組を作り、問い合わせごとの中央値をまとめて求める
+        used = np.arange(n_locations) < n_used[:, None]
+        query_ids = np.repeat(np.arange(len(queries)), used.sum(axis=1))
+        locations, sizes = index[used], sizes[used]
+        pairs = np.repeat(query_ids, sizes)
+        members = np.repeat(self.starts[locations] - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+        stats = np.column_stack([_group_median(pairs, self.rent[members], len(queries)),
+                                 _group_median(pairs, self.rent_per_sqm[members], len(queries)),
+                                 distance[np.arange(len(queries)), n_used - 1]])
+        result[valid] = stats[inverse.ravel()]
+        return result
+
+class GeoIndex:
+    """住所から作る位置の特徴量と、学習データの物件の座標による近傍の家賃の集計
+
+    座標は Gazetteer（町丁目の代表点）で引くので、ネットワークには接続しない。近傍の検索には
+    学習データの物件の座標で作った KD-tree (_Neighbors) を使う。学習データの物件の座標と家賃は npz に保存する。
+    近傍の集計は町名以上の精度の座標だけで行う。そのような物件が学習データになければ近傍の列は作らない。
+    """
+
+    def __init__(self, gazetteer_path=GAZETTEER_DIR, k=NEIGHBORS):
+        self.gazetteer_path = gazetteer_path
+        self.k = k
+        self.lat = np.empty(0)
+        self.lon = np.empty(0)
+        self.rent = np.empty(0)
+        self.rent_per_sqm = np.empty(0)
+        self.neighbors = None
+        self._gazetteer = None
+
+    @property
+    def gazetteer(self):
+        if self._gazetteer is None:
+            self._gazetteer = Gazetteer(self.gazetteer_path)
+        return self._gazetteer
+
+    def geocode(self, df):
+        if 'address' not in df.columns:
+            return np.full(len(df), np.nan), np.full(len(df), np.nan), np.zeros(len(df), dtype=np.int8)
+        return self.gazetteer.geocode(df['address'])
+
+    def _build_tree(self):
+        self.neighbors = _Neighbors(_project(self.lat, self.lon), self.rent, self.rent_per_sqm) \
+            if len(self.lat) else None
+
+    def fit(self, df):
+        lat, lon, level = self.geocode(df)
+        rent, rent_per_sqm = _rent_arrays(df) if 'rent' in df.columns else (np.full(len(df), np.nan),) * 2
+        keep = ~np.isnan(lat) & ~np.isnan(rent) & (level >= MIN_NEIGHBOR_LEVEL)
+        self.lat, self.lon, self.rent, self.rent_per_sqm = lat[keep], lon[keep], rent[keep], rent_per_sqm[keep]
+        self._build_tree()
+        if len(df) and self.neighbors is None:
+            print(f'No addresses resolved to town level with the gazetteer at {self.gazetteer_path}; '
+                  f'neighbor rent features are disabled (build one with geocoder.py build)')
+        return self
+
+    @property
+    def neighbor_columns(self):
+        """transform が返す近傍の列（町名以上の精度の物件がなければ空）"""
+        return NEIGHBOR_COLUMNS if self.neighbors is not None else []
+
+    def transform(self, df):
+        """位置の特徴量を返す
+        lat / lon / geo_level: 座標とその精度（3: 町丁目, 2: 町名, 1: 市区町村, 0: 不明）
+        dist_{hub}_km / nearest_hub_km: 主要駅までの直線距離
+        neighbor_*: 学習データの近傍 k 件の家賃の中央値・㎡単価の中央値・k件目までの距離
+        （町名以上の精度の座標がある場合だけ。近傍の索引がなければ列を作らない）
+        """
+        lat, lon, level = self.geocode(df)
+        columns = {'lat': lat, 'lon': lon, 'geo_level': level.astype(float)}
+        for name, (hub_lat, hub_lon) in HUBS.items():
+            columns[f'dist_{name}_km'] = haversine_km(lat, lon, hub_lat, hub_lon)
+        columns['nearest_hub_km'] = np.fmin.reduce([columns[f'dist_{name}_km'] for name in HUBS])
+        if self.neighbors is not None:
+            columns.update(zip(NEIGHBOR_COLUMNS, self.neighbors.stats(_neighbor_points(lat, lon, level), self.k).T))
+        return pd.DataFrame(columns, index=df.index)
+
+    def out_of_fold_neighbors(self, df, n_splits=5, random_state=42):
+        """学習データ用の近傍の家賃の集計。各行の値はその行を含まない他のfoldの物件から求める"""
+        lat, lon, level = self.geocode(df)
+        rent, rent_per_sqm = _rent_arrays(df)
+        points = _neighbor_points(lat, lon, level)
+        stats = np.full((len(df), len(NEIGHBOR_COLUMNS)), np.nan)
+        if len(df) >= n_splits:
+            kf = KFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+            for train_index, val_index in kf.split(points):
+                train_index = train_index[~np.isnan(points[train_index, 0]) & ~np.isnan(rent[train_index])]
+                if len(train_index):
+                    neighbors = _Neighbors(points[train_index], rent[train_index], rent_per_sqm[train_index])
+                    stats[val_index] = neighbors.stats(points[val_index], self.k)
+        return pd.DataFrame(stats, columns=NEIGHBOR_COLUMNS, index=df.index)
+
+    def save(self, path=GEO_INDEX_PATH):
+        with open(path, 'wb') as f:
+            np.savez(f, lat=self.lat, lon=self.lon, rent=self.rent, rent_per_sqm=self.rent_per_sqm,
+                     k=self.k, gazetteer_path=self.gazetteer_path)
+
+    @classmethod
+    def load(cls, path=GEO_INDEX_PATH):
+        with np.load(path) as state:
+            index = cls(gazetteer_path=str(state['gazetteer_path']), k=int(state['k']))
+            index.lat, index.lon = state['lat'], state['lon']
+            index.rent, index.rent_per_sqm = state['rent'], state['rent_per_sqm']
+        index._build_tree()
+        return index
@@ -0,0 +1,181 @@
+
+import argparse
+import os
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# 町丁目の代表点の索引（build で作る）の保存先。keys.npy（並べ替えたキー）と coords.npy（緯度・経度）を
+# メモリマップで読むので、全国分でも読み込みはほぼ一瞬で、使った部分しかメモリに載らない
+GAZETTEER_DIR = 'data/geo'
+
+# 都道府県と市区町村。政令指定都市は区まで（横浜市中区）、それ以外は最初の市・区・町・村まで
+PREFECTURE_PATTERN = r'(?:東京都|北海道|(?:京都|大阪)府|.{2,3}?県)'
+CITY_PATTERN = re.compile(rf'^{PREFECTURE_PATTERN}?(.+?市.+?区|.+?[市区]|.+?[町村])')
+
+# 市区町村より後ろ。町名と丁目（「神宮前3」「神宮前三丁目」「神宮前3-1-2」のどれでも）に分ける
+TOWN_PATTERN = re.compile(r'(?P<town>.*?)(?:(?P<chome>[0-9]+|[一二三四五六七八九十]+)(?:丁目|番|-|$)|$)')
+HYPHEN_PATTERN = re.compile(r'(?<=[0-9])[ー−‐―](?=[0-9])')
+KANJI_DIGITS = {c: i for i, c in enumerate('〇一二三四五六七八九')}
+
+# 町丁目の索引がない場合や、索引にない市区町村に使う市区役所付近の座標（緯度, 経度）。
+# スクレイピング対象のエリア (suumo_scraper.AREAS) の分だけ持つ
+CITY_CENTROIDS = {
+    '渋谷区': (35.6618, 139.6979),
+    '新宿区': (35.6938, 139.7035),
+    '港区': (35.6580, 139.7515),
+    '世田谷区': (35.6464, 139.6532),
+    '目黒区': (35.6415, 139.6982),
+    '品川区': (35.6092, 139.7300),
+    '横浜市': (35.4506, 139.6353),
+}
+
+# 座標の精度。索引にある町丁目 > 町名だけ一致 > 市区町村 > 不明
+LEVEL_CHOME, LEVEL_TOWN, LEVEL_CITY, LEVEL_NONE = 3, 2, 1, 0
+
+def _kanji_number(text):
+    """「三」「十二」「二十三」などの漢数字（99まで）を整数にする"""
+    if '十' not in text:
+        return int(''.join(str(KANJI_DIGITS[c]) for c in text))
+    tens, _, ones = text.partition('十')
+    return (KANJI_DIGITS[tens] if tens else 1) * 10 + (KANJI_DIGITS[ones] if ones else 0)
+
+def normalize_address(address):
+    """住所を (市区町村, 町名, 丁目) に分ける。全角英数字・漢数字の丁目・番地以降の表記の違いを吸収する
+    取れない項目は空文字列、市区町村が取れなければ None を返す
+    """
+    if not isinstance(address, str):
+        return None
+    text = unicodedata.normalize('NFKC', address).replace(' ', '')
+    text = HYPHEN_PATTERN.sub('-', text)
+    match = CITY_PATTERN.match(text)
+    if not match:
+        return None
+    city = match.group(1)
+    town = TOWN_PATTERN.match(text[match.end():])
+    chome = town.group('chome') or ''
+    if chome and not chome.isdigit():
+        chome = str(_kanji_number(chome))
+    return city, town.group('town'), chome
+
+def address_keys(address):
+    """(町丁目, 町名, 市区町村) のキー。索引はこの順に細かいものから引く"""
+    parts = normalize_address(address)
+    if parts is None:
+        return None
+    city, town, chome = parts
+    return f'{city}/{town}/{chome}', f'{city}/{town}/', f'{city}//'
+
+class Gazetteer:
+    """住所→代表点（緯度・経度）の索引。ネットワークには接続しない
+
+    国土交通省の位置参照情報（大字・町丁目レベル）から build で作った配列をメモリマップで読む。
+    索引がなくても、CITY_CENTROIDS の市区町村の座標までは返せる。
+    """
+
+    def __init__(self, path=GAZETTEER_DIR):
+        self.path = path
+        keys_path = os.path.join(path, 'keys.npy')
+        if os.path.exists(keys_path):
+            self.keys = np.load(keys_path, mmap_mode='r')
+            self.coords = np.load(os.path.join(path, 'coords.npy'), mmap_mode='r')
+            self.levels = np.load(os.path.join(path, 'levels.npy'), mmap_mode='r')
+        else:
+            self.keys = np.array([], dtype='U1')
+            self.coords = np.empty((0, 2))
+            self.levels = np.empty(0, dtype=np.int8)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _find(self, keys):
+        """キーの配列に対する索引の行番号。見つからなければ -1"""
+        if not len(self.keys):
+            return np.full(len(keys), -1)
+        keys = np.asarray(keys, dtype=self.keys.dtype)
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[pos] == keys, pos, -1)
+
+    def geocode(self, addresses):
+        """住所の配列を (緯度, 経度, 精度) の配列にする。同じ住所は1回だけ引く"""
+        codes, uniques = pd.factorize(pd.Series(addresses, dtype=object))
+        n = len(uniques)
+        lat, lon = np.full(n + 1, np.nan), np.full(n + 1, np.nan)
+        level = np.full(n + 1, LEVEL_NONE, dtype=np.int8)
+        candidates = [address_keys(address) for address in uniques]
+        found = [i for i, keys in enumerate(candidates) if keys is not None]
+        for j in range(3):
+            pending = [i for i in found if level[i] == LEVEL_NONE]
+            if not pending:
+                break
+            rows = self._find([candidates[i][j] for i in pending])
+            hit = rows >= 0
+            pending = np.asarray(pending)[hit]
+            lat[pending], lon[pending] = self.coords[rows[hit], 0], self.coords[rows[hit], 1]
+            level[pending] = self.levels[rows[hit]]
+        # 索引にない市区町村は、持っている市区役所付近の座標で補う
+        for i in found:
+            if level[i] == LEVEL_NONE:
+                city = normalize_address(uniques[i])[0]
+                # 政令指定都市の区は市で引く（横浜市中区 → 横浜市）
+                centroid = CITY_CENTROIDS.get(city) or CITY_CENTROIDS.get(city[:city.find('市') + 1])
+                if centroid:
+                    lat[i], lon[i] = centroid
+                    level[i] = LEVEL_CITY
+        return lat[codes], lon[codes], level[codes]
+
+def build_gazetteer(csv_paths, path=GAZETTEER_DIR, encoding='cp932'):
+    """位置参照情報の大字・町丁目レベルのCSV（都道府県名・市区町村名・大字町丁目名・緯度・経度の列）から
+    索引を作る。町名・市区町村のキーには、それに含まれる町丁目の座標の平均を入れる
+    """
+    columns = ['都道府県名', '市区町村名', '大字町丁目名', '緯度', '経度']
+    df = pd.concat([pd.read_csv(p, encoding=encoding, usecols=columns) for p in csv_paths], ignore_index=True)
+    addresses = df['都道府県名'] + df['市区町村名'] + df['大字町丁目名']
+    parts = [normalize_address(address) for address in addresses]
+    valid = np.array([p is not None for p in parts])
+    parts = pd.DataFrame([p for p in parts if p is not None], columns=['city', 'town', 'chome'])
+    parts['lat'] = df.loc[valid, '緯度'].to_numpy(dtype=float)
+    parts['lon'] = df.loc[valid, '経度'].to_numpy(dtype=float)
+
+    levels = []
+    for level, fields in ((LEVEL_CHOME, ['city', 'town', 'chome']), (LEVEL_TOWN, ['city', 'town']), (LEVEL_CITY, ['city'])):
+        grouped = parts.groupby(fields, sort=False)[['lat', 'lon']].mean().reset_index()
+        town = grouped['town'] if 'town' in fields else ''
+        chome = grouped['chome'] if 'chome' in fields else ''
+        grouped['key'] = grouped['city'] + '/' + town + '/' + chome
+        grouped['level'] = level
+        levels.append(grouped[['key', 'lat', 'lon', 'level']])
+    # 同じキーになる場合（丁目のない町）は細かい方を残す
+    table = pd.concat(levels).drop_duplicates('key').sort_values('key')
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'keys.npy'), table['key'].to_numpy(dtype=str))
+    np.save(os.path.join(path, 'coords.npy'), table[['lat', 'lon']].to_numpy(dtype=float))
+    np.save(os.path.join(path, 'levels.npy'), table['level'].to_numpy(dtype=np.int8))
+    return len(table)
+
+def main():
+    parser = argparse.ArgumentParser(description="住所→座標の索引を作る・引く（ネットワークには接続しない）")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser(
+        'build', help="国土交通省 位置参照情報（大字・町丁目レベル）のCSVから町丁目の索引を作る")
+    build_parser.add_argument('csv_paths', nargs='+')
+    build_parser.add_argument('--output', default=GAZETTEER_DIR)
+    build_parser.add_argument('--encoding', default='cp932')
+    lookup_parser = subparsers.add_parser('lookup', help="住所の座標を表示する")
+    lookup_parser.add_argument('addresses', nargs='+')
+    lookup_parser.add_argument('--gazetteer', default=GAZETTEER_DIR)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        n_keys = build_gazetteer(args.csv_paths, args.output, args.encoding)
+        print(f'Saved {n_keys} keys to {args.output}')
+        return
+    lat, lon, level = Gazetteer(args.gazetteer).geocode(args.addresses)
+    for address, *values in zip(args.addresses, lat, lon, level):
+        print(address, normalize_address(address), *values)
+
+if __name__ == '__main__':
+    main()
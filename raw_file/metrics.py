@@ -0,0 +1,159 @@
+
+import atexit
+import bisect
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# 所要時間のヒストグラムの上限値（秒）。最後のバケットはそれより長いもの
+LATENCY_BUCKETS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 30, 60]
+
+# パイプラインから各ステージに、レポートとプロファイルの出力先を渡す環境変数
+REPORT_PATH_ENV = 'METRICS_REPORT'
+PROFILE_PATH_ENV = 'METRICS_PROFILE'
+
+class Histogram:
+    """固定のバケットで数える所要時間のヒストグラム（値を全部は持たない）"""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """q分位点が入るバケットの上限（最後のバケットなら最大値）"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count, 'total': self.total, 'mean': self.total / self.count,
+            'min': self.min, 'max': self.max,
+            'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99),
+            'buckets': {f'le_{bound}': count for bound, count in zip(self.bounds, self.counts) if count}
+                       | ({'gt_max': self.counts[-1]} if self.counts[-1] else {}),
+        }
+
+class Metrics:
+    """プロセス全体の計測値。スレッドから同時に更新してよい
+
+    counters: 件数・バイト数などの合計、timers: 所要時間のヒストグラム、values: 任意の値（rows/sec など）、
+    errors: 失敗の件数と、原因を調べるための例（名前ごとに最大 error_samples 件）
+    """
+
+    def __init__(self, error_samples=20):
+        self.lock = threading.Lock()
+        self.error_samples = error_samples
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.start = time.perf_counter()
+        self.counters = Counter()
+        self.timers = {}
+        self.values = {}
+        self.errors = {}
+
+    def incr(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.timers.get(name)
+            if histogram is None:
+                histogram = self.timers[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def set(self, name, value):
+        with self.lock:
+            self.values[name] = value
+
+    def error(self, name, detail):
+        with self.lock:
+            self.counters[name] += 1
+            samples = self.errors.setdefault(name, [])
+            if len(samples) < self.error_samples:
+                samples.append(detail)
+
+    def report(self, stage=None):
+        with self.lock:
+            return {
+                'stage': stage,
+                'argv': sys.argv,
+                'pid': os.getpid(),
+                'started_at': self.started_at,
+                'elapsed': time.perf_counter() - self.start,
+                'counters': dict(self.counters),
+                'timers': {name: histogram.to_dict() for name, histogram in sorted(self.timers.items())},
+                'values': dict(self.values),
+                'errors': {name: list(samples) for name, samples in self.errors.items()},
+            }
+
+    def write_report(self, path, stage=None):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(stage), f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+# プロセスで1つの計測値。各モジュールはこれを更新する
+METRICS = Metrics()
+
+def add_arguments(parser):
+    parser.add_argument('--metrics-report', default=None, help="計測値（所要時間・件数など）をJSONで書き出す先")
+    parser.add_argument('--profile', default=None, help="cProfileの結果（pstats形式）の保存先")
+
+def instrument(stage, report_path=None, profile_path=None):
+    """このプロセスをステージ stage として計測する。main() の最初に1回呼ぶ
+    プロセスの終了時（例外で終わった場合も）に、全体の所要時間を加えたレポートと cProfile の結果を書き出す。
+    出力先を省略すると、環境変数 METRICS_REPORT / METRICS_PROFILE があればそこに書き出す
+    （pipeline.py がステージごとに設定する）。py-spy などの外部のプロファイラはそのままプロセスに付けられる
+    """
+    report_path = report_path or os.environ.get(REPORT_PATH_ENV)
+    profile_path = profile_path or os.environ.get(PROFILE_PATH_ENV)
+    start = time.perf_counter()
+    profiler = None
+    if profile_path:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    def finish():
+        METRICS.observe(f'{stage}.total', time.perf_counter() - start)
+        if profiler:
+            profiler.disable()
+            os.makedirs(os.path.dirname(profile_path) or '.', exist_ok=True)
+            profiler.dump_stats(profile_path)
+        if report_path:
+            METRICS.write_report(report_path, stage)
+
+    atexit.register(finish)
+    return METRICS
@@ -0,0 +1,102 @@
+
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from dataset import PROCESSED_PATH, read_processed, processed_schema_of
+from data_preprocessing import FeaturePipeline
+from metrics import METRICS
+
+# 学習済みモデルの保存先。バージョンごとのディレクトリと、最新バージョン名を書いた LATEST を置く
+REGISTRY_PATH = 'data/models'
+
+def dataset_fingerprint(path=PROCESSED_PATH):
+    """前処理済みデータの内容（スキーマと row_id 順の全行の値）のハッシュ。モデルがどのデータで学習したかの確認に使う
+    ファイル名や行の書き出し順には依存しないので、同じデータを前処理し直しても変わらない
+    """
+    df = read_processed(path=path)
+    digest = hashlib.sha256(str(processed_schema_of(path)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+class Model:
+    """登録済みのモデル（booster + 前処理）。1回読み込めば、生データの物件をまとめて、または1件ずつ予測できる"""
+
+    def __init__(self, booster, pipeline, meta, version_dir):
+        self.booster = booster
+        self.pipeline = pipeline
+        self.meta = meta
+        self.version_dir = version_dir
+
+    @property
+    def version(self):
+        return self.meta['version']
+
+    def predict(self, df):
+        """生データ（DataFrame、または1件分のdict）の予測家賃（万円）"""
+        with METRICS.timer('preprocess.transform'):
+            features = self.pipeline.transform(df)
+        with METRICS.timer('model.predict'):
+            return np.expm1(self.booster.predict(features[self.booster.feature_name()]))
+
+    def score(self, df):
+        """予測家賃と、家賃があれば割安率 (実際の家賃 - 予測家賃) / 実際の家賃 を付けて返す"""
+        if isinstance(df, dict):
+            df = pd.DataFrame([df])
+        scored = df.copy()
+        scored['predicted_rent'] = self.predict(df)
+        if 'rent' in df.columns:
+            rent = pd.to_numeric(df['rent'], errors='coerce')
+            scored['discount_rate'] = (rent - scored['predicted_rent']) / rent
+        return scored
+
+    def out_of_fold(self):
+        """学習時の out-of-fold 予測 (row_id, predicted_rent)"""
+        return pd.read_parquet(os.path.join(self.version_dir, 'oof.parquet'))
+
+def _versions(registry):
+    if not os.path.isdir(registry):
+        return []
+    return sorted(name for name in os.listdir(registry) if name.startswith('v') and name[1:].isdigit())
+
+def register(booster, pipeline, oof, meta, registry=REGISTRY_PATH):
+    """新しいバージョンとして保存し、最新バージョンにする
+    oof は学習データの out-of-fold 予測 (row_id, predicted_rent)、meta はパラメータや評価値など
+    """
+    versions = _versions(registry)
+    version = f'v{int(versions[-1][1:]) + 1 if versions else 1:04d}'
+    version_dir = os.path.join(registry, version)
+    os.makedirs(version_dir)
+    booster.save_model(os.path.join(version_dir, 'model.txt'))
+    pipeline.save(os.path.join(version_dir, 'feature_pipeline.json'), os.path.join(version_dir, 'station_index.json'),
+                  os.path.join(version_dir, 'geo_index.npz'))
+    oof.to_parquet(os.path.join(version_dir, 'oof.parquet'), index=False)
+    meta = dict(meta, version=version, created_at=datetime.now().isoformat(timespec='seconds'))
+    with open(os.path.join(version_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    # 最新バージョンの切り替えは書き込みが全部終わってから行う
+    tmp_path = os.path.join(registry, 'LATEST.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(registry, 'LATEST'))
+    return version
+
+def load_model(version=None, registry=REGISTRY_PATH):
+    """登録済みのモデルを読み込む。version を省略すると最新バージョン"""
+    if version is None:
+        try:
+            with open(os.path.join(registry, 'LATEST')) as f:
+                version = f.read().strip()
+        except OSError:
+            raise FileNotFoundError(f'No model registered in {registry}. Run train_model.py first.')
+    version_dir = os.path.join(registry, version)
+    with open(os.path.join(version_dir, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    booster = lgb.Booster(model_file=os.path.join(version_dir, 'model.txt'))
+    pipeline = FeaturePipeline.load(os.path.join(version_dir, 'feature_pipeline.json'))
+    return Model(booster, pipeline, meta, version_dir)
@@ -1,4 +1,5 @@
 
+import argparse
 import pandas as pd
 import numpy as np
 import lightgbm as lgb
@@ -7,20 +8,19 @@ from sklearn.metrics import mean_squared_error
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from dataset import load_features
+from metrics import add_arguments as add_metrics_arguments, instrument
+
 def main():
-    # 前処理済みのデータを読み込む
-    df = pd.read_csv('data/suumo_data_cleaned.csv')
+    parser = argparse.ArgumentParser(description="ホールドアウトでの評価と特徴量の重要度の可視化")
+    parser.add_argument('--output', default='feature_importance.png', help="特徴量の重要度のグラフの保存先")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    instrument('importance', args.metrics_report, args.profile)
 
-    # 特徴量 (X) とターゲット (y) を定義
+    # 前処理済みのデータから特徴量 (X) とターゲット (y) を読み込む
     # rent_log をターゲットとし、元のrentは含めない
-    # 元のrentカラムがdfにない場合があるため、存在チェックを行う
-    if 'rent' in df.columns:
-        X = df.drop(['rent', 'rent_log'], axis=1)
-    else:
-        # rentがない場合はrent_logのみをドロップ
-        X = df.drop(['rent_log'], axis=1)
-
-    y = df['rent_log']
+    X, y, _ = load_features()
 
     # 訓練データとテストデータに分割
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
@@ -54,8 +54,8 @@ def main():
     sns.barplot(x='importance', y='feature', data=feature_importance.head(20))
     plt.title('特徴量の重要度 (LightGBM, New Features)')
     plt.tight_layout()
-    plt.savefig('feature_importance.png')
-    print('Saved feature importance plot to feature_importance.png')
+    plt.savefig(args.output)
+    print(f'Saved feature importance plot to {args.output}')
 
 if __name__ == '__main__':
     main()
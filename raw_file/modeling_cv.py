@@ -1,64 +1,65 @@
 
 
-import pandas as pd
-import numpy as np
-import lightgbm as lgb
-from sklearn.model_selection import KFold
-from sklearn.metrics import mean_squared_error
+import argparse
 import warnings
 
+from dataset import load_features
+from cv_engine import (CVEngine, TrialStore, BASE_PARAMS, NUM_BOOST_ROUND, TRIALS_PATH, BEST_PARAMS_PATH,
+                       save_best_params, search_key)
+from model_registry import dataset_fingerprint
+from metrics import add_arguments as add_metrics_arguments, instrument
+
 warnings.filterwarnings('ignore', category=UserWarning) # Suppress UserWarning from matplotlib/seaborn
 
 def main():
-    # 前処理済みのデータを読み込む
-    df = pd.read_csv('data/suumo_data_cleaned.csv')
-
-    # 特徴量 (X) とターゲット (y) を定義
-    if 'rent' in df.columns:
-        X = df.drop(['rent', 'rent_log'], axis=1)
-    else:
-        X = df.drop(['rent_log'], axis=1)
-
-    y = df['rent_log']
-
-    # 交差検証の設定
-    n_splits = 5
-    kf = KFold(n_splits=n_splits, shuffle=True, random_state=42)
-
-    rmse_scores = []
-
-    print(f'Starting {n_splits}-fold cross-validation...')
-
-    for fold, (train_index, val_index) in enumerate(kf.split(X, y)):
-        print(f'--- Fold {fold+1}/{n_splits} ---')
-
-        # 訓練データと検証データに分割
-        X_train, X_val = X.iloc[train_index], X.iloc[val_index]
-        y_train, y_val = y.iloc[train_index], y.iloc[val_index]
-
-        # LightGBMモデルの学習
-        lgb_reg = lgb.LGBMRegressor(random_state=42)
-        lgb_reg.fit(X_train, y_train)
-
-        # 検証データで予測
-        y_pred_log = lgb_reg.predict(X_val)
-
-        # 予測結果を元のスケールに戻す
-        y_pred = np.expm1(y_pred_log)
-        y_val_orig = np.expm1(y_val)
-
-        # RMSEで評価
-        rmse = np.sqrt(mean_squared_error(y_val_orig, y_pred))
-        rmse_scores.append(rmse)
+    parser = argparse.ArgumentParser(description="LightGBMの交差検証とハイパーパラメータ探索")
+    parser.add_argument('--n-splits', type=int, default=5)
+    parser.add_argument('--n-jobs', type=int, default=None, help="使うスレッドの合計（既定: CPUコア数）")
+    parser.add_argument('--threads-per-task', type=int, default=1, help="1つのfoldの学習に使うスレッド数")
+    parser.add_argument('--search', action='store_true', help="successive halvingでハイパーパラメータを探索する")
+    parser.add_argument('--trials', type=int, default=27)
+    parser.add_argument('--min-rounds', type=int, default=50)
+    parser.add_argument('--max-rounds', type=int, default=1000)
+    parser.add_argument('--eta', type=int, default=3)
+    parser.add_argument('--early-stopping', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--trials-path', default=TRIALS_PATH)
+    parser.add_argument('--restart', action='store_true', help="保存済みの試行結果を捨てて探索をやり直す")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    instrument('search' if args.search else 'cv', args.metrics_report, args.profile)
+
+    # 前処理済みのデータから特徴量 (X) とターゲット (y) を読み込む
+    X, y, _ = load_features()
+
+    # 交差検証の設定（ビン分割は全データで1回だけ行う）
+    engine = CVEngine(X, y, n_splits=args.n_splits, random_state=42, n_jobs=args.n_jobs,
+                      threads_per_task=args.threads_per_task)
+
+    if args.search:
+        print(f'Starting successive halving over {args.trials} trials ({engine.n_jobs} threads)...')
+        # 前処理済みデータや探索の設定が変わっていれば、保存済みの試行結果は使わない
+        key = search_key(dataset_fingerprint(), args.n_splits, 42, args.trials, args.min_rounds, args.max_rounds,
+                         args.eta, args.early_stopping, args.seed)
+        store = TrialStore(args.trials_path, restart=args.restart, key=key)
+        best = engine.successive_halving(n_trials=args.trials, min_rounds=args.min_rounds, max_rounds=args.max_rounds,
+                                         eta=args.eta, early_stopping_rounds=args.early_stopping, store=store,
+                                         seed=args.seed)
+        save_best_params(best)
+        print('\n--- Best Trial ---')
+        print(f'Trial {best["trial"]} ({best["rounds"]} rounds): Mean RMSE {best["rmse"]:.4f} (万円)')
+        print(f'Params: {best["params"]}')
+        print(f'Saved best parameters to {BEST_PARAMS_PATH}')
+        return
+
+    print(f'Starting {args.n_splits}-fold cross-validation ({engine.n_jobs} threads)...')
+    result = engine.cross_validate(BASE_PARAMS, NUM_BOOST_ROUND)
+    for fold, rmse in enumerate(result['fold_rmse']):
         print(f'RMSE for fold {fold+1}: {rmse:.4f} (万円)')
 
-    # 平均RMSEを計算
-    mean_rmse = np.mean(rmse_scores)
-    std_rmse = np.std(rmse_scores)
     print('\n--- Cross-Validation Summary ---')
-    print(f'Mean RMSE: {mean_rmse:.4f} (万円)')
-    print(f'Std Dev of RMSE: {std_rmse:.4f} (万円)')
+    print(f'Mean RMSE: {result["rmse"]:.4f} (万円)')
+    print(f'Std Dev of RMSE: {result["rmse_std"]:.4f} (万円)')
 
 if __name__ == '__main__':
     main()
-
@@ -0,0 +1,317 @@
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+from metrics import REPORT_PATH_ENV, PROFILE_PATH_ENV
+
+# リポジトリのルート。スクリプトはここからの相対パスで指定し、データ (data/) はカレントディレクトリに置く
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 各ステージの実行結果（入力・コードのハッシュと出力のハッシュ）とログの保存先
+STATE_PATH = 'data/pipeline/state.json'
+LOG_DIR = 'data/pipeline/logs'
+
+# 各ステージの計測値 (metrics.py) と、実行ごとにそれらをまとめたレポート、プロファイルの保存先
+REPORT_DIR = 'data/pipeline/reports'
+RUN_REPORT_PATH = 'data/pipeline/run_report.json'
+PROFILE_DIR = 'data/pipeline/profiles'
+
+SCRAPED_CSV = 'data/suumo_data_final.csv'
+RAW_DIR = 'data/raw'
+PROCESSED_DIR = 'data/processed'
+FEATURE_PIPELINE = 'data/feature_pipeline.json'
+STATION_INDEX = 'data/station_index.json'
+GEO_INDEX = 'data/geo_index.npz'
+GAZETTEER = 'data/geo'
+BEST_PARAMS = 'data/best_params.json'
+MODEL_LATEST = 'data/models/LATEST'
+
+# ディレクトリごとの import の検索先。scraping/ のスクリプトは raw_file/ も import する (raw_file_path.py)
+IMPORT_PATHS = {'raw_file': ['raw_file'], 'scraping': ['scraping', 'raw_file']}
+
+def code_dependencies(script, root=REPO_ROOT):
+    """script と、script から（関数の中も含めて）たどれる import 先のリポジトリ内のファイルを返す"""
+    found = []
+    todo = [script]
+    while todo:
+        path = todo.pop()
+        if path in found:
+            continue
+        found.append(path)
+        with open(os.path.join(root, path), encoding='utf-8') as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                for directory in IMPORT_PATHS.get(os.path.dirname(path), [os.path.dirname(path)]):
+                    candidate = os.path.join(directory, name.split('.')[0] + '.py')
+                    if os.path.isfile(os.path.join(root, candidate)):
+                        todo.append(candidate)
+                        break
+    return sorted(found)
+
+class Stage:
+    """パイプラインの1ステージ（スクリプト1つの実行）
+
+    inputs / outputs はファイルかディレクトリのパス。ステージの結果に影響するソースファイルは script から
+    import をたどって決め、code にはそれ以外に影響するファイルを足せる。
+    入力・コード・引数のハッシュが前回と同じで、出力も前回のまま残っていれば実行を省略する。
+    after のステージは、一緒に実行する場合だけ先に終わらせる（指定しなければ前回の出力をそのまま使う）。
+    external なステージ（スクレイピング）は、出力がないか --force で指定した場合だけ実行する。
+    threaded なステージには、同時に動くステージと合わせてコア数を超えないよう --n-jobs を渡す。
+    log_output なステージは標準出力のログ自体を出力とする。
+    """
+
+    def __init__(self, name, script, args=(), deps=(), after=(), inputs=(), outputs=(), code=(), threaded=False,
+                 log_output=False, external=False):
+        self.name = name
+        self.script = script
+        self.args = list(args)
+        self.deps = list(deps)
+        self.after = list(after)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs) + ([self.log_path] if log_output else [])
+        self.code = list(dict.fromkeys(code_dependencies(script) + list(code)))
+        self.threaded = threaded
+        self.external = external
+
+    @property
+    def log_path(self):
+        return os.path.join(LOG_DIR, f'{self.name}.log')
+
+    @property
+    def report_path(self):
+        return os.path.join(REPORT_DIR, f'{self.name}.json')
+
+    def profile_path(self, profiler):
+        return os.path.join(PROFILE_DIR, f'{self.name}.prof' if profiler == 'cprofile' else f'{self.name}.svg')
+
+    def command(self, n_jobs, profiler=None):
+        args = self.args + (['--n-jobs', str(n_jobs)] if self.threaded else [])
+        command = [sys.executable, os.path.join(REPO_ROOT, self.script)] + args
+        if profiler == 'py-spy':
+            # py-spy は外からプロセスをサンプリングするので、コマンドの前に付けるだけでよい
+            command = ['py-spy', 'record', '--subprocesses', '-o', self.profile_path(profiler), '--'] + command
+        return command
+
+STAGES = [
+    Stage('scrape', 'scraping/suumo_scraper.py', args=['--output', SCRAPED_CSV],
+          outputs=[SCRAPED_CSV], external=True),
+    Stage('import', 'raw_file/dataset.py', args=[SCRAPED_CSV, '--output', RAW_DIR], deps=['scrape'],
+          inputs=[SCRAPED_CSV], outputs=[RAW_DIR]),
+    Stage('preprocess', 'raw_file/data_preprocessing.py', deps=['import'], inputs=[RAW_DIR, GAZETTEER],
+          outputs=[PROCESSED_DIR, FEATURE_PIPELINE, STATION_INDEX, GEO_INDEX]),
+    Stage('cv', 'raw_file/modeling_cv.py', deps=['preprocess'], inputs=[PROCESSED_DIR], threaded=True,
+          log_output=True),
+    Stage('search', 'raw_file/modeling_cv.py', args=['--search'], deps=['preprocess'], inputs=[PROCESSED_DIR],
+          outputs=[BEST_PARAMS], threaded=True),
+    Stage('importance', 'raw_file/modeling.py', args=['--output', 'graph/feature_importance.png'],
+          deps=['preprocess'], inputs=[PROCESSED_DIR], outputs=['graph/feature_importance.png']),
+    # 探索は重いので、search を指定しなければ保存済みのパラメータ (BEST_PARAMS、なければ既定値) で学習する
+    Stage('learning_curve', 'raw_file/plot_learning_curve.py', args=['--output', 'graph/learning_curve.png'],
+          deps=['preprocess'], after=['search'], inputs=[PROCESSED_DIR, BEST_PARAMS],
+          outputs=['graph/learning_curve.png'], threaded=True),
+    Stage('train', 'raw_file/train_model.py', deps=['preprocess'], after=['search'],
+          inputs=[PROCESSED_DIR, FEATURE_PIPELINE, STATION_INDEX, GEO_INDEX, BEST_PARAMS], outputs=[MODEL_LATEST],
+          threaded=True),
+    Stage('bargains', 'raw_file/find_bargains.py', deps=['train'], inputs=[MODEL_LATEST, PROCESSED_DIR, RAW_DIR],
+          log_output=True),
+]
+
+def content_hash(paths, root='.'):
+    """ファイル・ディレクトリの内容のハッシュ。存在しないパスは None を返す"""
+    digest = hashlib.sha256()
+    for path in paths:
+        full_path = os.path.join(root, path)
+        if os.path.isfile(full_path):
+            files = [full_path]
+        elif os.path.isdir(full_path):
+            files = sorted(os.path.join(dirpath, name) for dirpath, _, names in os.walk(full_path) for name in names)
+        else:
+            return None
+        digest.update(path.encode('utf-8'))
+        for file_path in files:
+            digest.update(os.path.relpath(file_path, full_path).encode('utf-8'))
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+def stage_key(stage):
+    """入力の内容・コード・引数から決まるステージのキー"""
+    key = {'args': stage.args, 'inputs': content_hash(stage.inputs), 'code': content_hash(stage.code, REPO_ROOT)}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+def load_state(path=STATE_PATH):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, path)
+
+def up_to_date(stage, key, state):
+    previous = state.get(stage.name)
+    outputs = content_hash(stage.outputs) if stage.outputs else ''
+    if outputs is None:
+        return False
+    if stage.external:
+        return True
+    return previous is not None and previous['key'] == key and previous['outputs'] == outputs
+
+def select(targets):
+    """targets とその依存ステージを、定義順（依存が先）に並べて返す"""
+    by_name = {stage.name: stage for stage in STAGES}
+    needed = set()
+
+    def visit(name):
+        if name not in by_name:
+            raise SystemExit(f'Unknown stage: {name} (stages: {", ".join(by_name)})')
+        if name not in needed:
+            needed.add(name)
+            for dep in by_name[name].deps:
+                visit(dep)
+
+    for name in targets or by_name:
+        visit(name)
+    return [stage for stage in STAGES if stage.name in needed]
+
+def run_stage(stage, n_jobs, profiler=None):
+    """ステージを実行する。計測値は stage.report_path に、profiler を指定すればプロファイルも書き出させる"""
+    for directory in (LOG_DIR, REPORT_DIR, PROFILE_DIR if profiler else None):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    for output in stage.outputs:
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    env = dict(os.environ, MPLBACKEND='Agg', PYTHONUNBUFFERED='1')
+    env[REPORT_PATH_ENV] = stage.report_path
+    if profiler == 'cprofile':
+        env[PROFILE_PATH_ENV] = stage.profile_path(profiler)
+    try:
+        os.remove(stage.report_path)
+    except OSError:
+        pass
+    start = time.perf_counter()
+    with open(stage.log_path, 'w', encoding='utf-8') as log:
+        returncode = subprocess.call(stage.command(n_jobs, profiler), stdout=log, stderr=subprocess.STDOUT, env=env)
+    return returncode, time.perf_counter() - start
+
+def read_report(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_run_report(results, path=RUN_REPORT_PATH):
+    """今回の実行の各ステージの結果（実行したステージはその計測値も）を1つのJSONにまとめる"""
+    report = {'finished_at': datetime.now().isoformat(timespec='seconds'), 'stages': results}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+def run_pipeline(targets=None, jobs=2, force=(), dry_run=False, profiler=None):
+    """ステージを依存関係の順に実行する。依存が終わったステージは jobs 個まで並列に実行する
+    実行後、各ステージの結果と計測値を RUN_REPORT_PATH にまとめる
+    """
+    if profiler == 'py-spy' and not dry_run and shutil.which('py-spy') is None:
+        raise SystemExit('py-spy is not installed (pip install py-spy)')
+    stages = select(targets)
+    selected = {stage.name for stage in stages}
+    # after は一緒に実行する場合だけ依存として扱う
+    deps = {stage.name: stage.deps + [name for name in stage.after if name in selected] for stage in stages}
+    n_jobs = max(1, (os.cpu_count() or 1) // jobs)
+    state = load_state()
+    results = {}
+    finished, failed = set(), set()
+    pending = list(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            for stage in list(pending):
+                if any(dep in failed for dep in deps[stage.name]):
+                    pending.remove(stage)
+                    failed.add(stage.name)
+                    results[stage.name] = {'status': 'skipped'}
+                    print(f'[skip]  {stage.name}: dependency failed')
+                    continue
+                if not all(dep in finished for dep in deps[stage.name]):
+                    continue
+                pending.remove(stage)
+                key = stage_key(stage)
+                if stage.name not in force and up_to_date(stage, key, state):
+                    print(f'[cached] {stage.name}')
+                    results[stage.name] = {'status': 'cached'}
+                    finished.add(stage.name)
+                    continue
+                if dry_run:
+                    print(f'[run]   {stage.name} (dry run)')
+                    finished.add(stage.name)
+                    continue
+                print(f'[start] {stage.name}: {" ".join(stage.command(n_jobs, profiler)[1:])}')
+                running[executor.submit(run_stage, stage, n_jobs, profiler)] = (stage, key)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, key = running.pop(future)
+                returncode, elapsed = future.result()
+                results[stage.name] = {'status': 'done' if returncode == 0 else 'failed', 'returncode': returncode,
+                                       'seconds': round(elapsed, 2), 'metrics': read_report(stage.report_path)}
+                if returncode != 0:
+                    failed.add(stage.name)
+                    print(f'[fail]  {stage.name} (exit {returncode}, see {stage.log_path})')
+                    continue
+                finished.add(stage.name)
+                state[stage.name] = {'key': key, 'outputs': content_hash(stage.outputs) if stage.outputs else '',
+                                     'finished_at': datetime.now().isoformat(timespec='seconds'),
+                                     'seconds': round(elapsed, 2)}
+                save_state(state)
+                print(f'[done]  {stage.name} ({elapsed:.1f}s)')
+    if not dry_run:
+        write_run_report(results)
+    return not failed
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="スクレイピング→取り込み→前処理→学習・CV→割安物件 を依存関係に沿って実行する。"
+                    "入力とコードが変わっていないステージは省略する")
+    parser.add_argument('targets', nargs='*', help=f"実行するステージ（依存も含む）。省略時は全部: "
+                                                   f"{', '.join(stage.name for stage in STAGES)}")
+    parser.add_argument('--jobs', type=int, default=2, help="同時に実行するステージ数")
+    parser.add_argument('--force', nargs='*', default=[], help="キャッシュを無視して実行するステージ")
+    parser.add_argument('--dry-run', action='store_true', help="実行するステージを表示するだけ")
+    parser.add_argument('--profile', choices=['cprofile', 'py-spy'], default=None,
+                        help=f"実行するステージをプロファイルし、{PROFILE_DIR} に保存する"
+                             "（cprofile: pstats形式, py-spy: フレームグラフのSVG）")
+    args = parser.parse_args()
+
+    ok = run_pipeline(args.targets, jobs=args.jobs, force=set(args.force), dry_run=args.dry_run, profiler=args.profile)
+    if not args.dry_run:
+        print(f'Run report saved to {RUN_REPORT_PATH}')
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
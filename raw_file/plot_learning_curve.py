@@ -1,14 +1,72 @@
 
-import pandas as pd
+import argparse
+import json
+import os
 import numpy as np
-import lightgbm as lgb
-from sklearn.model_selection import learning_curve, KFold
 import matplotlib.pyplot as plt
 import warnings
 
+from dataset import load_features
+from cv_engine import STOPPING_FRACTION, CVEngine, load_best_params
+from model_registry import dataset_fingerprint
+from metrics import add_arguments as add_metrics_arguments, instrument
+
 warnings.filterwarnings('ignore', category=UserWarning)
 
-def plot_learning_curve_rmse(estimator, title, X, y, ylim=None, cv=None, n_jobs=None, train_sizes=np.linspace(.1, 1.0, 5)):
+# 学習曲線の計算結果の保存先（描画だけやり直すときは再学習しない）
+CURVE_PATH = 'data/learning_curve.json'
+
+def compute_learning_curve(engine, params, num_boost_round, early_stopping_rounds=None,
+                           train_sizes=np.linspace(.1, 1.0, 5), seed=42):
+    """学習曲線の数値を計算する（RMSEは家賃（万円）のスケール）
+
+    foldの分け方とビン分割は CVEngine のものを使い回す。各foldの訓練データを固定の順に並べ、
+    先頭から train_sizes の割合だけを使う（小さいサイズは大きいサイズの部分集合になる）。
+    木の数は num_boost_round で固定する。early_stopping_rounds を指定した場合は、訓練データから取り分けた行で
+    早期終了する（検証データで木の数を選ぶと、描く検証RMSEが楽観的になる）。
+    """
+    rng = np.random.default_rng(seed)
+    orders = [rng.permutation(train_index) for train_index, _ in engine.folds]
+
+    def run(size, fold):
+        train_index = np.sort(orders[fold][:max(1, int(round(size * len(orders[fold]))))])
+        val_index = engine.folds[fold][1]
+        booster, best_iteration = engine.fit(params, train_index, num_boost_round, early_stopping_rounds)
+        train_rmse, _ = engine.predict_rmse(booster, train_index, best_iteration)
+        test_rmse, _ = engine.predict_rmse(booster, val_index, best_iteration)
+        return len(train_index), train_rmse, test_rmse, best_iteration
+
+    n_folds = len(engine.folds)
+    results = engine.map(run, [(size, fold) for size in train_sizes for fold in range(n_folds)])
+    rows = [results[i * n_folds:(i + 1) * n_folds] for i in range(len(train_sizes))]
+    return {
+        'train_sizes': [int(np.mean([r[0] for r in row])) for row in rows],
+        'train_rmse': [[r[1] for r in row] for row in rows],
+        'test_rmse': [[r[2] for r in row] for row in rows],
+        'best_iterations': [[r[3] for r in row] for row in rows],
+    }
+
+def load_or_compute_curve(X, y, params, num_boost_round, early_stopping_rounds, train_sizes, n_jobs=None,
+                          cache_path=CURVE_PATH, refresh=False):
+    """同じデータ・パラメータで計算済みなら保存した学習曲線を返し、そうでなければ計算して保存する"""
+    key = {'dataset_fingerprint': dataset_fingerprint(), 'params': params, 'num_boost_round': num_boost_round,
+           'early_stopping_rounds': early_stopping_rounds, 'train_sizes': [float(size) for size in train_sizes],
+           'stopping_fraction': STOPPING_FRACTION if early_stopping_rounds else None}
+    if not refresh and os.path.exists(cache_path):
+        with open(cache_path, encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('key') == key:
+            print(f'Using cached learning curve from {cache_path}')
+            return cached['curve']
+    engine = CVEngine(X, y, n_splits=5, random_state=42, n_jobs=n_jobs)
+    print(f'Computing learning curve ({len(train_sizes)} sizes x 5 folds, {engine.n_jobs} threads)...')
+    curve = compute_learning_curve(engine, params, num_boost_round, early_stopping_rounds, train_sizes)
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump({'key': key, 'curve': curve}, f, indent=1)
+    return curve
+
+def plot_learning_curve_rmse(curve, title, ylim=None):
     plt.figure(figsize=(10, 6))
     plt.title(title)
     if ylim is not None:
@@ -16,12 +74,9 @@ def plot_learning_curve_rmse(estimator, title, X, y, ylim=None, cv=None, n_jobs=
     plt.xlabel("Training examples")
     plt.ylabel("RMSE (万円)")
 
-    train_sizes, train_scores, test_scores = learning_curve(
-        estimator, X, y, cv=cv, n_jobs=n_jobs, train_sizes=train_sizes, scoring="neg_mean_squared_error")
-
-    # スコアは負のMSEで返ってくるので、RMSEに変換
-    train_rmse = np.sqrt(-train_scores)
-    test_rmse = np.sqrt(-test_scores)
+    train_sizes = np.array(curve['train_sizes'])
+    train_rmse = np.array(curve['train_rmse'])
+    test_rmse = np.array(curve['test_rmse'])
 
     train_rmse_mean = np.mean(train_rmse, axis=1)
     train_rmse_std = np.std(train_rmse, axis=1)
@@ -45,31 +100,37 @@ def plot_learning_curve_rmse(estimator, title, X, y, ylim=None, cv=None, n_jobs=
     return plt
 
 def main():
-    # データを読み込む
-    df = pd.read_csv('data/suumo_data_cleaned.csv')
-
-    # 特徴量 (X) とターゲット (y) を定義
-    if 'rent' in df.columns:
-        X = df.drop(['rent', 'rent_log'], axis=1)
-    else:
-        X = df.drop(['rent_log'], axis=1)
-
-    y = df['rent_log']
-
-    # モデルを定義
-    estimator = lgb.LGBMRegressor(random_state=42)
-
-    # 交差検証の設定
-    cv = KFold(n_splits=5, shuffle=True, random_state=42)
+    parser = argparse.ArgumentParser(description="学習曲線を描く（計算結果は保存して再利用する）")
+    parser.add_argument('--refresh', action='store_true', help="保存済みの学習曲線を使わずに計算し直す")
+    parser.add_argument('--n-jobs', type=int, default=None)
+    parser.add_argument('--rounds', type=int, default=None,
+                        help="木の数。省略時は modeling_cv.py --search で選ばれた木の数（--early-stopping では上限）")
+    parser.add_argument('--early-stopping', type=int, default=0,
+                        help="0より大きければ、訓練データから取り分けた行で早期終了する")
+    parser.add_argument('--cache', default=CURVE_PATH)
+    parser.add_argument('--output', default='learning_curve.png')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    instrument('learning_curve', args.metrics_report, args.profile)
+
+    # 前処理済みのデータから特徴量 (X) とターゲット (y) を読み込む
+    X, y, _ = load_features()
+
+    # モデルのパラメータ（modeling_cv.py --search の結果があればそれを使う）
+    params, num_boost_round = load_best_params()
+
+    # 学習曲線を計算（交差検証の設定は CVEngine の5-fold）
+    curve = load_or_compute_curve(X, y, params, args.rounds or num_boost_round, args.early_stopping or None,
+                                  np.linspace(.1, 1.0, 5),
+                                  n_jobs=args.n_jobs, cache_path=args.cache, refresh=args.refresh)
 
     # 学習曲線を描画
     title = "Learning Curves (LightGBM)"
-    plot = plot_learning_curve_rmse(estimator, title, X, y, cv=cv, n_jobs=-1)
-    
+    plot = plot_learning_curve_rmse(curve, title)
+
     # グラフをファイルに保存
-    output_path = 'learning_curve.png'
-    plot.savefig(output_path)
-    print(f'Learning curve plot saved to {output_path}')
+    plot.savefig(args.output)
+    print(f'Learning curve plot saved to {args.output}')
 
 if __name__ == '__main__':
     main()
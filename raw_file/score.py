@@ -0,0 +1,139 @@
+
+import argparse
+import json
+import sys
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from model_registry import load_model, REGISTRY_PATH
+from metrics import METRICS, add_arguments as add_metrics_arguments, instrument
+
+warnings.filterwarnings('ignore', category=UserWarning)
+
+OUTPUT_COLUMNS = ['predicted_rent', 'discount_rate']
+
+def _json_value(value):
+    if isinstance(value, (np.floating, float)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+def score_records(model, records):
+    """物件（dict）のリストを予測し、各物件の予測家賃と割安率を返す"""
+    METRICS.incr('score.records', len(records))
+    with METRICS.timer('score.request'):
+        scored = model.score(pd.DataFrame(records))
+    columns = [col for col in OUTPUT_COLUMNS if col in scored.columns]
+    return [{col: _json_value(value) for col, value in zip(columns, row)}
+            for row in scored[columns].itertuples(index=False)]
+
+def score_file(model, input_path, output_path, batch_size=10000):
+    """CSV（スクレイピング結果と同じ列）またはParquetを batch_size 件ずつ予測して CSV に書き出す"""
+    if input_path.endswith('.parquet'):
+        batches = [pd.read_parquet(input_path)]
+    else:
+        batches = pd.read_csv(input_path, encoding='utf-8-sig', chunksize=batch_size)
+    n_rows = 0
+    start = time.perf_counter()
+    for i, batch in enumerate(batches):
+        scored = model.score(batch)
+        scored.to_csv(output_path, mode='w' if i == 0 else 'a', header=i == 0, index=False, encoding='utf-8-sig')
+        n_rows += len(batch)
+    elapsed = time.perf_counter() - start
+    METRICS.incr('score.records', n_rows)
+    METRICS.set('score.rows_per_sec', n_rows / elapsed if elapsed else None)
+    print(f'Scored {n_rows} rows with model {model.version} in {elapsed:.2f}s -> {output_path}')
+
+def serve_stdio(model):
+    """1行1物件のJSONを標準入力から読み、1行ずつ予測結果のJSONを返す"""
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            result = score_records(model, [json.loads(line)])[0]
+        except (ValueError, KeyError) as e:
+            METRICS.error('score.errors', str(e))
+            result = {'error': str(e)}
+        sys.stdout.write(json.dumps(result, ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+
+def make_handler(model):
+    class ScoreHandler(BaseHTTPRequestHandler):
+        """POST /score に物件1件（JSONオブジェクト）または複数件（配列）を送ると予測結果を返す"""
+
+        def do_POST(self):
+            if self.path != '/score':
+                self.send_error(404)
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                records = payload if isinstance(payload, list) else [payload]
+                results = score_records(model, records)
+                status, body = 200, results if isinstance(payload, list) else results[0]
+            except (ValueError, KeyError) as e:
+                METRICS.error('score.errors', str(e))
+                status, body = 400, {'error': str(e)}
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path != '/model':
+                self.send_error(404)
+                return
+            data = json.dumps(model.meta, ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScoreHandler
+
+def main():
+    parser = argparse.ArgumentParser(description="登録済みモデルで物件の家賃を予測する（再学習はしない）")
+    parser.add_argument('--registry', default=REGISTRY_PATH)
+    parser.add_argument('--version', default=None, help="省略時は最新バージョン")
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+    batch_parser = subparsers.add_parser('batch', help="ファイルの物件をまとめて予測する")
+    batch_parser.add_argument('input_path')
+    batch_parser.add_argument('--output', default='data/scored.csv')
+    batch_parser.add_argument('--batch-size', type=int, default=10000)
+    subparsers.add_parser('stdio', help="標準入出力で1件ずつ予測する (JSON Lines)")
+    serve_parser = subparsers.add_parser('serve', help="HTTPサーバーで予測する")
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    instrument('score', args.metrics_report, args.profile)
+
+    # モデルは起動時に1回だけ読み込む
+    model = load_model(args.version, registry=args.registry)
+
+    if args.mode == 'batch':
+        score_file(model, args.input_path, args.output, args.batch_size)
+    elif args.mode == 'stdio':
+        serve_stdio(model)
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(model))
+        print(f'Serving model {model.version} on http://{args.host}:{args.port}/score', file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+
+import json
+import re
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import KFold
+
+# 路線・駅の索引と駅ごとの集計値の保存先
+STATION_INDEX_PATH = 'data/station_index.json'
+
+ROUTE_COLUMNS = ['transportation_1', 'transportation_2', 'transportation_3']
+
+# 「ＪＲ山手線/渋谷駅 歩5分」の形式。バス便（「… バス10分 (バス停)… 歩3分」）の徒歩分数は駅までの時間ではないので使わない
+ROUTE_PATTERN = re.compile(r'^(?P<line>[^/]+)/(?P<station>\S+)')
+WALK_PATTERN = re.compile(r'歩(\d+)分')
+
+# lines_within の徒歩分数
+WALK_RADIUS_MINUTES = 10
+
+# 駅の家賃中央値を使う最小の物件数（これより少ない駅は欠損にする）
+MIN_STATION_LISTINGS = 3
+
+def parse_route(value):
+    """交通アクセス1件を (路線名, 駅名, 徒歩分数) に分ける。取れない項目はNone / NaN"""
+    if not isinstance(value, str):
+        return None, None, np.nan
+    match = ROUTE_PATTERN.match(value)
+    if not match:
+        return None, None, np.nan
+    walk = WALK_PATTERN.search(value)
+    minutes = float(walk.group(1)) if walk and 'バス' not in value else np.nan
+    return match.group('line'), match.group('station'), minutes
+
+def parse_routes(df):
+    """交通アクセスの3列を (路線名, 駅名, 徒歩分数) の (行数, 3) の配列にする
+    同じ文字列は1回だけ解析する
+    """
+    n_rows = len(df)
+    lines = np.full((n_rows, len(ROUTE_COLUMNS)), None, dtype=object)
+    stations = np.full((n_rows, len(ROUTE_COLUMNS)), None, dtype=object)
+    walks = np.full((n_rows, len(ROUTE_COLUMNS)), np.nan)
+    for j, col in enumerate(ROUTE_COLUMNS):
+        if col not in df.columns:
+            continue
+        codes, uniques = pd.factorize(df[col])
+        parsed = [parse_route(value) for value in uniques] + [parse_route(None)]
+        lines[:, j] = np.array([p[0] for p in parsed], dtype=object)[codes]
+        stations[:, j] = np.array([p[1] for p in parsed], dtype=object)[codes]
+        walks[:, j] = np.array([p[2] for p in parsed])[codes]
+    return lines, stations, walks
+
+def _ids(names, vocabulary):
+    """名前の配列を索引の整数IDに変換する。索引にない名前・欠損は -1"""
+    flat = pd.Series(names.ravel()).map(vocabulary)
+    return flat.fillna(-1).to_numpy(dtype=np.int32).reshape(names.shape)
+
+def _station_medians(station_ids, rent, n_stations):
+    """駅IDごとの家賃中央値。物件数が MIN_STATION_LISTINGS 未満の駅はNaN
+    末尾にID -1（索引にない駅）用のNaNを1つ足してあるので、IDでそのまま引ける
+    """
+    medians = np.full(n_stations + 1, np.nan)
+    valid = (station_ids >= 0) & ~np.isnan(rent)
+    if valid.any():
+        grouped = pd.Series(rent[valid]).groupby(station_ids[valid]).agg(['median', 'count'])
+        grouped = grouped[grouped['count'] >= MIN_STATION_LISTINGS]
+        medians[grouped.index.to_numpy()] = grouped['median'].to_numpy()
+    return medians
+
+class StationIndex:
+    """スクレイピングしたデータから作る路線・駅の索引（名前→整数ID）と、駅ごとの集計値
+
+    家賃の集計には最寄り（transportation_1）の駅を使う。JSONに保存して、前処理や予測のたびに
+    生データ全体を読み直さずに済むようにする。
+    """
+
+    def __init__(self):
+        self.lines = {}
+        self.stations = {}
+        self.station_counts = []
+        self.station_median_rent = []
+
+    def fit(self, df):
+        lines, stations, _ = parse_routes(df)
+        self.lines = {name: i for i, name in enumerate(sorted({v for v in lines.ravel() if v is not None}))}
+        self.stations = {name: i for i, name in enumerate(sorted({v for v in stations.ravel() if v is not None}))}
+        nearest = _ids(stations[:, 0], self.stations)
+        self.station_counts = np.bincount(nearest[nearest >= 0], minlength=len(self.stations)).tolist()
+        rent = df['rent'].to_numpy(dtype=float) if 'rent' in df.columns else np.full(len(df), np.nan)
+        self.station_median_rent = _station_medians(nearest, rent, len(self.stations))[:-1].tolist()
+        return self
+
+    def transform(self, df, within=WALK_RADIUS_MINUTES):
+        """駅アクセスの特徴量を返す
+        min_walk_minutes: 3つの経路のうち最短の徒歩分数
+        lines_within_{within}min: 徒歩 within 分以内で使える路線の数
+        station_median_rent: 最寄り駅の家賃中央値（索引作成時のデータから）
+        """
+        lines, stations, walks = parse_routes(df)
+        nearest = _ids(stations[:, 0], self.stations)
+
+        # 索引にない路線も数えられるよう、路線名の出現順のコードで重複を除く
+        codes = pd.factorize(pd.Series(lines.ravel()))[0].reshape(lines.shape)
+        near = (walks <= within) & (codes >= 0)
+        a, b, c = (np.where(near[:, j], codes[:, j], -1 - j) for j in range(len(ROUTE_COLUMNS)))
+        n_lines = (a >= 0).astype(np.int8) + ((b >= 0) & (b != a)) + ((c >= 0) & (c != a) & (c != b))
+
+        station_rent = np.append(np.asarray(self.station_median_rent, dtype=float), np.nan)
+        return pd.DataFrame({
+            'min_walk_minutes': np.fmin.reduce(walks, axis=1),
+            f'lines_within_{within}min': n_lines.astype(float),
+            'station_median_rent': station_rent[nearest],
+        }, index=df.index)
+
+    def out_of_fold_station_rent(self, df, n_splits=5, random_state=42):
+        """学習データ用の最寄り駅の家賃中央値。各行の値はその行を含まない他のfoldから求める"""
+        _, stations, _ = parse_routes(df)
+        nearest = _ids(stations[:, 0], self.stations)
+        rent = df['rent'].to_numpy(dtype=float)
+        result = np.full(len(df), np.nan)
+        if len(df) < n_splits:
+            return pd.Series(result, index=df.index)
+        kf = KFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+        for train_index, val_index in kf.split(rent):
+            medians = _station_medians(nearest[train_index], rent[train_index], len(self.stations))
+            result[val_index] = medians[nearest[val_index]]
+        return pd.Series(result, index=df.index)
+
+    def save(self, path=STATION_INDEX_PATH):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'lines': self.lines, 'stations': self.stations, 'station_counts': self.station_counts,
+                       'station_median_rent': [None if np.isnan(v) else v for v in self.station_median_rent]},
+                      f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path=STATION_INDEX_PATH):
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+        index = cls()
+        index.lines = state['lines']
+        index.stations = state['stations']
+        index.station_counts = state['station_counts']
+        index.station_median_rent = [np.nan if v is None else v for v in state['station_median_rent']]
+        return index
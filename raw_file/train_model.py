@@ -0,0 +1,53 @@
+
+import argparse
+import warnings
+
+import lightgbm as lgb
+import pandas as pd
+
+from dataset import load_features, ROW_ID
+from data_preprocessing import FeaturePipeline, PIPELINE_PATH
+from cv_engine import CVEngine, load_best_params, BEST_PARAMS_PATH
+from model_registry import register, dataset_fingerprint, REGISTRY_PATH
+from metrics import METRICS, add_arguments as add_metrics_arguments, instrument
+
+warnings.filterwarnings('ignore', category=UserWarning)
+
+def main():
+    parser = argparse.ArgumentParser(description="モデルを学習してレジストリに登録する（out-of-fold予測も保存）")
+    parser.add_argument('--params', default=BEST_PARAMS_PATH, help="modeling_cv.py --search の結果（なければ既定値）")
+    parser.add_argument('--n-jobs', type=int, default=None)
+    parser.add_argument('--registry', default=REGISTRY_PATH)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    instrument('train', args.metrics_report, args.profile)
+
+    # 前処理済みのデータと、それを作った前処理を読み込む
+    X, y, keys = load_features()
+    pipeline = FeaturePipeline.load(PIPELINE_PATH)
+    params, num_boost_round = load_best_params(args.params)
+
+    # out-of-fold予測（割安物件の判定用）
+    print(f'Computing out-of-fold predictions ({len(X)} rows, {num_boost_round} rounds)...')
+    engine = CVEngine(X, y, n_jobs=args.n_jobs)
+    result = engine.cross_validate(params, num_boost_round, keep_predictions=True)
+    print(f'Out-of-fold RMSE: {result["rmse"]:.4f} (万円)')
+
+    # 全データで学習（ビン分割は交差検証と同じものを使う）
+    print('Training model on the entire dataset...')
+    with METRICS.timer('model.fit_full'):
+        booster = lgb.train(dict(params, num_threads=engine.n_jobs), engine.data, num_boost_round)
+
+    oof = pd.DataFrame({ROW_ID: keys[ROW_ID].to_numpy(), 'predicted_rent': result['oof_pred']})
+    version = register(booster, pipeline, oof, {
+        'dataset_fingerprint': dataset_fingerprint(),
+        'n_rows': len(X),
+        'params': params,
+        'num_boost_round': num_boost_round,
+        'cv_rmse': result['rmse'],
+        'cv_rmse_std': result['rmse_std'],
+    }, registry=args.registry)
+    print(f'Registered model {version} in {args.registry}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+import asyncio
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+import aiohttp
+from tqdm import tqdm
+
+from html_archive import page_type
+from http_client import METRICS, RETRY_STATUS, FetchResult, parser_id
+from record_writer import RecordWriter
+from suumo_scraper import HEADERS, SUUMO_ROOT, get_parsers
+
+class RateLimiter:
+    """全体のリクエスト数を1秒あたりrps件に抑えるトークンバケット"""
+
+    def __init__(self, rps, burst=1):
+        self.rps = rps
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rps)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rps)
+
+class BusyTimer:
+    """同時に進む処理のうち、少なくとも1つが実行中だった時間の合計（区間の和集合）を数える"""
+
+    def __init__(self):
+        self.active = 0
+        self.started = 0.0
+        self.busy = 0.0
+
+    @contextmanager
+    def measure(self):
+        if self.active == 0:
+            self.started = time.perf_counter()
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            if self.active == 0:
+                self.busy += time.perf_counter() - self.started
+
+class AsyncCrawler:
+    """一覧ページの解析（producer）と詳細ページの取得（consumer）を分離した非同期クローラ
+
+    parse_workers > 0 の場合、取得したHTMLの解析はプロセスプールで行う。解析待ちのページ数は
+    parse_queue_depth までに制限され、満杯になると取得側が待たされる。解析済みの物件は
+    1つの writer タスクにまとめて渡され、RecordWriter でバッチ単位に書き出される。
+    checkpoint を渡すと、一覧ページを解析するたびにフロンティアを記録し、再実行時はそこから再開する。
+    """
+
+    def __init__(self, concurrency=8, rps=1.0, root=SUUMO_ROOT, queue_size=None, timeout=15,
+                 cache=None, retries=3, backoff=1.0, store=None, parser='bs4',
+                 parse_workers=0, parse_queue_depth=None, archive=None, writer=None, checkpoint=None, burst=1):
+        self.concurrency = concurrency
+        # burst は連続して送ってよいリクエスト数。起動時や待機の後にも rps を超えないよう既定は1
+        self.limiter = RateLimiter(rps, burst=burst)
+        self.root = root
+        self.queue_size = queue_size or concurrency * 4
+        self.timeout = timeout
+        self.cache = cache
+        self.retries = retries
+        self.backoff = backoff
+        self.store = store
+        self.archive = archive
+        listing_parser, self.detail_parser = get_parsers(parser)
+        # プロセスプールに渡せるよう、lambdaではなくpartialにする
+        self.listing_parser = partial(listing_parser, root=root)
+        self.parse_workers = parse_workers
+        self.parse_queue_depth = parse_queue_depth or max(1, parse_workers) * 2
+        self.record_writer = writer
+        self.checkpoint = checkpoint
+        self.semaphore = None
+        self.parse_slots = None
+        self.executor = None
+        self.session = None
+        # HttpClient.stats と同じキーに、一覧・詳細ページの取得件数と段階ごとの件数を加えたもの
+        self.stats = Counter()
+        # 段階ごとの稼働時間。スループットは全体の経過時間ではなく、この時間で割る
+        self.busy = {stage: BusyTimer() for stage in ('fetch', 'parse', 'write')}
+        self.elapsed = 0.0
+        self.last_error = None
+
+    async def _get(self, url, headers):
+        """(status, text, response headers) を返す。5xxとタイムアウトは指数バックオフで再試行する"""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats['retries'] += 1
+                METRICS.incr('fetch.retries')
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            async with self.semaphore:
+                await self.limiter.acquire()
+                self.stats['fetches'] += 1
+                METRICS.incr('fetch.requests')
+                try:
+                    with self.busy['fetch'].measure():
+                        result = await self._request(url, headers)
+                    if result is None:
+                        continue
+                    return result
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self.last_error = f'{type(e).__name__}: {e}'
+                    continue
+        return None
+
+    async def _request(self, url, headers):
+        """1回分のリクエスト。再試行すべきステータスなら None を返す"""
+        # レート制限の待ち時間は含めず、リクエストの送信から本文の受信までを計る
+        start = time.perf_counter()
+        async with self.session.get(url, headers=headers) as response:
+            METRICS.incr(f'fetch.status.{response.status}')
+            if response.status in RETRY_STATUS:
+                self.last_error = f'HTTP {response.status}'
+                return None
+            body = await response.read() if response.status < 300 else b''
+            METRICS.observe('fetch.latency', time.perf_counter() - start)
+            METRICS.incr('fetch.bytes', len(body))
+            # MB/s の表示に使うので、デコード後の文字数ではなく受信したバイト数を数える
+            self.stats['bytes'] += len(body)
+            text = body.decode(response.get_encoding(), errors='replace') if response.status < 300 else None
+            return response.status, text, response.headers
+
+    async def fetch(self, url):
+        """同時実行数とレート上限の範囲内でHTMLを取得する。失敗時はNoneを返す"""
+        headers = self.cache.conditional_headers(url) if self.cache else {}
+        result = await self._get(url, headers)
+        if result and result[0] == 304 and self.cache:
+            text = self.cache.get_text(url)
+            if text is not None:
+                self.stats['cache_hits'] += 1
+                return FetchResult(text, True)
+            result = await self._get(url, {})
+        if result is None or result[1] is None:
+            self.stats['failures'] += 1
+            reason = self.last_error if result is None else f'HTTP {result[0]}'
+            METRICS.error('fetch.failures', f'{url}: {reason}')
+            return None
+        _, text, response_headers = result
+        if self.cache:
+            self.cache.put(url, text, response_headers.get('ETag'), response_headers.get('Last-Modified'))
+        if self.archive:
+            self.archive.append(url, text)
+        return FetchResult(text, False)
+
+    async def fetch_parsed(self, url, parser):
+        """HttpClient.fetch_parsed と同じく、304の場合は前回の解析結果を再利用する"""
+        result = await self.fetch(url)
+        if result is None:
+            return None
+        if result.not_modified:
+            parsed = self.cache.get_parsed(url, parser_id(parser))
+            if parsed is not None:
+                self.stats['parse_skips'] += 1
+                return parsed
+        parsed = await self.parse(parser, result.text, page_type(url))
+        if self.cache:
+            self.cache.put_parsed(url, parser_id(parser), parsed)
+        return parsed
+
+    async def parse(self, parser, html, kind='page'):
+        """HTMLを解析する。プロセスプールがあれば、空きができるまで待ってからワーカーに渡す
+        解析時間は kind ('listing' / 'detail') ごとに記録する（プールの空き待ちは含めない）
+        """
+        if self.executor is None:
+            with METRICS.timer(f'parse.{kind}'), self.busy['parse'].measure():
+                parsed = parser(html)
+        else:
+            async with self.parse_slots:
+                with METRICS.timer(f'parse.{kind}'), self.busy['parse'].measure():
+                    parsed = await asyncio.get_running_loop().run_in_executor(self.executor, parser, html)
+        self.stats['parsed_pages'] += 1
+        return parsed
+
+    async def crawl_listing(self, start_url, detail_queue):
+        """1つの検索条件について一覧ページを順にたどり、物件を詳細キューに流す"""
+        current_url = self.checkpoint.resume_url(start_url) if self.checkpoint else start_url
+        while current_url:
+            listing = await self.fetch_parsed(current_url, self.listing_parser)
+            if not listing:
+                break
+            self.stats['listing_pages'] += 1
+            properties = listing['properties']
+            if self.checkpoint:
+                self.checkpoint.advance(start_url, listing['next_url'] if properties else None, properties)
+            if not properties:
+                break # そのページに物件がなければ終了
+            for property_data in properties:
+                await detail_queue.put(property_data)
+            current_url = listing['next_url']
+
+    async def detail_worker(self, detail_queue, record_queue):
+        """詳細キューから物件を取り出し、詳細ページの情報を付与して writer に渡す"""
+        while True:
+            property_data = await detail_queue.get()
+            try:
+                known_details = self.store.known_details(property_data) if self.store else None
+                if known_details is not None:
+                    property_data.update(known_details)
+                    additional_details = None
+                else:
+                    additional_details = await self.fetch_parsed(property_data['detail_url'], self.detail_parser)
+                if additional_details:
+                    self.stats['detail_pages'] += 1
+                    property_data.update(additional_details)
+                await record_queue.put(property_data)
+            finally:
+                detail_queue.task_done()
+
+    async def requeue_pending(self, detail_queue):
+        """前回の実行で書き出せなかった物件を詳細キューに戻す"""
+        for property_data in self.checkpoint.take_pending():
+            await detail_queue.put(property_data)
+
+    async def writer(self, record_queue, writer, pbar):
+        """解析済みの物件を受け取る唯一のタスク"""
+        while True:
+            property_data = await record_queue.get()
+            if property_data is None:
+                break
+            with self.busy['write'].measure():
+                writer.write([property_data])
+            self.stats['records_written'] += 1
+            pbar.update(1)
+        with self.busy['write'].measure():
+            writer.flush()
+
+    async def _wait_or_fail(self, awaitable, tasks):
+        """awaitable の完了を待つ。先に tasks のどれかが終了（例外）したら、その例外を送出する
+        ワーカーと writer は正常には終わらないので、待っている間に終わったものは失敗とみなす
+        """
+        main = asyncio.ensure_future(awaitable)
+        done, _ = await asyncio.wait([main, *tasks], return_when=asyncio.FIRST_COMPLETED)
+        if main in done:
+            return main.result()
+        main.cancel()
+        await asyncio.gather(main, return_exceptions=True)
+        failed = done.pop()
+        raise failed.exception() or RuntimeError(f'{failed.get_name()} stopped unexpectedly')
+
+    async def crawl(self, start_urls):
+        """start_urls: (ラベル, URL) のリスト
+        writer を指定していなければ収集した物件のリストを、指定していれば writer.records を返す
+        """
+        writer = self.record_writer or RecordWriter(store=self.store, keep=True)
+        detail_queue = asyncio.Queue(maxsize=self.queue_size)
+        record_queue = asyncio.Queue(maxsize=self.queue_size)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.parse_slots = asyncio.Semaphore(self.parse_queue_depth)
+        if self.parse_workers:
+            self.executor = ProcessPoolExecutor(max_workers=self.parse_workers)
+        # 解析待ちの間も取得を続けられるよう、解析キューの分だけ詳細ワーカーを増やす
+        n_detail_workers = self.concurrency + (self.parse_queue_depth if self.parse_workers else 0)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        start = time.perf_counter()
+        try:
+            async with aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=timeout) as session:
+                self.session = session
+                with tqdm(desc="Details", leave=False) as pbar:
+                    writer_task = asyncio.create_task(self.writer(record_queue, writer, pbar))
+                    workers = [asyncio.create_task(self.detail_worker(detail_queue, record_queue))
+                               for _ in range(n_detail_workers)]
+                    producers = [self.crawl_listing(url, detail_queue) for _, url in start_urls]
+                    if self.checkpoint:
+                        producers.append(self.requeue_pending(detail_queue))
+                    tasks = [writer_task, *workers]
+                    try:
+                        # writer やワーカーが例外で止まると join が終わらないので、一緒に待って例外を伝える
+                        await self._wait_or_fail(asyncio.gather(*producers), tasks)
+                        await self._wait_or_fail(detail_queue.join(), tasks)
+                        for worker in workers:
+                            worker.cancel()
+                        await asyncio.gather(*workers, return_exceptions=True)
+                        await record_queue.put(None)
+                        await writer_task
+                    except BaseException:
+                        for task in tasks:
+                            task.cancel()
+                        await asyncio.gather(*tasks, return_exceptions=True)
+                        raise
+        finally:
+            if self.executor:
+                self.executor.shutdown()
+                self.executor = None
+            self.elapsed = time.perf_counter() - start
+        return writer.records
+
+    def run(self, start_urls):
+        return asyncio.run(self.crawl(start_urls))
+
+    def report(self):
+        return ', '.join(f"{key}={self.stats[key]}" for key in
+                         ('listing_pages', 'detail_pages', 'fetches', 'cache_hits', 'parse_skips', 'retries', 'failures'))
+
+    def stage_report(self):
+        """取得・解析・書き込みの各段階のスループット（各段階が稼働していた時間あたり）"""
+        busy = {stage: timer.busy or float('nan') for stage, timer in self.busy.items()}
+        parse_mode = f"{self.parse_workers} workers" if self.parse_workers else "inline"
+        return (f"fetch: {self.stats['fetches'] / busy['fetch']:.1f} req/s "
+                f"({self.stats['bytes'] / busy['fetch'] / 1e6:.2f} MB/s, busy {busy['fetch']:.2f}s), "
+                f"parse: {self.stats['parsed_pages'] / busy['parse']:.1f} pages/s "
+                f"({parse_mode}, busy {busy['parse']:.2f}s), "
+                f"write: {self.stats['records_written'] / busy['write']:.1f} records/s (busy {busy['write']:.2f}s)")
+
+def run_crawl(start_urls, concurrency=8, rps=1.0, root=SUUMO_ROOT, cache=None, parser='bs4', parse_workers=0,
+              burst=1):
+    """非同期クロールを実行し、物件のリストを返す"""
+    crawler = AsyncCrawler(concurrency=concurrency, rps=rps, root=root, cache=cache, parser=parser,
+                           parse_workers=parse_workers, burst=burst)
+    return crawler.run(start_urls)
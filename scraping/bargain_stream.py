@@ -0,0 +1,167 @@
+import heapq
+import json
+import os
+import re
+from datetime import datetime
+
+import pandas as pd
+
+import raw_file_path  # noqa: F401  raw_file/ を sys.path に加える
+from listing_store import price_key
+# 学習済みモデルと前処理は raw_file/ にある（model_registry.py）
+from dataset import AREA_NAME_PATTERN
+from metrics import METRICS
+from model_registry import load_model
+
+# 割安物件として記録する項目
+ENTRY_FIELDS = ['detail_url', 'building_name', 'address', 'layout', 'area', 'rent']
+
+class BargainDetector:
+    """スクレイパーが解析した物件をその場で予測し、割安な物件を検出する
+
+    新しい detail_url と価格の変わった物件だけを予測する。割安率 (家賃 - 予測家賃) / 家賃 が
+    -threshold 以下ならアラートをJSONLに追記し、エリアごとに割安率の低い top_k 件をヒープで保持する
+    （全件を並べ替え直さない）。known_prices には前回までの {detail_url: price_key} を渡せる。
+    seen_path を渡すと、予測済みの {detail_url: price_key} をモデルのバージョンごとに保存し、次の実行では
+    同じモデルで予測済みの物件を予測し直さない（差分クロールのストアがなくてもアラートを繰り返さない）。
+    """
+
+    def __init__(self, model, threshold=0.15, top_k=20, alert_path='data/bargain_alerts.jsonl',
+                 known_prices=None, seen_path=None, log=print):
+        self.area_pattern = re.compile(AREA_NAME_PATTERN)
+        self.model = model
+        self.threshold = threshold
+        self.top_k = top_k
+        self.log = log
+        self.seen_path = seen_path
+        self.seen = self._load_seen()
+        self.seen.update(known_prices or {})
+        # エリア → [(-割安率, detail_url, 物件)] の最小ヒープ（先頭が保持している中で最も割安でない物件）
+        self.heaps = {}
+        self.in_top = {}
+        self.scored = 0
+        self.alerts = 0
+        self.errors = 0
+        os.makedirs(os.path.dirname(alert_path) or '.', exist_ok=True)
+        self.alert_file = open(alert_path, 'a', encoding='utf-8')
+
+    def _load_seen(self):
+        if not self.seen_path or not os.path.exists(self.seen_path):
+            return {}
+        with open(self.seen_path, encoding='utf-8') as f:
+            saved = json.load(f)
+        # モデルが変われば予測も変わるので、すべて予測し直す
+        return saved['prices'] if saved.get('model_version') == self.model.version else {}
+
+    def save_seen(self):
+        if not self.seen_path:
+            return
+        _write_json({'model_version': self.model.version, 'prices': self.seen}, self.seen_path)
+
+    def area_name(self, address):
+        match = self.area_pattern.match(address or '')
+        return match.group(1) if match else '不明'
+
+    def observe(self, properties):
+        """RecordWriter の on_write からバッチごとに呼ばれる。新規・価格変更の物件だけをまとめて予測する
+        予測や記録に失敗した物件はログに残して飛ばす（1件の不正な物件でクロールを止めない）
+        """
+        changed = []
+        for property_data in properties:
+            try:
+                if self.seen.get(property_data['detail_url']) != price_key(property_data):
+                    changed.append(property_data)
+            except Exception as e:
+                self._skip(property_data, e)
+        if not changed:
+            return
+        try:
+            scored = self.model.score(pd.DataFrame(changed))
+        except Exception as e:
+            if len(changed) == 1:
+                self._skip(changed[0], e)
+                return
+            # まとめて予測できなければ1件ずつ予測し直し、失敗した物件だけを飛ばす
+            for property_data in changed:
+                self.observe([property_data])
+            return
+        now = datetime.now().isoformat(timespec='seconds')
+        for property_data, predicted, rate in zip(changed, scored['predicted_rent'], scored['discount_rate']):
+            try:
+                self._record(property_data, predicted, rate, now)
+            except Exception as e:
+                self._skip(property_data, e)
+
+    def _record(self, property_data, predicted, rate, detected_at):
+        self.seen[property_data['detail_url']] = price_key(property_data)
+        self.scored += 1
+        if pd.isna(rate):  # 家賃が取れていない
+            return
+        entry = {field: property_data.get(field) for field in ENTRY_FIELDS}
+        entry.update(area_name=self.area_name(property_data.get('address')), predicted_rent=float(predicted),
+                     discount_rate=float(rate), model_version=self.model.version, detected_at=detected_at)
+        self._update_top(entry)
+        if rate <= -self.threshold:
+            self._alert(entry)
+
+    def _skip(self, property_data, error):
+        self.errors += 1
+        detail = f"{property_data.get('detail_url')}: {type(error).__name__}: {error}"
+        METRICS.error('bargains.errors', detail)
+        self.log(f"[bargain] skipped {detail}")
+
+    def _update_top(self, entry):
+        url = entry['detail_url']
+        # 価格が変わった物件が既に上位にあれば、古い値を取り除く（ヒープは top_k 件なので作り直しても軽い）
+        old_area = self.in_top.pop(url, None)
+        if old_area is not None:
+            heap = [item for item in self.heaps[old_area] if item[1] != url]
+            heapq.heapify(heap)
+            self.heaps[old_area] = heap
+        heap = self.heaps.setdefault(entry['area_name'], [])
+        item = (-entry['discount_rate'], url, entry)
+        if len(heap) < self.top_k:
+            heapq.heappush(heap, item)
+        elif item[:2] > heap[0][:2]:
+            _, dropped_url, _ = heapq.heapreplace(heap, item)
+            del self.in_top[dropped_url]
+        else:
+            return
+        self.in_top[url] = entry['area_name']
+
+    def _alert(self, entry):
+        self.alerts += 1
+        self.alert_file.write(json.dumps(dict(entry, threshold=self.threshold), ensure_ascii=False) + '\n')
+        self.alert_file.flush()
+        self.log(f"[bargain] {entry['area_name']} {entry['building_name']} {entry['layout']} "
+                 f"{entry['rent']}万円 (予測 {entry['predicted_rent']:.1f}万円, {entry['discount_rate']:+.1%}) "
+                 f"{entry['detail_url']}")
+
+    def top(self):
+        """エリアごとの割安物件の上位（割安な順）"""
+        return {area: [entry for _, _, entry in sorted(heap, key=lambda item: item[:2], reverse=True)]
+                for area, heap in sorted(self.heaps.items())}
+
+    def load_top(self, path):
+        """前回保存した上位を読み込む。予測し直さない物件も上位に残すため（同じモデルの結果だけ使う）"""
+        if not os.path.exists(path):
+            return
+        with open(path, encoding='utf-8') as f:
+            for entries in json.load(f).values():
+                for entry in entries:
+                    if entry.get('model_version') == self.model.version:
+                        self._update_top(entry)
+
+    def save_top(self, path):
+        _write_json(self.top(), path, indent=1)
+
+    def close(self):
+        self.save_seen()
+        self.alert_file.close()
+
+def _write_json(data, path, indent=None):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp_path, path)
@@ -0,0 +1,81 @@
+import argparse
+import time
+from functools import partial
+
+from tqdm import tqdm
+
+import suumo_scraper
+from suumo_scraper import SEARCH_PATH_TEMPLATE, fetch_parsed, fetch_details, get_parsers
+from async_crawler import AsyncCrawler
+from http_client import ResponseCache
+from stub_server import start_stub_server
+
+def build_bench_start_urls(root, n_queries):
+    """ベンチマーク用の検索開始URLを n_queries 件作成する"""
+    start_urls = []
+    for i in range(n_queries):
+        path = SEARCH_PATH_TEMPLATE.format(pref_code="13", area_code="13113", min_rent=i, max_rent=i + 1)
+        start_urls.append((f"query {i}", root + path))
+    return start_urls
+
+def crawl_serial_bench(start_urls, root, parser='bs4'):
+    """既存の逐次クロールと同じ手順で start_urls をたどる"""
+    total_properties = []
+    listing_parser, detail_parser = get_parsers(parser)
+    for _, current_url in start_urls:
+        with tqdm(leave=False) as pbar_details:
+            while current_url:
+                listing = fetch_parsed(current_url, partial(listing_parser, root=root))
+                if not listing:
+                    break
+                properties = fetch_details(listing['properties'], pbar_details, detail_parser=detail_parser)
+                if not properties:
+                    break
+                total_properties.extend(properties)
+                current_url = listing['next_url']
+    return total_properties
+
+def main():
+    parser = argparse.ArgumentParser(description="保存済みHTMLを返すスタブサーバーに対してクロールの速度を計測する")
+    parser.add_argument('corpus_dir', help="listing*.html と detail*.html を置いたディレクトリ")
+    parser.add_argument('--queries', type=int, default=4)
+    parser.add_argument('--pages', type=int, default=3, help="検索条件あたりの一覧ページ数")
+    parser.add_argument('--latency', type=float, default=0.05, help="スタブサーバーの応答遅延（秒）")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rps', type=float, default=200.0)
+    parser.add_argument('--parser', choices=['bs4', 'lxml'], default='bs4')
+    parser.add_argument('--parse-workers', type=int, default=0)
+    parser.add_argument('--parse-queue-depth', type=int, default=None)
+    parser.add_argument('--skip-serial', action='store_true')
+    parser.add_argument('--cache-dir', default=None, help="指定すると条件付きリクエスト用のキャッシュを使う（2回目以降の計測用）")
+    args = parser.parse_args()
+
+    server, root = start_stub_server(args.corpus_dir, max_pages=args.pages, latency=args.latency)
+    start_urls = build_bench_start_urls(root, args.queries)
+    cache = ResponseCache(args.cache_dir) if args.cache_dir else None
+    try:
+        if not args.skip_serial:
+            # 逐次モードは待機時間を0にして通信と解析のみを計測する
+            suumo_scraper.REQUEST_INTERVAL = 0
+            suumo_scraper.HTTP_CLIENT.cache = cache
+            start = time.perf_counter()
+            serial = crawl_serial_bench(start_urls, root, args.parser)
+            elapsed = time.perf_counter() - start
+            print(f"serial: {len(serial)} properties in {elapsed:.2f}s ({len(serial) / elapsed:.1f} properties/s)")
+            print(f"  {suumo_scraper.HTTP_CLIENT.report()}")
+
+        crawler = AsyncCrawler(concurrency=args.concurrency, rps=args.rps, root=root, cache=cache,
+                               parser=args.parser, parse_workers=args.parse_workers,
+                               parse_queue_depth=args.parse_queue_depth)
+        start = time.perf_counter()
+        results = crawler.run(start_urls)
+        elapsed = time.perf_counter() - start
+        print(f"async (concurrency={args.concurrency}, rps={args.rps}): "
+              f"{len(results)} properties in {elapsed:.2f}s ({len(results) / elapsed:.1f} properties/s)")
+        print(f"  {crawler.report()}")
+        print(f"  {crawler.stage_report()}")
+    finally:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
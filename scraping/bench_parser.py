@@ -0,0 +1,56 @@
+import argparse
+import time
+from itertools import islice
+
+from html_archive import HtmlArchive
+from stub_server import load_corpus
+from suumo_scraper import get_parsers
+
+def time_parser(parser, pages, repeat):
+    """pages を repeat 回解析し、(秒, 最後の解析結果のリスト) を返す"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [parser(page) for page in pages]
+    return time.perf_counter() - start, results
+
+def main():
+    parser = argparse.ArgumentParser(description="保存済みHTMLに対して解析バックエンドの速度を比較する")
+    parser.add_argument('corpus_dir', nargs='?', help="listing*.html と detail*.html を置いたディレクトリ")
+    parser.add_argument('--archive-dir', default=None, help="corpus_dir の代わりにHTMLアーカイブのページを使う")
+    parser.add_argument('--limit', type=int, default=200, help="アーカイブから読み込む種別ごとのページ数")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--backends', nargs='+', default=['bs4', 'lxml'])
+    args = parser.parse_args()
+
+    if args.archive_dir:
+        archive = HtmlArchive(args.archive_dir)
+        listing_pages = [archive.read(entry) for entry in islice(archive.iter_index('listing'), args.limit)]
+        detail_pages = [archive.read(entry) for entry in islice(archive.iter_index('detail'), args.limit)]
+    elif args.corpus_dir:
+        listing_pages, detail_pages = load_corpus(args.corpus_dir)
+        listing_pages = [page.decode('utf-8') for page in listing_pages]
+        detail_pages = [page.decode('utf-8') for page in detail_pages]
+    else:
+        parser.error("corpus_dir か --archive-dir のどちらかを指定してください")
+    print(f"corpus: {len(listing_pages)} listing pages, {len(detail_pages)} detail pages, repeat={args.repeat}")
+
+    outputs = {}
+    for backend in args.backends:
+        listing_parser, detail_parser = get_parsers(backend)
+        listing_time, listings = time_parser(listing_parser, listing_pages, args.repeat)
+        detail_time, details = time_parser(detail_parser, detail_pages, args.repeat)
+        n_listing = len(listing_pages) * args.repeat
+        n_detail = len(detail_pages) * args.repeat
+        print(f"{backend:>5}: listing {listing_time / n_listing * 1000:.2f} ms/page, "
+              f"detail {detail_time / n_detail * 1000:.2f} ms/page")
+        outputs[backend] = (listings, details)
+
+    # 最初のバックエンドを基準に解析結果が一致するかを確認する
+    base = args.backends[0]
+    for backend in args.backends[1:]:
+        listing_diff = sum(a != b for a, b in zip(outputs[base][0], outputs[backend][0]))
+        detail_diff = sum(a != b for a, b in zip(outputs[base][1], outputs[backend][1]))
+        print(f"{backend} vs {base}: {listing_diff} listing pages and {detail_diff} detail pages differ")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import raw_file_path  # noqa: F401  raw_file/ を sys.path に加える
+from suumo_scraper import SUUMO_ROOT, get_parsers
+from async_crawler import AsyncCrawler
+from stub_server import start_synthetic_server
+from synthetic_corpus import SyntheticCorpus
+# 前処理・学習・予測は raw_file/ のスクリプトをそのまま実行する
+from metrics import METRICS, REPORT_PATH_ENV, instrument
+from pipeline import REPO_ROOT, read_report
+
+# ステージごとの基準値（設定ごと）と、最後の実行結果の保存先。作業用のデータは WORK_DIR に置く
+BASELINE_PATH = 'data/bench/baseline.json'
+RESULTS_PATH = 'data/bench/results.json'
+WORK_DIR = 'data/bench/work'
+
+# 基準値からこの割合を超えてスループットが下がるか、ピークメモリが増えたら失敗にする
+THRESHOLD = 0.2
+
+# 取り込みの取得日。毎回同じパーティションに書くように固定する
+SCRAPE_DATE = '2024-01-01'
+
+class BenchStage:
+    """ベンチマークの1ステージ（サブプロセス1つ）
+
+    command(args, csv_path) で実行するコマンドを作る。スループットは、ステージの計測レポート (metrics.py) の
+    timer の合計時間あたりの件数。件数は counter があればレポートのカウンタ、なければ生データの行数。
+    サブプロセスで実行するので、インポートの時間は含まず、ピークメモリ (最大RSS) はステージごとに測れる。
+    """
+
+    def __init__(self, name, command, timer, counter=None, unit='rows', deps=()):
+        self.name = name
+        self.command = command
+        self.timer = timer
+        self.counter = counter
+        self.unit = unit
+        self.deps = list(deps)
+
+def _script(path, *args):
+    return [sys.executable, os.path.join(REPO_ROOT, path)] + [str(arg) for arg in args]
+
+def _worker(name, args):
+    return _script('scraping/bench_suite.py', name, '--listings', min(args.sample, args.listings),
+                   '--seed', args.seed, '--parser', args.parser, '--latency', args.latency,
+                   '--concurrency', args.concurrency, '--queries', args.queries)
+
+STAGES = [
+    BenchStage('fetch', lambda args, csv_path: _worker('fetch', args), 'bench.fetch', 'bench.fetch.records',
+               unit='records'),
+    BenchStage('parse', lambda args, csv_path: _worker('parse', args), 'bench.parse', 'bench.parse.pages',
+               unit='pages'),
+    BenchStage('import', lambda args, csv_path: _script('raw_file/dataset.py', csv_path, '--output', 'data/raw',
+                                                        '--scrape-date', SCRAPE_DATE), 'import.total'),
+    BenchStage('preprocess', lambda args, csv_path: _script('raw_file/data_preprocessing.py'), 'preprocess.total',
+               'preprocess.rows', deps=['import']),
+    BenchStage('cv', lambda args, csv_path: _script('raw_file/modeling_cv.py', '--n-jobs', args.n_jobs), 'cv.total',
+               deps=['preprocess']),
+    BenchStage('train', lambda args, csv_path: _script('raw_file/train_model.py', '--n-jobs', args.n_jobs),
+               'train.total', deps=['preprocess']),
+    BenchStage('score', lambda args, csv_path: _script('raw_file/score.py', 'batch', csv_path,
+                                                       '--output', 'data/scored.csv'),
+               'score.total', 'score.records', deps=['train']),
+]
+
+def select(names):
+    """names とその依存ステージを定義順に返す"""
+    by_name = {stage.name: stage for stage in STAGES}
+    needed = set()
+
+    def visit(name):
+        if name not in by_name:
+            raise SystemExit(f'Unknown stage: {name} (stages: {", ".join(by_name)})')
+        if name not in needed:
+            needed.add(name)
+            for dep in by_name[name].deps:
+                visit(dep)
+
+    for name in names or by_name:
+        visit(name)
+    return [stage for stage in STAGES if stage.name in needed]
+
+# --- サブプロセスで実行するステージ（取得と解析） ---
+
+def run_fetch(args):
+    """合成コーパスを返すスタブサーバー（応答遅延あり）を非同期クローラでたどる"""
+    instrument('bench_fetch')
+    corpus = SyntheticCorpus(args.listings, seed=args.seed, n_queries=args.queries)
+    server, root = start_synthetic_server(corpus, latency=args.latency)
+    crawler = AsyncCrawler(concurrency=args.concurrency, rps=args.rps, root=root, parser=args.parser)
+    try:
+        with METRICS.timer('bench.fetch'):
+            records = crawler.run(corpus.start_urls(root))
+    finally:
+        server.shutdown()
+    METRICS.incr('bench.fetch.records', len(records))
+    print(f'fetch: {len(records)} records in {crawler.elapsed:.2f}s ({len(records) / crawler.elapsed:.1f} records/s)')
+    print(f'  {crawler.report()}')
+    print(f'  {crawler.stage_report()}')
+    if len(records) != len(corpus):
+        raise SystemExit(f'Expected {len(corpus)} records, got {len(records)}')
+
+def run_parse(args):
+    """合成コーパスの一覧・詳細ページを解析し、結果が生成した値と一致するかも確かめる"""
+    instrument('bench_parse')
+    corpus = SyntheticCorpus(args.listings, seed=args.seed)
+    listing_pages = [corpus.listing_page(0, page) for page in range(1, corpus.n_pages(0) + 1)]
+    detail_pages = [corpus.detail_page(i) for i in range(len(corpus))]
+    listing_parser, detail_parser = get_parsers(args.parser)
+    with METRICS.timer('bench.parse'):
+        listings = [listing_parser(page, root=SUUMO_ROOT) for page in listing_pages]
+        details = [detail_parser(page) for page in detail_pages]
+    METRICS.incr('bench.parse.pages', len(listing_pages) + len(detail_pages))
+    properties = [property_data for listing in listings for property_data in listing['properties']]
+    print(f'parse ({args.parser}): {len(listing_pages)} listing pages, {len(detail_pages)} detail pages')
+    if len(properties) != len(corpus):
+        raise SystemExit(f'Expected {len(corpus)} records, parsed {len(properties)}')
+    mismatches = sum(dict(property_data, **detail) != corpus.record(i)
+                     for i, (property_data, detail) in enumerate(zip(properties, details)))
+    if mismatches:
+        raise SystemExit(f'Parsed records differ from the generated corpus ({mismatches} records)')
+
+# --- ステージの実行と基準値との比較 ---
+
+def run_stage(command, workdir, log_path, report_path):
+    """command を workdir で実行し、(終了コード, 経過秒, 最大RSS (MB)) を返す"""
+    env = dict(os.environ, MPLBACKEND='Agg', PYTHONUNBUFFERED='1')
+    env[REPORT_PATH_ENV] = report_path
+    try:
+        os.remove(report_path)
+    except OSError:
+        pass
+    start = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        process = subprocess.Popen(command, cwd=workdir, stdout=log, stderr=subprocess.STDOUT, env=env)
+        # 子プロセスごとの最大RSSは wait4 の rusage でしか取れない（RUSAGE_CHILDREN は全ての子の最大）
+        _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss は Linux では KB、macOS ではバイト
+    peak_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return process.returncode, time.perf_counter() - start, peak_mb
+
+def measure(stage, report, n_rows):
+    """レポートからステージの件数・秒数・スループットを取り出す。取れなければ None"""
+    timer = (report or {}).get('timers', {}).get(stage.timer)
+    if not timer or not timer.get('count'):
+        return None
+    items = report['counters'].get(stage.counter, 0) if stage.counter else n_rows
+    seconds = timer['total']
+    return {'items': items, 'seconds': round(seconds, 4), 'unit': stage.unit,
+            'throughput': items / seconds if seconds else None}
+
+def prepare_corpus(args, workdir):
+    """生データのCSVを作る（同じ件数・seedのCSVがあれば使い回す）"""
+    csv_path = os.path.join(workdir, 'corpus', f'listings_{args.listings}_seed{args.seed}.csv')
+    if not os.path.exists(csv_path):
+        start = time.perf_counter()
+        SyntheticCorpus(args.listings, seed=args.seed).write_csv(csv_path + '.tmp')
+        os.replace(csv_path + '.tmp', csv_path)
+        print(f'Generated {args.listings} listings in {time.perf_counter() - start:.1f}s -> {csv_path}')
+    return csv_path
+
+def run_suite(args):
+    """ステージを順に実行し、{ステージ名: 結果} を返す。repeat 回のうち最も速い回と最も少ないメモリを採る"""
+    workdir = os.path.abspath(args.workdir)
+    stages = select(args.stages)
+    needs_data = any(stage.name not in ('fetch', 'parse') for stage in stages)
+    csv_path = prepare_corpus(args, workdir) if needs_data else None
+    # 前処理・学習の入出力 (data/) は毎回作り直す
+    shutil.rmtree(os.path.join(workdir, 'data'), ignore_errors=True)
+    for directory in ('data', 'logs', 'reports'):
+        os.makedirs(os.path.join(workdir, directory), exist_ok=True)
+
+    results = {}
+    for stage in stages:
+        if any(results.get(dep, {}).get('status') == 'failed' for dep in stage.deps):
+            results[stage.name] = {'status': 'skipped'}
+            print(f'[skip]  {stage.name}: dependency failed')
+            continue
+        log_path = os.path.join(workdir, 'logs', f'{stage.name}.log')
+        report_path = os.path.join(workdir, 'reports', f'{stage.name}.json')
+        runs = []
+        for _ in range(args.repeat):
+            returncode, wall, peak_mb = run_stage(stage.command(args, csv_path), workdir, log_path, report_path)
+            measured = measure(stage, read_report(report_path), args.listings) if returncode == 0 else None
+            if measured is None:
+                runs = None
+                break
+            runs.append(dict(measured, wall_seconds=round(wall, 2), peak_rss_mb=round(peak_mb, 1)))
+        if runs is None:
+            results[stage.name] = {'status': 'failed', 'log': log_path}
+            print(f'[fail]  {stage.name} (see {log_path})')
+            continue
+        best = max(runs, key=lambda run: run['throughput'] or 0)
+        results[stage.name] = dict(best, status='done', peak_rss_mb=min(run['peak_rss_mb'] for run in runs))
+        print(f'[done]  {stage.name}: {best["throughput"]:,.1f} {stage.unit}/s, '
+              f'{results[stage.name]["peak_rss_mb"]:,.0f} MB')
+    return results
+
+def config_of(args):
+    """結果に影響する設定。基準値はこの設定ごとに持つ"""
+    return {'listings': args.listings, 'sample': min(args.sample, args.listings), 'seed': args.seed,
+            'latency': args.latency, 'concurrency': args.concurrency, 'queries': args.queries,
+            'parser': args.parser, 'n_jobs': args.n_jobs}
+
+def config_key(config):
+    return ','.join(f'{key}={value}' for key, value in sorted(config.items()))
+
+def environment():
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'machine': platform.machine(),
+            'cpu_count': os.cpu_count()}
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """基準値と比べて、(ステージ, 指標, 基準値, 今回, 変化率, 悪化したか) のリストを返す"""
+    rows = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if result.get('status') != 'done' or not base:
+            continue
+        if base.get('throughput') and result['throughput']:
+            change = result['throughput'] / base['throughput'] - 1
+            rows.append((name, 'throughput', base['throughput'], result['throughput'], change, change < -threshold))
+        if base.get('peak_rss_mb') and result['peak_rss_mb']:
+            change = result['peak_rss_mb'] / base['peak_rss_mb'] - 1
+            rows.append((name, 'peak_rss_mb', base['peak_rss_mb'], result['peak_rss_mb'], change, change > threshold))
+    return rows
+
+def load_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_json(data, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+def print_results(results):
+    print(f"{'stage':<11} {'items':>9} {'seconds':>9} {'throughput':>16} {'peak RSS':>10}")
+    for name, result in results.items():
+        if result.get('status') != 'done':
+            print(f"{name:<11} {result['status']:>9}")
+            continue
+        throughput = f"{result['throughput']:,.1f} {result['unit']}/s"
+        print(f"{name:<11} {result['items']:>9} {result['seconds']:>8.2f}s {throughput:>16} {result['peak_rss_mb']:>7,.0f} MB")
+
+def run(args):
+    config = config_of(args)
+    results = run_suite(args)
+    print_results(results)
+    record = {'config': config, 'environment': environment(),
+              'recorded_at': datetime.now().isoformat(timespec='seconds'), 'stages': results}
+    save_json(record, args.results)
+    print(f'Results saved to {args.results}')
+    failed = [name for name, result in results.items() if result.get('status') != 'done']
+
+    baselines = load_json(args.baseline)
+    key = config_key(config)
+    if args.update_baseline:
+        if failed:
+            raise SystemExit(f'Not updating the baseline: {", ".join(failed)} failed')
+        entry = baselines.get(key, {'stages': {}})
+        baselines[key] = dict(record, stages=dict(entry['stages'], **results))
+        save_json(baselines, args.baseline)
+        print(f'Baseline updated in {args.baseline} ({key})')
+        return 0
+
+    entry = baselines.get(key)
+    if entry is None:
+        print(f'No baseline for {key} in {args.baseline}. Run with --update-baseline to record one.')
+        return 1 if failed else 0
+    if entry['environment'] != record['environment']:
+        print(f'Warning: the baseline was recorded on a different environment ({entry["environment"]})')
+    regressions = []
+    print(f"\n{'stage':<11} {'metric':<12} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, metric, base, current, change, regressed in compare(results, entry['stages'], args.threshold):
+        print(f"{name:<11} {metric:<12} {base:>12,.1f} {current:>12,.1f} {change:>+7.1%}{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(f'{name} {metric}')
+    if failed or regressions:
+        print(f'FAILED: {", ".join(failed + regressions)} (threshold {args.threshold:.0%})')
+        return 1
+    print(f'OK: no stage regressed beyond {args.threshold:.0%}')
+    return 0
+
+def add_corpus_arguments(parser):
+    parser.add_argument('--seed', type=int, default=0, help="合成コーパスの乱数のseed")
+    parser.add_argument('--parser', choices=['bs4', 'lxml'], default='lxml')
+    parser.add_argument('--latency', type=float, default=0.02, help="スタブサーバーの応答遅延（秒）")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--queries', type=int, default=4, help="取得ステージの検索条件数")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="合成したSUUMOのデータで 取得・解析・取り込み・前処理・CV・学習・予測 の各ステージを計測し、"
+                    "基準値と比べてスループットとピークメモリの悪化を検出する（ネットワークには接続しない）")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help="ベンチマークを実行して基準値と比べる")
+    run_parser.add_argument('stages', nargs='*', help=f"実行するステージ（依存も含む）。省略時は全部: "
+                                                      f"{', '.join(stage.name for stage in STAGES)}")
+    run_parser.add_argument('--listings', type=int, default=10_000, help="生データの件数（1万〜100万件を想定）")
+    run_parser.add_argument('--sample', type=int, default=2000, help="取得・解析ステージで扱う部屋数")
+    run_parser.add_argument('--n-jobs', type=int, default=os.cpu_count() or 1, help="CV・学習のスレッド数")
+    run_parser.add_argument('--repeat', type=int, default=3, help="各ステージの実行回数（短いステージは揺れが大きいので最良の回を採る）")
+    run_parser.add_argument('--threshold', type=float, default=THRESHOLD, help="悪化とみなす変化率")
+    run_parser.add_argument('--baseline', default=BASELINE_PATH)
+    run_parser.add_argument('--results', default=RESULTS_PATH)
+    run_parser.add_argument('--workdir', default=WORK_DIR, help="生成したCSVと各ステージのデータ・ログの置き場所")
+    run_parser.add_argument('--update-baseline', action='store_true', help="今回の結果を基準値として保存する")
+    add_corpus_arguments(run_parser)
+    for name, help_text in (('fetch', "合成コーパスのスタブサーバーをクロールする（run から呼ばれる）"),
+                            ('parse', "合成コーパスのページを解析する（run から呼ばれる）")):
+        worker_parser = subparsers.add_parser(name, help=help_text)
+        worker_parser.add_argument('--listings', type=int, default=2000)
+        worker_parser.add_argument('--rps', type=float, default=10_000.0)
+        add_corpus_arguments(worker_parser)
+    args = parser.parse_args()
+
+    if args.command == 'fetch':
+        run_fetch(args)
+    elif args.command == 'parse':
+        run_parse(args)
+    else:
+        sys.exit(run(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import json
+import os
+import time
+
+class CrawlCheckpoint:
+    """クロールの進捗（フロンティア）をJSONファイルに保存し、中断したところから再開できるようにする
+
+    frontier: 検索開始URL → 次に取得する一覧ページのURL（最後まで取得済みならNone）
+    pending: 一覧ページから取り出したが、まだ書き出していない物件（detail_url → 物件情報）
+    """
+
+    def __init__(self, path, min_interval=1.0):
+        self.path = path
+        self.min_interval = min_interval
+        self.frontier = {}
+        self.pending = {}
+        self.saved_at = 0.0
+
+    def load(self):
+        """保存済みのチェックポイントを読み込み、読み込めたらTrueを返す"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        self.frontier = state.get('frontier', {})
+        self.pending = state.get('pending', {})
+        return True
+
+    def save(self, force=False):
+        """状態を一時ファイル経由で書き換える。force でなければ min_interval 秒に1回まで"""
+        now = time.monotonic()
+        if not force and now - self.saved_at < self.min_interval:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'frontier': self.frontier, 'pending': self.pending}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.saved_at = now
+
+    def resume_url(self, start_url):
+        """start_url の検索で次に取得する一覧ページのURL。取得済みならNone"""
+        return self.frontier.get(start_url, start_url)
+
+    def advance(self, start_url, next_url, properties):
+        """一覧ページを解析したら、その物件を未書き出しに加えてフロンティアを次のページに進める"""
+        for property_data in properties:
+            self.pending[property_data['detail_url']] = property_data
+        self.frontier[start_url] = next_url
+        self.save()
+
+    def mark_written(self, properties):
+        """RecordWriter の on_flush から呼ばれ、書き出しが終わった物件を未書き出しから外す"""
+        for property_data in properties:
+            self.pending.pop(property_data['detail_url'], None)
+        self.save()
+
+    def take_pending(self):
+        """再開時に、前回書き出せなかった物件を取り出す"""
+        return list(self.pending.values())
+
+    def finish(self):
+        """最後まで完了したらチェックポイントを削除する"""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
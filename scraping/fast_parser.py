@@ -0,0 +1,133 @@
+import re
+
+from lxml import etree, html as lxml_html
+
+from suumo_scraper import SUUMO_ROOT
+
+# 解析結果の形式を変えたら上げる（キャッシュ済みの解析結果を使わなくなる）
+PARSER_VERSION = 1
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+# 一覧ページ用のXPath（コンパイル済み）
+CASSETTE_ITEMS = etree.XPath(f".//div[{_has_class('cassetteitem')}]")
+BUILDING_NAME = etree.XPath(f".//div[{_has_class('cassetteitem_content-title')}]")
+ADDRESS = etree.XPath(f".//li[{_has_class('cassetteitem_detail-col1')}]")
+TRANSPORTATIONS = etree.XPath(f".//div[{_has_class('cassetteitem_detail-text')}]")
+AGE_AND_FLOORS = etree.XPath(f".//li[{_has_class('cassetteitem_detail-col3')}]/div")
+TABLE_ROWS = etree.XPath(f".//tr[{_has_class('js-cassette_link')}]")
+DETAIL_HREF = etree.XPath(f".//a[{_has_class('js-cassette_link_href')}]/@href")
+RENT = etree.XPath(f".//span[{_has_class('cassetteitem_price--rent')}]")
+ADMIN_FEE = etree.XPath(f".//span[{_has_class('cassetteitem_price--administration')}]")
+DEPOSIT = etree.XPath(f".//span[{_has_class('cassetteitem_price--deposit')}]")
+GRATUITY = etree.XPath(f".//span[{_has_class('cassetteitem_price--gratuity')}]")
+LAYOUT = etree.XPath(f".//span[{_has_class('cassetteitem_madori')}]")
+AREA = etree.XPath(f".//span[{_has_class('cassetteitem_menseki')}]")
+NEXT_PAGE_HREF = etree.XPath(f".//p[{_has_class('pager_next')}]//a/@href")
+
+# 詳細ページ用のXPath
+VIEW_TABLE_ROWS = etree.XPath(f".//table[{_has_class('property_view_table')}]//tr")
+EQUIPMENT_SECTION = etree.XPath(".//div[@id='bkdt-option']")
+
+# 設備フラグの列名と検索文字列。1回の正規表現走査で全フラグを判定する
+AMENITY_FLAGS = [
+    ('has_separate_bath_toilet', 'バス・トイレ別'),
+    ('has_reheating', '追焚機能'),
+    ('has_bathroom_dryer', '浴室乾燥機'),
+    ('has_autolock', 'オートロック'),
+    ('has_tv_intercom', 'TVモニタ付インターホン'),
+    ('has_delivery_box', '宅配ボックス'),
+    ('has_pet_allowed', 'ペット相談'),
+    ('has_musical_instruments_allowed', '楽器相談'),
+    ('has_free_internet', 'インターネット無料'),
+    ('has_system_kitchen', 'システムキッチン'),
+    ('has_gas_stove_gt2', 'コンロ二口以上'),
+    ('is_top_floor', '最上階'),
+    ('is_corner_room', '角部屋'),
+]
+AMENITY_COLUMNS = {pattern: column for column, pattern in AMENITY_FLAGS}
+AMENITY_PATTERN = re.compile('|'.join(re.escape(pattern) for _, pattern in AMENITY_FLAGS))
+
+NON_NUMERIC = re.compile(r'[^\d.]')
+NON_DIGIT = re.compile(r'[^\d]')
+
+def _document(html):
+    """HTMLを解析する。空白だけ・コメントだけなど要素のない本文は None を返す（lxml は ParserError を送出する）"""
+    try:
+        return lxml_html.fromstring(html)
+    except etree.ParserError:
+        return None
+
+def _text(elements):
+    """最初の要素のテキストを返す（BeautifulSoupの .text.strip() 相当）"""
+    return elements[0].text_content().strip()
+
+def _fee(text, pattern, cast):
+    return 0 if text == '-' else cast(pattern.sub('', text))
+
+def parse_listing(html, root=SUUMO_ROOT):
+    """一覧ページを1回だけ解析し、物件のリストと次ページのURLを返す（suumo_scraper.parse_listing と同じ形式）"""
+    doc = _document(html)
+    if doc is None:
+        return {'properties': [], 'next_url': None}
+    properties = []
+    for item in CASSETTE_ITEMS(doc):
+        try:
+            building_name = _text(BUILDING_NAME(item))
+            address = _text(ADDRESS(item))
+            transportations = [t.text_content().strip() for t in TRANSPORTATIONS(item)]
+            age_and_floors = AGE_AND_FLOORS(item)
+            age = age_and_floors[0].text_content().strip()
+            floors = age_and_floors[1].text_content().strip()
+        except IndexError:
+            continue
+        for row in TABLE_ROWS(item):
+            try:
+                rent = float(NON_NUMERIC.sub('', _text(RENT(row))))
+                layout = _text(LAYOUT(row))
+                properties.append({
+                    'building_name': building_name, 'address': address,
+                    'transportation_1': transportations[0] if len(transportations) > 0 else None,
+                    'transportation_2': transportations[1] if len(transportations) > 1 else None,
+                    'transportation_3': transportations[2] if len(transportations) > 2 else None,
+                    'age': age, 'floors': floors, 'rent': rent,
+                    'admin_fee': _fee(_text(ADMIN_FEE(row)), NON_DIGIT, int),
+                    'deposit': _fee(_text(DEPOSIT(row)), NON_NUMERIC, float),
+                    'gratuity': _fee(_text(GRATUITY(row)), NON_NUMERIC, float),
+                    'layout': layout, 'area': _text(AREA(row)).replace('m2', ''),
+                    'detail_url': root + DETAIL_HREF(row)[0],
+                })
+            except (IndexError, ValueError):
+                continue
+    next_href = NEXT_PAGE_HREF(doc)
+    return {'properties': properties, 'next_url': root + next_href[0] if next_href else None}
+
+def parse_detail_page(html):
+    """詳細ページを1回だけ解析して追加情報を抽出する（suumo_scraper.parse_detail_page と同じ項目）
+    設備フラグは「部屋の特徴・設備」欄だけを走査する。欄が見つからない場合はページ全体のテキストを走査する
+    """
+    doc = _document(html)
+    if doc is None:
+        # bs4 版と同じく、空のページでは設備フラグだけを0で返す
+        return {column: 0 for column, _ in AMENITY_FLAGS}
+    details = {}
+    for row in VIEW_TABLE_ROWS(doc):
+        th = row.find('th')
+        td = row.find('td')
+        if th is None or td is None:
+            continue
+        header = th.text_content().strip()
+        value = td.text_content().strip()
+        if '構造' in header:
+            details['structure'] = value
+        elif '階' in header and '階建' in header:
+            details['floor_number'] = value.split('/')[1] if '/' in value else value
+        elif '向き' in header:
+            details['direction'] = value
+    section = EQUIPMENT_SECTION(doc)
+    features_text = section[0].text_content() if section else doc.text_content()
+    found = {AMENITY_COLUMNS[match] for match in AMENITY_PATTERN.findall(features_text)}
+    for column, _ in AMENITY_FLAGS:
+        details[column] = 1 if column in found else 0
+    return details
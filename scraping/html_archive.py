@@ -0,0 +1,92 @@
+import glob
+import json
+import os
+from datetime import datetime
+
+import zstandard
+
+# 1セグメントファイルの上限サイズ（圧縮後のバイト数）
+SEGMENT_SIZE = 256 * 1024 * 1024
+
+def page_type(url):
+    """URLから一覧ページ ('listing') か詳細ページ ('detail') かを判定する"""
+    return 'listing' if '/ichiran/' in url else 'detail'
+
+class HtmlArchive:
+    """取得した生のHTMLを追記専用で保存するアーカイブ
+
+    segment-NNNNN.warc.zst に1レコード1フレームのzstd圧縮でWARC風のレコードを追記し、
+    index.jsonl に (url, 種別, セグメント, オフセット, 長さ, 取得日時) を1行ずつ記録する。
+    フレームごとに独立しているので、インデックスから任意のレコードだけを読み出せる。
+    """
+
+    def __init__(self, archive_dir, segment_size=SEGMENT_SIZE, level=3):
+        self.archive_dir = archive_dir
+        self.segment_size = segment_size
+        self.level = level
+        self.compressor = None
+        self.segment_file = None
+        self.index_file = None
+        self.segment = None
+
+    def _segment_path(self, segment):
+        return os.path.join(self.archive_dir, f"segment-{segment:05d}.warc.zst")
+
+    def _open_for_append(self):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        segments = sorted(glob.glob(os.path.join(self.archive_dir, 'segment-*.warc.zst')))
+        self.segment = int(os.path.basename(segments[-1])[8:13]) if segments else 0
+        self.segment_file = open(self._segment_path(self.segment), 'ab')
+        self.index_file = open(os.path.join(self.archive_dir, 'index.jsonl'), 'a', encoding='utf-8')
+        self.compressor = zstandard.ZstdCompressor(level=self.level)
+
+    def append(self, url, html):
+        """HTMLを1レコードとして追記する"""
+        if self.segment_file is None:
+            self._open_for_append()
+        if self.segment_file.tell() >= self.segment_size:
+            self.segment_file.close()
+            self.segment += 1
+            self.segment_file = open(self._segment_path(self.segment), 'ab')
+        fetched_at = datetime.now().isoformat(timespec='seconds')
+        body = html.encode('utf-8')
+        header = (f"WARC/1.0\r\nWARC-Type: response\r\nWARC-Target-URI: {url}\r\n"
+                  f"WARC-Date: {fetched_at}\r\nContent-Length: {len(body)}\r\n\r\n").encode('utf-8')
+        frame = self.compressor.compress(header + body + b"\r\n\r\n")
+        offset = self.segment_file.tell()
+        self.segment_file.write(frame)
+        self.segment_file.flush()
+        entry = {'url': url, 'type': page_type(url), 'segment': self.segment, 'offset': offset,
+                 'length': len(frame), 'fetched_at': fetched_at}
+        self.index_file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.index_file.flush()
+
+    def close(self):
+        for f in (self.segment_file, self.index_file):
+            if f:
+                f.close()
+        self.segment_file = self.index_file = None
+
+    def iter_index(self, kind=None):
+        """インデックスのエントリを追記順に返す。途中で書き込みが切れた最後の行は無視する"""
+        try:
+            f = open(os.path.join(self.archive_dir, 'index.jsonl'), encoding='utf-8')
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if kind is None or entry['type'] == kind:
+                    yield entry
+
+    def read(self, entry):
+        """インデックスのエントリに対応するHTMLを読み出す"""
+        with open(self._segment_path(entry['segment']), 'rb') as f:
+            f.seek(entry['offset'])
+            frame = f.read(entry['length'])
+        record = zstandard.ZstdDecompressor().decompress(frame)
+        _, body = record.split(b"\r\n\r\n", 1)
+        return body[:-4].decode('utf-8')
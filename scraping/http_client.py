@@ -0,0 +1,191 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter, namedtuple
+from functools import partial
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import raw_file_path  # noqa: F401  raw_file/ を sys.path に加える
+from html_archive import page_type
+# 計測は raw_file/metrics.py を使う（スクレイピングと学習で同じ形式のレポートを出す）
+from metrics import METRICS
+
+RETRY_STATUS = (500, 502, 503, 504)
+
+# text: HTMLの本文, not_modified: 304でキャッシュの本文を返した場合にTrue
+FetchResult = namedtuple('FetchResult', ['text', 'not_modified'])
+
+def parser_id(parser):
+    """解析結果のキャッシュを解析関数ごとに分けるための識別子（モジュール名.関数名.v<PARSER_VERSION>）
+    partial はもとの関数で識別する。解析結果の形式を変えたら、そのモジュールの PARSER_VERSION を上げる
+    """
+    func = parser.func if isinstance(parser, partial) else parser
+    version = getattr(sys.modules.get(func.__module__), 'PARSER_VERSION', 0)
+    return re.sub(r'[^\w.]+', '_', f'{func.__module__}.{func.__qualname__}.v{version}')
+
+class ResponseCache:
+    """URLをキーにレスポンス本文とETag/Last-Modified、解析結果をディスクに保存するキャッシュ"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url, suffix):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + suffix)
+
+    def _read_json(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, text):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def conditional_headers(self, url):
+        """前回のレスポンスに応じた If-None-Match / If-Modified-Since ヘッダーを返す"""
+        meta = self._read_json(self._path(url, '.json'))
+        headers = {}
+        if meta and os.path.exists(self._path(url, '.html')):
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def get_text(self, url):
+        try:
+            with open(self._path(url, '.html'), encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, url, text, etag=None, last_modified=None):
+        """本文を保存する。本文が変わったので、どの解析関数の結果も破棄する"""
+        self._write(self._path(url, '.html'), text)
+        meta = {'url': url, 'etag': etag, 'last_modified': last_modified}
+        self._write(self._path(url, '.json'), json.dumps(meta, ensure_ascii=False))
+        for path in glob.glob(glob.escape(self._path(url, '')) + '.*parsed.json'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_parsed(self, url, parser_id):
+        return self._read_json(self._path(url, f'.{parser_id}.parsed.json'))
+
+    def put_parsed(self, url, parser_id, parsed):
+        self._write(self._path(url, f'.{parser_id}.parsed.json'), json.dumps(parsed, ensure_ascii=False))
+
+class HttpClient:
+    """接続を使い回すSessionに、再試行とディスクキャッシュによる条件付きリクエストを加えたクライアント"""
+
+    def __init__(self, headers=None, cache=None, retries=3, backoff=1.0, pool_size=10, timeout=15, archive=None):
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.cache = cache
+        # HtmlArchive を設定すると、新たに取得したHTMLをすべて保存する
+        self.archive = archive
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        # fetches: 送信したリクエスト数, cache_hits: 304で本文を再利用した数,
+        # parse_skips: 解析結果を再利用した数, retries: 再試行数, failures: 最終的に失敗した数
+        self.stats = Counter()
+        # 最後に失敗したリクエストの原因（get_html などで表示する）
+        self.last_error = None
+
+    def _get(self, url, headers):
+        """5xxとタイムアウト・接続エラーは指数バックオフで再試行する"""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats['retries'] += 1
+                METRICS.incr('fetch.retries')
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            self.stats['fetches'] += 1
+            METRICS.incr('fetch.requests')
+            try:
+                with METRICS.timer('fetch.latency'):
+                    response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                self.last_error = f'{type(e).__name__}: {e}'
+                continue
+            METRICS.incr(f'fetch.status.{response.status_code}')
+            METRICS.incr('fetch.bytes', len(response.content))
+            if response.status_code in RETRY_STATUS:
+                self.last_error = f'HTTP {response.status_code}'
+                continue
+            return response
+        return None
+
+    def _fail(self, url, reason=None):
+        self.stats['failures'] += 1
+        self.last_error = reason or self.last_error
+        METRICS.error('fetch.failures', f'{url}: {self.last_error}')
+
+    def fetch(self, url):
+        """URLを取得してFetchResultを返す。失敗した場合はNoneを返す"""
+        headers = self.cache.conditional_headers(url) if self.cache else {}
+        try:
+            response = self._get(url, headers)
+            if response is None:
+                self._fail(url)
+                return None
+            if response.status_code == 304 and self.cache:
+                text = self.cache.get_text(url)
+                if text is not None:
+                    self.stats['cache_hits'] += 1
+                    return FetchResult(text, True)
+                # キャッシュ本文が消えている場合は条件なしで取り直す
+                response = self._get(url, {})
+                if response is None:
+                    self._fail(url)
+                    return None
+            response.raise_for_status()
+            response.encoding = response.apparent_encoding
+            text = response.text
+        except requests.exceptions.RequestException as e:
+            self._fail(url, f'{type(e).__name__}: {e}')
+            return None
+        if self.cache:
+            self.cache.put(url, text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        if self.archive:
+            self.archive.append(url, text)
+        return FetchResult(text, False)
+
+    def fetch_parsed(self, url, parser):
+        """URLを取得して parser で解析する。304の場合は前回の解析結果を再利用し、解析を省略する
+        parser の戻り値はJSONに変換できる値である必要がある。解析結果は parser_id(parser) ごとに保存する
+        """
+        result = self.fetch(url)
+        if result is None:
+            return None
+        if result.not_modified:
+            parsed = self.cache.get_parsed(url, parser_id(parser))
+            if parsed is not None:
+                self.stats['parse_skips'] += 1
+                return parsed
+        with METRICS.timer(f'parse.{page_type(url)}'):
+            parsed = parser(result.text)
+        if self.cache:
+            self.cache.put_parsed(url, parser_id(parser), parsed)
+        return parsed
+
+    def report(self):
+        return ', '.join(f"{key}={self.stats[key]}" for key in ('fetches', 'cache_hits', 'parse_skips', 'retries', 'failures'))
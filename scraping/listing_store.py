@@ -0,0 +1,90 @@
+import csv
+import json
+import re
+import sqlite3
+from datetime import datetime
+
+# 一覧ページで取得できる価格関連の項目。これらが変わっていなければ詳細ページは取り直さない
+PRICE_FIELDS = ('rent', 'admin_fee', 'deposit', 'gratuity')
+
+# 詳細ページの解析で必ず付与される項目。これがあれば詳細情報を取得済みとみなす
+DETAIL_MARKER = 'has_separate_bath_toilet'
+
+INTEGER_PATTERN = re.compile(r'-?\d+')
+
+def price_key(property_data):
+    return '|'.join(str(property_data.get(field)) for field in PRICE_FIELDS)
+
+class ListingStore:
+    """detail_url をキーに物件情報を保持するSQLiteのストア（差分クロール用）"""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS listings (
+                detail_url TEXT PRIMARY KEY,
+                price_key TEXT NOT NULL,
+                has_details INTEGER NOT NULL,
+                record TEXT NOT NULL,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL
+            )''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_listings_first_seen ON listings (first_seen)')
+        self.conn.commit()
+        # 詳細ページの取得を省略した件数
+        self.skipped_details = 0
+
+    def known_details(self, property_data):
+        """既知の物件で価格が変わっていなければ、前回取得した詳細情報を返す。そうでなければNone"""
+        row = self.conn.execute(
+            'SELECT price_key, has_details, record FROM listings WHERE detail_url = ?',
+            (property_data['detail_url'],)).fetchone()
+        if row is None or row[0] != price_key(property_data) or not row[1]:
+            return None
+        record = json.loads(row[2])
+        self.skipped_details += 1
+        return {key: value for key, value in record.items() if key not in property_data}
+
+    def is_empty(self):
+        return self.conn.execute('SELECT 1 FROM listings LIMIT 1').fetchone() is None
+
+    def import_csv(self, path):
+        """既存のCSVの物件をストアに取り込み、件数を返す（初めて差分クロールするとき用）
+        同じ detail_url の行が複数あれば、後の行（最後に取得した価格）を残す
+        """
+        records = {}
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                if row.get('detail_url'):
+                    records[row['detail_url']] = {key: self._csv_value(value) for key, value in row.items()}
+        self.upsert_many(list(records.values()))
+        return len(records)
+
+    @staticmethod
+    def _csv_value(value):
+        """CSVの空欄は None に、設備フラグのような整数は int に戻す（str に戻しても表記は変わらないので price_key も同じ）"""
+        if value is None or value == '':
+            return None
+        return int(value) if INTEGER_PATTERN.fullmatch(value) else value
+
+    def price_keys(self):
+        """保存済みの全物件の {detail_url: price_key}"""
+        return dict(self.conn.execute('SELECT detail_url, price_key FROM listings'))
+
+    def upsert_many(self, properties):
+        """物件情報を保存する。新規なら first_seen を、既存なら last_seen と内容を更新する"""
+        now = datetime.now().isoformat(timespec='seconds')
+        self.conn.executemany('''
+            INSERT INTO listings (detail_url, price_key, has_details, record, first_seen, last_seen)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (detail_url) DO UPDATE SET
+                price_key = excluded.price_key,
+                has_details = excluded.has_details,
+                record = excluded.record,
+                last_seen = excluded.last_seen''',
+            [(p['detail_url'], price_key(p), int(p.get(DETAIL_MARKER) is not None),
+              json.dumps(p, ensure_ascii=False), now, now) for p in properties])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,10 @@
+"""raw_file/ のモジュール（metrics, dataset, model_registry など）を import できるようにする
+
+scraping/ のモジュールは、raw_file/ のモジュールより先にこれを import する
+"""
+import os
+import sys
+
+RAW_FILE_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'raw_file'))
+if RAW_FILE_DIR not in sys.path:
+    sys.path.append(RAW_FILE_DIR)
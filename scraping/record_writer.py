@@ -0,0 +1,101 @@
+import csv
+import os
+
+from listing_store import PRICE_FIELDS, price_key
+
+def _price_value(value):
+    """CSVから読んだ文字列と解析直後の数値を同じ表記にそろえる（'1' と 1.0 を同じ値とみなす）"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+def listing_key(property_data):
+    """CSVの重複判定に使うキー。同じ物件でも価格が変われば別の行として書く"""
+    prices = {field: _price_value(property_data.get(field)) for field in PRICE_FIELDS}
+    return property_data.get('detail_url'), price_key(prices)
+
+class RecordWriter:
+    """解析済みの物件をバッチ単位でCSVやストアに書き出す
+
+    CSVには detail_url と価格（家賃・管理費・敷金・礼金）が同じ物件を二度書かない。価格が変わった物件は
+    新しい行として書く（detail_url のない物件はそのまま書く）。価格は数値にそろえて比べるので、
+    CSVから読み戻した '1' と解析した 1.0 は同じ値とみなす。既存ファイルは開くときに1回だけ読み、以降は追記のみ行う。
+    on_flush には書き込みが終わった物件のリストが渡される（チェックポイントの更新用）。
+    on_write には書き出す前のバッチがそのまま渡される（割安物件の検出用。予測をバッチ単位で行える）。
+    """
+
+    def __init__(self, output_path=None, columns=None, store=None, batch_size=100, keep=False, on_flush=None,
+                 on_write=None):
+        self.output_path = output_path
+        self.store = store
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.on_write = on_write
+        self.buffer = []
+        # keep=True の場合は書き出した物件をメモリにも残す（ストリーミングしない呼び出し元向け）
+        self.records = [] if keep else None
+        self.written = 0
+        self.duplicates = 0
+        self.file = None
+        self.writer = None
+        # CSVに書いた物件の listing_key
+        self.seen = set()
+        if output_path:
+            self._open_csv(columns)
+
+    def _open_csv(self, columns):
+        if os.path.exists(self.output_path) and os.path.getsize(self.output_path) > 0:
+            with open(self.output_path, newline='', encoding='utf-8-sig') as f:
+                reader = csv.reader(f)
+                columns = next(reader)
+                for row in reader:
+                    key = listing_key(dict(zip(columns, row)))
+                    if key[0]:
+                        self.seen.add(key)
+            self.file = open(self.output_path, 'a', newline='', encoding='utf-8-sig')
+            self.writer = csv.DictWriter(self.file, fieldnames=columns, extrasaction='ignore')
+        else:
+            os.makedirs(os.path.dirname(self.output_path) or '.', exist_ok=True)
+            self.file = open(self.output_path, 'w', newline='', encoding='utf-8-sig')
+            self.writer = csv.DictWriter(self.file, fieldnames=columns, extrasaction='ignore')
+            self.writer.writeheader()
+        self.columns = columns
+
+    def write(self, properties):
+        self.buffer.extend(properties)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        if self.on_write:
+            self.on_write(batch)
+        if self.store:
+            self.store.upsert_many(batch)
+        if self.writer:
+            for property_data in batch:
+                key = listing_key(property_data)
+                if key[0]:
+                    if key in self.seen:
+                        self.duplicates += 1
+                        continue
+                    self.seen.add(key)
+                self.writer.writerow(property_data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        if self.records is not None:
+            self.records.extend(batch)
+        self.written += len(batch)
+        if self.on_flush:
+            self.on_flush(batch)
+
+    def close(self):
+        self.flush()
+        if self.file:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,129 @@
+import json
+import math
+import os
+import re
+from datetime import datetime
+
+from suumo_scraper import AREAS, SEARCH_PATH_TEMPLATE, SUUMO_ROOT, fetch_parsed
+
+# SUUMOの賃料の下限・上限で指定できる値（万円）。0 は下限なし、9999999 は上限なし
+RENT_BOUNDARIES = ([0] + [3 + 0.5 * i for i in range(35)] + list(range(21, 31)) + [35, 40, 50, 100, 9999999])
+
+# 1ページあたりの表示件数 (検索URLの pc=50)
+ITEMS_PER_PAGE = 50
+
+HIT_COUNT_PATTERN = re.compile(r'paginate_set-hit[^>]*>\s*([\d,]+)')
+
+def parse_hit_count(html):
+    """一覧ページの検索結果件数を返す。件数表示がなければ0を返す"""
+    match = HIT_COUNT_PATTERN.search(html)
+    return int(match.group(1).replace(',', '')) if match else 0
+
+def format_rent(value):
+    return str(int(value)) if value == int(value) else str(value)
+
+def range_label(area_name, min_rent, max_rent):
+    upper = '' if max_rent >= RENT_BOUNDARIES[-1] else format_rent(max_rent)
+    return f"{area_name} ({format_rent(min_rent)}-{upper}万)"
+
+def search_url(pref_code, area_code, min_rent, max_rent, root=SUUMO_ROOT):
+    return root + SEARCH_PATH_TEMPLATE.format(pref_code=pref_code, area_code=area_code,
+                                              min_rent=format_rent(min_rent), max_rent=format_rent(max_rent))
+
+def estimated_pages(count):
+    return max(1, math.ceil(count / ITEMS_PER_PAGE))
+
+class RentPlanner:
+    """検索結果件数に応じて賃料範囲を再帰的に分割・統合し、エリアごとの検索条件を決める
+
+    各検索条件のページ数が target_pages 以下になるまで範囲を二分し、その後、
+    合計しても target_pages に収まる隣接した範囲を統合する。結果はエリアごとに
+    JSONファイルへ保存し、次回以降の実行で再利用する。件数を取得できなかった範囲は件数 None のまま
+    分割・統合せずに残し、その計画は保存しない（次回の実行で問い合わせ直す）。
+    """
+
+    def __init__(self, cache_path='data/rent_partitions.json', target_pages=20, root=SUUMO_ROOT, count_fetcher=None):
+        self.cache_path = cache_path
+        self.target_pages = target_pages
+        self.root = root
+        self.count_fetcher = count_fetcher or (lambda url: fetch_parsed(url, parse_hit_count))
+        self.probes = 0
+        self.failed_probes = 0
+
+    def load_cache(self):
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_cache(self, cache):
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        with open(self.cache_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=1)
+
+    def count(self, pref_code, area_code, lo, hi):
+        """賃料範囲 [RENT_BOUNDARIES[lo], RENT_BOUNDARIES[hi]] の件数を1ページ目から取得する。失敗したら None"""
+        self.probes += 1
+        count = self.count_fetcher(search_url(pref_code, area_code, RENT_BOUNDARIES[lo], RENT_BOUNDARIES[hi], self.root))
+        if count is None:
+            self.failed_probes += 1
+        return count
+
+    def split(self, pref_code, area_code, lo, hi, count):
+        """ページ数が目標を超える範囲を二分し、(lo, hi, 件数) の葉のリストを返す"""
+        if count is None or estimated_pages(count) <= self.target_pages or hi - lo == 1:
+            return [(lo, hi, count)]
+        mid = (lo + hi) // 2
+        left = self.count(pref_code, area_code, lo, mid)
+        # 下限・上限は両端を含むので、ちょうど mid の物件（8万円ちょうどなど）は左右の両方に入る。
+        # 親の件数との差では右半分を少なく見積もり、目標を超える範囲を見逃すため、右半分も問い合わせる
+        right = self.count(pref_code, area_code, mid, hi)
+        return (self.split(pref_code, area_code, lo, mid, left)
+                + self.split(pref_code, area_code, mid, hi, right))
+
+    def merge(self, leaves):
+        """隣接する葉を、合計ページ数が目標に収まる限り統合する（件数0の範囲は空ページ分の要求を減らせる）
+        境界の物件は両側で数えるので、合計は実際の件数より多めになる（目標を超える側には外れない）
+        """
+        merged = []
+        for lo, hi, count in leaves:
+            if (merged and count is not None and merged[-1][2] is not None
+                    and estimated_pages(merged[-1][2] + count) <= self.target_pages):
+                merged[-1] = (merged[-1][0], hi, merged[-1][2] + count)
+            else:
+                merged.append((lo, hi, count))
+        return merged
+
+    def plan_area(self, pref_code, area_code):
+        """1エリアの賃料の全範囲（下限なし〜上限なし）をカバーする (下限, 上限, 件数) のリスト"""
+        lo, hi = 0, len(RENT_BOUNDARIES) - 1
+        total = self.count(pref_code, area_code, lo, hi)
+        leaves = self.merge(self.split(pref_code, area_code, lo, hi, total))
+        return [(RENT_BOUNDARIES[lo], RENT_BOUNDARIES[hi], count) for lo, hi, count in leaves]
+
+    def plan(self, areas=AREAS, replan=False):
+        """エリアごとの賃料範囲を返す。保存済みで目標ページ数が同じものは再利用する"""
+        cache = self.load_cache()
+        partitions = {}
+        for area_name, pref_code, area_code in areas:
+            cached = cache.get(area_code)
+            if replan or not cached or cached.get('target_pages') != self.target_pages:
+                cached = {'target_pages': self.target_pages,
+                          'planned_at': datetime.now().isoformat(timespec='seconds'),
+                          'ranges': self.plan_area(pref_code, area_code)}
+                # 件数を取得できなかった範囲を含む計画は、その範囲を誤って空とみなさないよう保存しない
+                if all(count is not None for _, _, count in cached['ranges']):
+                    cache[area_code] = cached
+                    self.save_cache(cache)
+            partitions[area_code] = [tuple(r) for r in cached['ranges']]
+        return partitions
+
+def build_planned_start_urls(partitions, areas=AREAS, root=SUUMO_ROOT):
+    """plan() の結果から (進捗表示用ラベル, 検索開始URL) の一覧を作成する"""
+    start_urls = []
+    for area_name, pref_code, area_code in areas:
+        for min_rent, max_rent, _ in partitions[area_code]:
+            start_urls.append((range_label(area_name, min_rent, max_rent),
+                               search_url(pref_code, area_code, min_rent, max_rent, root)))
+    return start_urls
@@ -0,0 +1,73 @@
+import argparse
+import os
+from multiprocessing import Pool
+from urllib.parse import urlsplit
+
+import pandas as pd
+from tqdm import tqdm
+
+from html_archive import HtmlArchive
+from suumo_scraper import get_parsers
+
+# ワーカープロセスごとに1回だけ初期化する
+_archive = None
+_parsers = None
+
+def _init_worker(archive_dir, parser):
+    global _archive, _parsers
+    _archive = HtmlArchive(archive_dir)
+    _parsers = get_parsers(parser)
+
+def _parse_entry(job):
+    """(追記順の番号, インデックスのエントリ) を受け取り、(番号, 種別, URL, 解析結果) を返す"""
+    seq, entry = job
+    html = _archive.read(entry)
+    listing_parser, detail_parser = _parsers
+    if entry['type'] == 'listing':
+        # 詳細ページのURLは取得元と同じホストを基準に組み立てる
+        parts = urlsplit(entry['url'])
+        return seq, 'listing', entry['url'], listing_parser(html, root=f"{parts.scheme}://{parts.netloc}")
+    return seq, 'detail', entry['url'], detail_parser(html)
+
+def reparse(archive_dir, parser='bs4', workers=None):
+    """アーカイブのHTMLだけから物件データを再構築する（ネットワークには接続しない）
+    同じURLが複数回保存されている場合は、最後に取得したものを使う
+    """
+    jobs = list(enumerate(HtmlArchive(archive_dir).iter_index()))
+    listings = {}
+    details = {}
+    with Pool(processes=workers or os.cpu_count(), initializer=_init_worker, initargs=(archive_dir, parser)) as pool:
+        results = pool.imap_unordered(_parse_entry, jobs, chunksize=32)
+        for seq, kind, url, parsed in tqdm(results, total=len(jobs), desc="Reparsing"):
+            if kind == 'listing':
+                for property_data in parsed['properties']:
+                    current = listings.get(property_data['detail_url'])
+                    if current is None or current[0] < seq:
+                        listings[property_data['detail_url']] = (seq, property_data)
+            elif url not in details or details[url][0] < seq:
+                details[url] = (seq, parsed)
+
+    properties = []
+    for detail_url, (_, property_data) in listings.items():
+        if detail_url in details:
+            property_data.update(details[detail_url][1])
+        properties.append(property_data)
+    return properties
+
+def main():
+    parser = argparse.ArgumentParser(description="保存済みのHTMLアーカイブから物件データを作り直す")
+    parser.add_argument('--archive-dir', default='data/html_archive')
+    parser.add_argument('--parser', choices=['bs4', 'lxml'], default='bs4')
+    parser.add_argument('--workers', type=int, default=None, help="解析に使うプロセス数（既定は全コア）")
+    parser.add_argument('--output', default='data/suumo_data_final.csv')
+    args = parser.parse_args()
+
+    properties = reparse(args.archive_dir, parser=args.parser, workers=args.workers)
+    if properties:
+        pd.DataFrame(properties).to_csv(args.output, index=False, encoding='utf-8-sig')
+        print(f"A total of {len(properties)} unique properties were saved to {args.output}")
+    else:
+        print("No properties were found in the archive.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import glob
+import os
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+def load_corpus(corpus_dir):
+    """保存済みのSUUMOのHTML（listing*.html, detail*.html）を読み込む"""
+    def read_all(pattern):
+        pages = []
+        for path in sorted(glob.glob(os.path.join(corpus_dir, pattern))):
+            with open(path, 'rb') as f:
+                pages.append(f.read())
+        return pages
+    listing_pages = read_all('listing*.html')
+    detail_pages = read_all('detail*.html')
+    if not listing_pages or not detail_pages:
+        raise FileNotFoundError(f"listing*.html と detail*.html が {corpus_dir} に見つかりません")
+    return listing_pages, detail_pages
+
+def _make_handler(render, latency):
+    class StubHandler(BaseHTTPRequestHandler):
+        """render(パス) が返すページを返す。None なら404を返すので、クローラはそこで打ち切られる
+        本文のCRC32をETagとして返し、If-None-Match が一致すれば304を返す
+        """
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            body = render(self.path)
+            if body is None:
+                self.send_error(404)
+                return
+            etag = '"%08x"' % zlib.crc32(body)
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+def make_handler(listing_pages, detail_pages, max_pages, latency):
+    """一覧URLには page パラメータに応じた一覧ページを、それ以外には詳細ページを返すハンドラ
+    max_pages を超えるページは404を返す
+    """
+    def render(path):
+        parsed = urlparse(path)
+        if 'ichiran' in parsed.path:
+            page = int(parse_qs(parsed.query).get('page', ['1'])[0])
+            if page > max_pages:
+                return None
+            body = listing_pages[(page - 1) % len(listing_pages)]
+            # 保存時のページ番号に関係なく、次ページのリンクが page+1 を指すように書き換える
+            return re.sub(rb'([?&](?:amp;)?page=)\d+', lambda m: m.group(1) + str(page + 1).encode(), body)
+        return detail_pages[zlib.crc32(path.encode()) % len(detail_pages)]
+
+    return _make_handler(render, latency)
+
+def _serve(handler, port):
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def start_stub_server(corpus_dir, max_pages=3, latency=0.0, port=0):
+    """スタブサーバーを別スレッドで起動し、(server, ルートURL) を返す"""
+    listing_pages, detail_pages = load_corpus(corpus_dir)
+    return _serve(make_handler(listing_pages, detail_pages, max_pages, latency), port)
+
+def start_synthetic_server(corpus, latency=0.0, port=0):
+    """synthetic_corpus.SyntheticCorpus のページをその場で作って返すスタブサーバーを起動し、(server, ルートURL) を返す"""
+    return _serve(_make_handler(corpus.render, latency), port)
@@ -1,13 +1,23 @@
-import requests
 from bs4 import BeautifulSoup
-import pandas as pd
 import time
 from tqdm import tqdm
 import re
+import argparse
 import os
 
+import raw_file_path  # noqa: F401  raw_file/ を sys.path に加える
+from http_client import HttpClient, ResponseCache
+from metrics import METRICS, add_arguments as add_metrics_arguments, instrument
+from listing_store import ListingStore
+from html_archive import HtmlArchive
+from record_writer import RecordWriter
+from checkpoint import CrawlCheckpoint
+
+SUUMO_ROOT = "https://suumo.jp"
+
 # SUUMOの検索結果URLのテンプレート（賃料範囲を指定可能に）
-BASE_URL_TEMPLATE = "https://suumo.jp/jj/chintai/ichiran/FR301FC001/?ar=030&bs=040&ta={pref_code}&sc={area_code}&cb={min_rent}&ct={max_rent}&mb=0&mt=9999999&et=9999999&cn=9999999&shkr1=03&shkr2=03&shkr3=03&shkr4=03&sngz=&po1=25&pc=50"
+SEARCH_PATH_TEMPLATE = "/jj/chintai/ichiran/FR301FC001/?ar=030&bs=040&ta={pref_code}&sc={area_code}&cb={min_rent}&ct={max_rent}&mb=0&mt=9999999&et=9999999&cn=9999999&shkr1=03&shkr2=03&shkr3=03&shkr4=03&sngz=&po1=25&pc=50"
+BASE_URL_TEMPLATE = SUUMO_ROOT + SEARCH_PATH_TEMPLATE
 
 # 収集対象のエリアリスト
 AREAS = [
@@ -23,20 +33,54 @@ AREAS = [
 # 収集対象の賃料範囲リスト (下限, 上限) 単位：万円
 RENT_RANGES = [(i, i + 2) for i in range(5, 30, 2)] # 5-7万, 7-9万, ..., 29-31万
 
+# 出力CSVの列（一覧ページの項目 + 詳細ページの項目）
+OUTPUT_COLUMNS = [
+    'building_name', 'address', 'transportation_1', 'transportation_2', 'transportation_3',
+    'age', 'floors', 'rent', 'admin_fee', 'deposit', 'gratuity', 'layout', 'area', 'detail_url',
+    'structure', 'floor_number', 'direction',
+    'has_separate_bath_toilet', 'has_reheating', 'has_bathroom_dryer', 'has_autolock', 'has_tv_intercom',
+    'has_delivery_box', 'has_pet_allowed', 'has_musical_instruments_allowed', 'has_free_internet',
+    'has_system_kitchen', 'has_gas_stove_gt2', 'is_top_floor', 'is_corner_room',
+]
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+# 逐次モードでのリクエスト間隔（秒）
+REQUEST_INTERVAL = 2
+
+# 解析結果の形式を変えたら上げる（キャッシュ済みの解析結果を使わなくなる）
+PARSER_VERSION = 1
+
+# 接続を使い回すHTTPクライアント（__main__ でキャッシュを設定する）
+HTTP_CLIENT = HttpClient(headers=HEADERS)
+
+def build_start_urls(root=SUUMO_ROOT):
+    """(進捗表示用ラベル, 検索開始URL) の一覧を作成する"""
+    start_urls = []
+    for min_rent, max_rent in RENT_RANGES:
+        for area_name, pref_code, area_code in AREAS:
+            path = SEARCH_PATH_TEMPLATE.format(pref_code=pref_code, area_code=area_code, min_rent=min_rent, max_rent=max_rent)
+            start_urls.append((f"{area_name} ({min_rent}-{max_rent}万)", root + path))
+    return start_urls
+
 def get_html(url):
-    """指定されたURLからHTMLコンテンツを取得する"""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
-    try:
-        time.sleep(2) # サーバー負荷軽減のため2秒待機
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        response.encoding = response.apparent_encoding
-        return response.text
-    except requests.exceptions.RequestException as e:
-        # print(f"\nError fetching {url}: {e}") # ログが多すぎるのでコメントアウト
+    """指定されたURLからHTMLコンテンツを取得する。失敗した場合は原因を表示してNoneを返す"""
+    time.sleep(REQUEST_INTERVAL) # サーバー負荷軽減のため待機
+    result = HTTP_CLIENT.fetch(url)
+    if result is None:
+        tqdm.write(f"Failed to fetch {url}: {HTTP_CLIENT.last_error}")
         return None
+    return result.text
+
+def fetch_parsed(url, parser):
+    """URLを取得して解析する。304の場合は前回の解析結果を再利用する。失敗した場合は原因を表示する"""
+    time.sleep(REQUEST_INTERVAL) # サーバー負荷軽減のため待機
+    parsed = HTTP_CLIENT.fetch_parsed(url, parser)
+    if parsed is None:
+        tqdm.write(f"Failed to fetch {url}: {HTTP_CLIENT.last_error}")
+    return parsed
 
 def parse_detail_page(html):
     """詳細ページから追加情報を抽出する"""
@@ -76,8 +120,8 @@ def parse_detail_page(html):
     details['is_corner_room'] = 1 if '角部屋' in features_html else 0
     return details
 
-def parse_properties(html, pbar_details):
-    """HTMLから物件情報のリストを抽出する"""
+def parse_listing_page(html, root=SUUMO_ROOT):
+    """一覧ページから物件情報のリストを抽出する（詳細ページは取得しない）"""
     soup = BeautifulSoup(html, 'lxml')
     properties = []
     cassette_items = soup.find_all('div', class_='cassetteitem')
@@ -93,7 +137,7 @@ def parse_properties(html, pbar_details):
         for row in table_rows:
             try:
                 detail_url_relative = row.find('a', class_='js-cassette_link_href')['href']
-                detail_url = "https://suumo.jp" + detail_url_relative
+                detail_url = root + detail_url_relative
                 rent_text = row.find('span', class_='cassetteitem_price--rent').text.strip()
                 rent = float(re.sub(r'[^\d.]', '', rent_text))
                 admin_fee_text = row.find('span', class_='cassetteitem_price--administration').text.strip()
@@ -113,63 +157,213 @@ def parse_properties(html, pbar_details):
                     'deposit': deposit, 'gratuity': gratuity, 'layout': layout, 'area': area,
                     'detail_url': detail_url
                 }
-                detail_html = get_html(detail_url)
-                if detail_html:
-                    pbar_details.update(1)
-                    additional_details = parse_detail_page(detail_html)
-                    property_data.update(additional_details)
                 properties.append(property_data)
             except (AttributeError, ValueError, TypeError):
                 continue
     return properties
 
-def get_next_page_url(html):
+def fetch_details(properties, pbar_details, store=None, detail_parser=parse_detail_page):
+    """各物件の詳細ページを取得し、追加情報を物件情報に付与する
+    store を渡すと、既知で価格が変わっていない物件は保存済みの詳細情報を使い、取得を省略する
+    """
+    for property_data in properties:
+        known_details = store.known_details(property_data) if store else None
+        if known_details is not None:
+            property_data.update(known_details)
+            continue
+        additional_details = fetch_parsed(property_data['detail_url'], detail_parser)
+        if additional_details:
+            pbar_details.update(1)
+            property_data.update(additional_details)
+    return properties
+
+def parse_properties(html, pbar_details, root=SUUMO_ROOT):
+    """HTMLから物件情報のリストを抽出し、各物件の詳細ページも取得する"""
+    return fetch_details(parse_listing_page(html, root=root), pbar_details)
+
+def parse_listing(html, root=SUUMO_ROOT):
+    """一覧ページから物件のリストと次ページのURLを抽出する"""
+    return {'properties': parse_listing_page(html, root=root), 'next_url': get_next_page_url(html, root=root)}
+
+def get_next_page_url(html, root=SUUMO_ROOT):
     """次のページのURLを取得する"""
     soup = BeautifulSoup(html, 'lxml')
     next_page_container = soup.find('p', class_='pager_next')
     if next_page_container:
         next_page_tag = next_page_container.find('a')
         if next_page_tag and 'href' in next_page_tag.attrs:
-            return "https://suumo.jp" + next_page_tag['href']
+            return root + next_page_tag['href']
     return None
 
-if __name__ == "__main__":
-    output_path = 'data/suumo_data_final.csv'
-    total_properties = []
+def get_parsers(backend='bs4'):
+    """(一覧ページの解析関数, 詳細ページの解析関数) を返す
+    'bs4': BeautifulSoupによる従来の解析, 'lxml': コンパイル済みXPathで1回だけ解析する fast_parser
+    """
+    if backend == 'lxml':
+        import fast_parser
+        return fast_parser.parse_listing, fast_parser.parse_detail_page
+    if backend == 'bs4':
+        return parse_listing, parse_detail_page
+    raise ValueError(f"Unknown parser backend: {backend}")
 
-    # 賃料範囲でループ
-    for min_rent, max_rent in tqdm(RENT_RANGES, desc="Overall Rent Progress"):
-        # エリアでループ
-        for area_name, pref_code, area_code in AREAS:
-            start_url = BASE_URL_TEMPLATE.format(pref_code=pref_code, area_code=area_code, min_rent=min_rent, max_rent=max_rent)
-            current_url = start_url
-            
-            progress_desc = f"{area_name} ({min_rent}-{max_rent}万)"
-            with tqdm(desc=progress_desc, leave=False) as pbar_details:
-                while current_url:
-                    html = get_html(current_url)
-                    if not html:
-                        break
-                    
-                    properties = parse_properties(html, pbar_details)
-                    if not properties:
-                        break # そのページに物件がなければ終了
-                    
-                    total_properties.extend(properties)
-                    current_url = get_next_page_url(html)
-
-    if total_properties:
-        df = pd.DataFrame(total_properties)
-        # データを追記モードで保存
-        # ファイルが存在しない場合はヘッダーを書き込み、存在する場合は追記のみ
-        df.to_csv(output_path, mode='a', header=not os.path.exists(output_path), index=False, encoding='utf-8-sig')
-        
-        # 最後に全体の重複を削除
-        df_final = pd.read_csv(output_path)
-        df_final.drop_duplicates(inplace=True)
-        df_final.to_csv(output_path, index=False, encoding='utf-8-sig')
+def crawl_serial(start_urls=None, store=None, parser='bs4', writer=None, checkpoint=None):
+    """検索条件ごとに一覧ページと詳細ページを逐次取得する
+    start_urls: (ラベル, URL) のリスト。省略時は RENT_RANGES と AREAS の全組み合わせ
+    writer を渡すと物件をページごとに書き出し、戻り値は writer.records になる
+    checkpoint を渡すと、前回中断したページと書き出し前の物件から再開する
+    """
+    writer = writer or RecordWriter(store=store, keep=True)
+    listing_parser, detail_parser = get_parsers(parser)
+
+    if checkpoint:
+        pending = checkpoint.take_pending()
+        if pending:
+            with tqdm(desc="Pending details", leave=False) as pbar_details:
+                writer.write(fetch_details(pending, pbar_details, store, detail_parser))
 
+    # 検索条件（賃料範囲 × エリア）でループ
+    for progress_desc, start_url in tqdm(start_urls or build_start_urls(), desc="Overall Progress"):
+        current_url = checkpoint.resume_url(start_url) if checkpoint else start_url
+        with tqdm(desc=progress_desc, leave=False) as pbar_details:
+            while current_url:
+                listing = fetch_parsed(current_url, listing_parser)
+                if not listing:
+                    break
+                
+                properties = listing['properties']
+                if not properties:
+                    if checkpoint:
+                        checkpoint.advance(start_url, None, [])
+                    break # そのページに物件がなければ終了
+                
+                if checkpoint:
+                    checkpoint.advance(start_url, listing['next_url'], properties)
+                writer.write(fetch_details(properties, pbar_details, store, detail_parser))
+                current_url = listing['next_url']
+    writer.flush()
+    return writer.records
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="SUUMOの賃貸物件情報を収集する")
+    parser.add_argument('--async', dest='use_async', action='store_true', help="非同期クロールモードを使う")
+    parser.add_argument('--concurrency', type=int, default=8, help="同時に実行するリクエスト数の上限 (非同期モード)")
+    parser.add_argument('--rps', type=float, default=1.0, help="全体での1秒あたりリクエスト数の上限 (非同期モード)")
+    parser.add_argument('--burst', type=int, default=1,
+                        help="レート上限の範囲内で連続して送ってよいリクエスト数 (非同期モード)")
+    parser.add_argument('--cache-dir', default='data/http_cache', help="条件付きリクエスト用のレスポンスキャッシュ")
+    parser.add_argument('--no-cache', action='store_true', help="レスポンスキャッシュを使わない")
+    parser.add_argument('--archive-dir', default='data/html_archive',
+                        help="取得した生のHTMLを保存するアーカイブ（reparse.py で再解析できる）")
+    parser.add_argument('--no-archive', action='store_true', help="生のHTMLを保存しない")
+    parser.add_argument('--parse-workers', type=int, default=0,
+                        help="HTMLの解析を行うプロセス数。0なら取得と同じスレッドで解析する (非同期モード)")
+    parser.add_argument('--parse-queue-depth', type=int, default=None, help="解析待ちのページ数の上限 (非同期モード)")
+    parser.add_argument('--parser', choices=['bs4', 'lxml'], default='bs4', help="HTMLの解析に使うバックエンド")
+    parser.add_argument('--incremental', action='store_true',
+                        help="既知で価格の変わっていない物件の詳細ページを取得しない差分クロールを行う")
+    parser.add_argument('--store', default='data/suumo_listings.sqlite', help="差分クロール用の物件ストア")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="固定の RENT_RANGES の代わりに、検索結果件数から賃料範囲を自動で分割・統合する")
+    parser.add_argument('--target-pages', type=int, default=20, help="賃料範囲1つあたりのページ数の目標 (--adaptive)")
+    parser.add_argument('--partition-cache', default='data/rent_partitions.json', help="エリアごとの賃料範囲の保存先")
+    parser.add_argument('--replan', action='store_true', help="保存済みの賃料範囲を使わずに作り直す")
+    parser.add_argument('--checkpoint', default='data/crawl_checkpoint.json',
+                        help="進捗の保存先。存在すれば中断したところから再開する")
+    parser.add_argument('--restart', action='store_true', help="保存済みの進捗を使わずに最初から取得する")
+    parser.add_argument('--batch-size', type=int, default=100, help="この件数ごとに物件を書き出す")
+    parser.add_argument('--bargains', action='store_true',
+                        help="登録済みモデル (raw_file/train_model.py) で物件を取得しながら予測し、割安物件を検出する")
+    parser.add_argument('--bargain-threshold', type=float, default=0.15,
+                        help="予測家賃よりこの割合以上安い物件をアラートする (--bargains)")
+    parser.add_argument('--top-k', type=int, default=20, help="エリアごとに保持する割安物件の数 (--bargains)")
+    parser.add_argument('--alerts', default='data/bargain_alerts.jsonl', help="割安物件のアラートの追記先")
+    parser.add_argument('--top-output', default='data/bargains_top.json', help="エリアごとの割安物件の上位の保存先")
+    parser.add_argument('--bargain-seen', default='data/bargain_seen.json',
+                        help="予測済みの物件と価格の保存先。次の実行では価格の変わった物件だけを予測する")
+    parser.add_argument('--model-version', default=None, help="使うモデルのバージョン。省略時は最新")
+    parser.add_argument('--output', default='data/suumo_data_final.csv')
+    add_metrics_arguments(parser)
+    return parser.parse_args()
+
+def main(args):
+    output_path = args.output
+    cache = None if args.no_cache else ResponseCache(args.cache_dir)
+    store = ListingStore(args.store) if args.incremental else None
+    if store and store.is_empty() and os.path.exists(output_path):
+        # 初回の差分クロールでは、既存のCSVの物件を既知の物件として取り込む
+        print(f"Imported {store.import_csv(output_path)} properties from {output_path} into {args.store}.")
+    archive = None if args.no_archive else HtmlArchive(args.archive_dir)
+    HTTP_CLIENT.cache = cache
+    HTTP_CLIENT.archive = archive
+
+    if args.adaptive:
+        from rent_planner import RentPlanner, build_planned_start_urls, parse_hit_count
+        planner = RentPlanner(cache_path=args.partition_cache, target_pages=args.target_pages,
+                              count_fetcher=lambda url: fetch_parsed(url, parse_hit_count))
+        start_urls = build_planned_start_urls(planner.plan(replan=args.replan))
+        print(f"Planned {len(start_urls)} rent ranges with {planner.probes} probe requests "
+              f"({planner.failed_probes} failed).")
+    else:
+        start_urls = build_start_urls()
+
+    checkpoint = CrawlCheckpoint(args.checkpoint)
+    if not args.restart and checkpoint.load():
+        print(f"Resuming from {args.checkpoint} ({len(checkpoint.pending)} pending properties).")
+    detector = None
+    if args.bargains:
+        from bargain_stream import BargainDetector, load_model
+        model = load_model(args.model_version)
+        # 前回までに同じモデルで予測した物件は、価格が変わっていなければ予測し直さない
+        detector = BargainDetector(model, threshold=args.bargain_threshold, top_k=args.top_k,
+                                   alert_path=args.alerts, seen_path=args.bargain_seen, log=tqdm.write)
+        detector.load_top(args.top_output)
+        print(f"Detecting bargains with model {model.version} (threshold {args.bargain_threshold:.0%}).")
+    # CSVには新規の物件と価格の変わった物件だけを追記する（差分クロールでもCSVは書き直さない）
+    writer = RecordWriter(output_path=output_path, columns=OUTPUT_COLUMNS, store=store,
+                          batch_size=args.batch_size, on_flush=checkpoint.mark_written,
+                          on_write=detector.observe if detector else None)
+
+    try:
+        if args.use_async:
+            from async_crawler import AsyncCrawler
+            crawler = AsyncCrawler(concurrency=args.concurrency, rps=args.rps, burst=args.burst, cache=cache, store=store,
+                                   parser=args.parser, parse_workers=args.parse_workers,
+                                   parse_queue_depth=args.parse_queue_depth, archive=archive,
+                                   writer=writer, checkpoint=checkpoint)
+            crawler.run(start_urls)
+            print(f"\nFetch stats: {crawler.report()}")
+            print(f"Stage throughput: {crawler.stage_report()}")
+        else:
+            crawl_serial(start_urls, store, args.parser, writer, checkpoint)
+            print(f"\nFetch stats: {HTTP_CLIENT.report()}")
+    finally:
+        # 中断された場合も、書き出し済みの物件と進捗は残す
+        writer.close()
+        checkpoint.save(force=True)
+        if archive:
+            archive.close()
+        if detector:
+            detector.save_top(args.top_output)
+            detector.close()
+    checkpoint.finish()
+    METRICS.set('records_written', writer.written)
+    METRICS.set('duplicates', writer.duplicates)
+
+    if detector:
+        print(f"Scored {detector.scored} new or re-priced properties, {detector.alerts} bargain alerts "
+              f"({args.alerts}), {detector.errors} skipped. Top bargains per area saved to {args.top_output}")
+
+    if store:
+        print(f"Skipped {store.skipped_details} unchanged detail pages.")
+        store.close()
+    if writer.written:
         print(f"\n\nSuccessfully finished scraping.")
-        print(f"A total of {len(df_final)} unique properties were saved to {output_path}")
+        print(f"{writer.written - writer.duplicates} new properties were saved to {output_path} "
+              f"({writer.duplicates} duplicates skipped)")
     else:
-        print("No properties were scraped.")
\ No newline at end of file
+        print("No properties were scraped.")
+
+if __name__ == "__main__":
+    args = parse_args()
+    instrument('scrape', args.metrics_report, args.profile)
+    main(args)
@@ -0,0 +1,364 @@
+import argparse
+import os
+import re
+from html import escape
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+from suumo_scraper import SUUMO_ROOT, SEARCH_PATH_TEMPLATE, OUTPUT_COLUMNS
+from fast_parser import AMENITY_FLAGS
+
+# (都道府県, 市区町村, 町名, (路線, 駅) のリスト, 1㎡あたりの家賃の目安（万円）)
+WARDS = [
+    ('東京都', '渋谷区', ['神南', '宇田川町', '神宮前', '恵比寿', '代々木', '笹塚', '本町'],
+     [('ＪＲ山手線', '渋谷駅'), ('ＪＲ山手線', '恵比寿駅'), ('東京メトロ銀座線', '表参道駅'),
+      ('京王線', '笹塚駅'), ('小田急線', '代々木上原駅')], 0.50),
+    ('東京都', '新宿区', ['西新宿', '高田馬場', '神楽坂', '大久保', '四谷', '早稲田町'],
+     [('ＪＲ山手線', '新宿駅'), ('ＪＲ山手線', '高田馬場駅'), ('東京メトロ東西線', '神楽坂駅'),
+      ('都営大江戸線', '東新宿駅'), ('東京メトロ丸ノ内線', '四谷三丁目駅')], 0.45),
+    ('東京都', '港区', ['麻布十番', '六本木', '赤坂', '芝浦', '白金', '高輪'],
+     [('都営大江戸線', '麻布十番駅'), ('東京メトロ日比谷線', '六本木駅'), ('東京メトロ千代田線', '赤坂駅'),
+      ('ＪＲ山手線', '田町駅'), ('東京メトロ南北線', '白金高輪駅')], 0.58),
+    ('東京都', '世田谷区', ['三軒茶屋', '北沢', '経堂', '用賀', '玉川', '桜新町'],
+     [('東急田園都市線', '三軒茶屋駅'), ('小田急線', '下北沢駅'), ('小田急線', '経堂駅'),
+      ('東急田園都市線', '用賀駅'), ('東急田園都市線', '二子玉川駅')], 0.36),
+    ('東京都', '目黒区', ['上目黒', '自由が丘', '祐天寺', '目黒本町', '駒場'],
+     [('東急東横線', '中目黒駅'), ('東急東横線', '自由が丘駅'), ('東急東横線', '祐天寺駅'),
+      ('東急目黒線', '西小山駅'), ('京王井の頭線', '駒場東大前駅')], 0.42),
+    ('東京都', '品川区', ['大崎', '西五反田', '戸越', '大井', '旗の台', '東品川'],
+     [('ＪＲ山手線', '大崎駅'), ('ＪＲ山手線', '五反田駅'), ('都営浅草線', '戸越駅'),
+      ('ＪＲ京浜東北線', '大井町駅'), ('東急池上線', '旗の台駅')], 0.38),
+    ('神奈川県', '横浜市港北区', ['日吉', '綱島西', '新横浜', '大倉山', '菊名'],
+     [('東急東横線', '日吉駅'), ('東急東横線', '綱島駅'), ('ＪＲ横浜線', '新横浜駅'),
+      ('東急東横線', '大倉山駅'), ('東急東横線', '菊名駅')], 0.26),
+    ('神奈川県', '横浜市中区', ['山下町', '本牧町', '石川町', '伊勢佐木町'],
+     [('ＪＲ根岸線', '関内駅'), ('ＪＲ根岸線', '石川町駅'), ('みなとみらい線', '元町・中華街駅'),
+      ('横浜市営ブルーライン', '伊勢佐木長者町駅')], 0.27),
+    ('神奈川県', '横浜市西区', ['高島', 'みなとみらい', '戸部町', '平沼'],
+     [('ＪＲ東海道本線', '横浜駅'), ('みなとみらい線', 'みなとみらい駅'), ('京急本線', '戸部駅'),
+      ('相鉄本線', '平沼橋駅')], 0.30),
+]
+
+# (間取り, 出現率, 面積の下限, 上限)
+LAYOUTS = [
+    ('ワンルーム', 0.14, 15, 25), ('1K', 0.26, 18, 28), ('1DK', 0.08, 25, 35), ('1LDK', 0.18, 30, 50),
+    ('2K', 0.03, 28, 38), ('2DK', 0.07, 35, 48), ('2LDK', 0.14, 45, 70), ('3LDK', 0.07, 60, 95),
+    ('1SLDK', 0.03, 40, 60),
+]
+
+NAME_PREFIXES = ['パーク', 'グラン', 'ライオンズ', 'プラウド', 'シティ', 'メゾン', 'ハイツ', 'コート']
+NAME_SUFFIXES = ['レジデンス', 'マンション', 'ヒルズ', 'テラス', 'タワー', 'ハウス']
+STRUCTURES = ['木造', '鉄骨', '鉄筋コン', '鉄骨鉄筋']
+DIRECTIONS = ['南', '南東', '南西', '東', '西', '北', '北東', '北西']
+ADMIN_FEES = [0, 3000, 5000, 8000, 10000, 12000, 15000]
+
+# 築年数が0年の物件での設備の有無の確率（古い物件ほど下がる）。最上階は階数から決める
+AMENITY_RATES = {
+    'has_separate_bath_toilet': 0.95, 'has_reheating': 0.6, 'has_bathroom_dryer': 0.7, 'has_autolock': 0.9,
+    'has_tv_intercom': 0.9, 'has_delivery_box': 0.7, 'has_pet_allowed': 0.3, 'has_musical_instruments_allowed': 0.1,
+    'has_free_internet': 0.6, 'has_system_kitchen': 0.8, 'has_gas_stove_gt2': 0.7, 'is_corner_room': 0.3,
+}
+AMENITY_NAMES = [name for _, name in AMENITY_FLAGS]
+
+# 1つの一覧ページに載せる建物数と、1つの建物の部屋数の上限
+BUILDINGS_PER_PAGE = 30
+MAX_ROOMS = 6
+
+# 詳細ページのURLの物件番号の先頭
+DETAIL_ID_BASE = 100_000_000_000
+DETAIL_ID_PATTERN = re.compile(r'jnc_(\d+)')
+
+FULL_WIDTH_DIGITS = str.maketrans('0123456789', '０１２３４５６７８９')
+
+class SyntheticCorpus:
+    """SUUMOの一覧・詳細ページと、それをスクレイピングした生データを乱数で作る
+
+    n_listings 件の部屋を建物（1〜MAX_ROOMS 部屋）にまとめ、n_queries 個の検索条件に均等に分ける。
+    値は seed から決まる数値の配列として持ち、ページやレコードは要求されたときにその場で作るので、
+    100万件でもHTMLをディスクに置かずにスタブサーバーから返せる。家賃は地域・面積・築年数・駅徒歩・
+    階・設備から決まる値に誤差を加えたもので、学習すれば当てられるようにしてある。
+    record(i) は、一覧・詳細ページをスクレイパーで解析した結果と同じ値になる。
+    """
+
+    def __init__(self, n_listings, seed=0, n_queries=1):
+        self.n_listings = n_listings
+        self.seed = seed
+        self.n_queries = n_queries
+        rng = np.random.default_rng(seed)
+
+        # 建物
+        rooms = rng.integers(1, MAX_ROOMS + 1, size=max(n_listings, 1))
+        ends = np.cumsum(rooms)
+        n_buildings = int(np.searchsorted(ends, n_listings)) + 1 if n_listings else 0
+        rooms = rooms[:n_buildings]
+        if n_buildings:
+            rooms[-1] -= ends[n_buildings - 1] - n_listings
+        self.rooms = rooms
+        self.first_listing = np.cumsum(rooms) - rooms
+        self.ward = rng.integers(0, len(WARDS), n_buildings)
+        n_towns = np.array([len(WARDS[w][2]) for w in range(len(WARDS))])
+        self.town = (rng.random(n_buildings) * n_towns[self.ward]).astype(int)
+        self.chome = rng.integers(1, 6, n_buildings)
+        self.name = rng.integers(0, len(NAME_PREFIXES) * len(NAME_SUFFIXES), n_buildings)
+        self.name_number = np.where(rng.random(n_buildings) < 0.3, rng.integers(2, 10, n_buildings), 0)
+        n_stations = np.array([len(WARDS[w][3]) for w in range(len(WARDS))])
+        # 最寄り駅と、同じ市区町村の別の駅（0〜2件）。徒歩分数は最寄り駅が一番短い
+        first = (rng.random(n_buildings) * n_stations[self.ward]).astype(int)
+        offsets = np.stack([np.zeros(n_buildings, dtype=int),
+                            1 + (rng.random(n_buildings) * (n_stations[self.ward] - 1)).astype(int)], axis=1)
+        offsets = np.column_stack([offsets, offsets[:, 1] % (n_stations[self.ward] - 1) + 1])
+        self.station = (first[:, None] + offsets) % n_stations[self.ward][:, None]
+        self.n_routes = rng.integers(1, 4, n_buildings)
+        walk = np.sort(rng.integers(1, 21, (n_buildings, 3)), axis=1)
+        self.walk = walk
+        self.age = np.minimum(rng.exponential(14, n_buildings).astype(int), 60)
+        self.floors = np.clip(rng.gamma(2.0, 3.5, n_buildings).astype(int) + 2, 2, 45)
+        self.basement = np.where((self.floors >= 8) & (rng.random(n_buildings) < 0.3), rng.integers(1, 3, n_buildings), 0)
+        wooden = rng.random(n_buildings) < 0.5
+        self.structure = np.where(self.floors <= 3, np.where(wooden, 0, 1), np.where(self.floors >= 20, 3, 2))
+
+        # 部屋
+        building = np.repeat(np.arange(n_buildings), rooms)
+        self.building = building
+        rates = np.array([rate for _, rate, _, _ in LAYOUTS])
+        self.layout = rng.choice(len(LAYOUTS), size=n_listings, p=rates / rates.sum())
+        low = np.array([low for _, _, low, _ in LAYOUTS])[self.layout]
+        high = np.array([high for _, _, _, high in LAYOUTS])[self.layout]
+        self.area = np.round(low + rng.random(n_listings) * (high - low), 2)
+        self.floor = 1 + (rng.random(n_listings) * self.floors[building]).astype(int)
+        self.direction = rng.integers(0, len(DIRECTIONS), n_listings)
+        age = self.age[building]
+        amenities = np.zeros((n_listings, len(AMENITY_FLAGS)), dtype=bool)
+        for j, (column, _) in enumerate(AMENITY_FLAGS):
+            if column == 'is_top_floor':
+                amenities[:, j] = self.floor == self.floors[building]
+            else:
+                amenities[:, j] = rng.random(n_listings) < AMENITY_RATES[column] * np.exp(-age / 40)
+        self.amenities = amenities
+
+        price = np.array([price for *_, price in WARDS])[self.ward][building]
+        rent = (price * self.area * (1 - 0.008 * np.minimum(age, 50)) * (1 - 0.01 * (self.walk[building, 0] - 1))
+                * (1 + 0.005 * self.floor) * (1 + 0.015 * amenities.sum(axis=1))
+                * np.exp(rng.normal(0, 0.08, n_listings)))
+        self.rent = np.maximum(np.round(rent, 1), 3.0)
+        self.admin_fee = np.array(ADMIN_FEES)[rng.integers(0, len(ADMIN_FEES), n_listings)]
+        self.deposit = np.round(self.rent * rng.integers(0, 3, n_listings), 1)
+        self.gratuity = np.round(self.rent * rng.integers(0, 2, n_listings), 1)
+
+        # 検索条件ごとの建物の範囲
+        self.query_bounds = np.linspace(0, n_buildings, n_queries + 1).astype(int)
+
+    def __len__(self):
+        return self.n_listings
+
+    # --- 建物・部屋ごとの表示用の文字列 ---
+
+    def _building_name(self, b):
+        prefix, suffix = divmod(int(self.name[b]), len(NAME_SUFFIXES))
+        town = WARDS[self.ward[b]][2][self.town[b]]
+        number = f'{self.name_number[b]}' if self.name_number[b] else ''
+        return f'{NAME_PREFIXES[prefix]}{town}{NAME_SUFFIXES[suffix]}{number}'
+
+    def _address(self, b):
+        prefecture, city, towns, _, _ = WARDS[self.ward[b]]
+        return f'{prefecture}{city}{towns[self.town[b]]}{str(self.chome[b]).translate(FULL_WIDTH_DIGITS)}'
+
+    def _transportations(self, b):
+        stations = WARDS[self.ward[b]][3]
+        return [f'{stations[self.station[b, j]][0]}/{stations[self.station[b, j]][1]} 歩{self.walk[b, j]}分'
+                for j in range(self.n_routes[b])]
+
+    def _age(self, b):
+        return '新築' if self.age[b] == 0 else f'築{self.age[b]}年'
+
+    def _floors(self, b):
+        basement = f'地下{self.basement[b]}' if self.basement[b] else ''
+        return f'{basement}地上{self.floors[b]}階建'
+
+    def detail_path(self, i):
+        listing_id = DETAIL_ID_BASE + i
+        return f'/chintai/jnc_{listing_id:012d}/?bc={listing_id:012d}'
+
+    @staticmethod
+    def _money(value):
+        return '-' if not value else f'{value:g}万円'
+
+    def record(self, i, root=SUUMO_ROOT):
+        """i 番目の部屋を一覧・詳細ページから解析した結果（suumo_scraper.OUTPUT_COLUMNS の dict）"""
+        b = self.building[i]
+        transportations = self._transportations(b)
+        record = {
+            'building_name': self._building_name(b), 'address': self._address(b),
+            'transportation_1': transportations[0] if len(transportations) > 0 else None,
+            'transportation_2': transportations[1] if len(transportations) > 1 else None,
+            'transportation_3': transportations[2] if len(transportations) > 2 else None,
+            'age': self._age(b), 'floors': self._floors(b), 'rent': float(self.rent[i]),
+            'admin_fee': int(self.admin_fee[i]), 'deposit': float(self.deposit[i]),
+            'gratuity': float(self.gratuity[i]), 'layout': LAYOUTS[self.layout[i]][0],
+            'area': f'{self.area[i]:g}', 'detail_url': root + self.detail_path(i),
+            'structure': STRUCTURES[self.structure[b]],
+            # 詳細ページの「階建」欄は「3階/12階建」で、スクレイパーは '/' の後ろを取る
+            'floor_number': f'{self.floors[b]}階建', 'direction': DIRECTIONS[self.direction[i]],
+        }
+        for j, (column, _) in enumerate(AMENITY_FLAGS):
+            record[column] = int(self.amenities[i, j])
+        return record
+
+    def records(self, start=0, stop=None, root=SUUMO_ROOT):
+        """start 〜 stop-1 番目の部屋の生データ（スクレイピング結果のCSVと同じ列）"""
+        stop = self.n_listings if stop is None else min(stop, self.n_listings)
+        return pd.DataFrame([self.record(i, root) for i in range(start, stop)], columns=OUTPUT_COLUMNS)
+
+    def write_csv(self, path, chunk_size=100_000):
+        """全件をスクレイピング結果と同じ形式のCSV（utf-8-sig）に書き出す"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        for start in range(0, self.n_listings, chunk_size):
+            self.records(start, start + chunk_size).to_csv(
+                path, mode='w' if start == 0 else 'a', header=start == 0, index=False,
+                encoding='utf-8-sig' if start == 0 else 'utf-8')
+        return self.n_listings
+
+    # --- HTML ---
+
+    def search_path(self, query, page=1):
+        path = SEARCH_PATH_TEMPLATE.format(pref_code='13', area_code='13113', min_rent=query, max_rent=query + 1)
+        return path if page == 1 else f'{path}&page={page}'
+
+    def start_urls(self, root):
+        """(ラベル, 検索開始URL) のリスト。検索条件 q の URL は cb={q} になる"""
+        return [(f'query {q}', root + self.search_path(q)) for q in range(self.n_queries)]
+
+    def n_pages(self, query):
+        n_buildings = self.query_bounds[query + 1] - self.query_bounds[query]
+        return max(1, -(-n_buildings // BUILDINGS_PER_PAGE))
+
+    def _room_row(self, i):
+        admin_fee = f'{self.admin_fee[i]}円' if self.admin_fee[i] else '-'
+        return (
+            '<tr class="js-cassette_link">'
+            f'<td><span class="cassetteitem_other-checkbox"><input type="checkbox" value="{i}"></span></td>'
+            f'<td>{self.floor[i]}階</td>'
+            f'<td><ul><li><span class="cassetteitem_price cassetteitem_price--rent"><span class="cassetteitem_other-emphasis ui-text--bold">{self.rent[i]:.1f}万円</span></span></li>'
+            f'<li><span class="cassetteitem_price cassetteitem_price--administration">{admin_fee}</span></li></ul></td>'
+            f'<td><ul><li><span class="cassetteitem_price cassetteitem_price--deposit">{self._money(self.deposit[i])}</span></li>'
+            f'<li><span class="cassetteitem_price cassetteitem_price--gratuity">{self._money(self.gratuity[i])}</span></li></ul></td>'
+            f'<td><ul><li><span class="cassetteitem_madori">{LAYOUTS[self.layout[i]][0]}</span></li>'
+            f'<li><span class="cassetteitem_menseki">{self.area[i]:g}m<sup>2</sup></span></li></ul></td>'
+            f'<td class="ui-text--midium ui-text--bold"><a href="{self.detail_path(i)}" '
+            f'class="js-cassette_link_href cassetteitem_other-linktext" target="_blank">詳細を見る</a></td>'
+            '</tr>'
+        )
+
+    def _cassette(self, b):
+        first = self.first_listing[b]
+        transportations = ''.join(f'<div class="cassetteitem_detail-text">{escape(t)}</div>'
+                                  for t in self._transportations(b))
+        rows = ''.join(self._room_row(i) for i in range(first, first + self.rooms[b]))
+        return (
+            '<div class="cassetteitem">'
+            '<div class="cassetteitem-detail"><div class="cassetteitem-detail-object">'
+            '<div class="cassetteitem_content"><div class="cassetteitem_content-label">'
+            '<span class="ui-pct ui-pct--util1">賃貸マンション</span></div>'
+            f'<div class="cassetteitem_content-title">{escape(self._building_name(b))}</div>'
+            '<div class="cassetteitem_content-body"><ul class="cassetteitem_detail">'
+            f'<li class="cassetteitem_detail-col1">{self._address(b)}</li>'
+            f'<li class="cassetteitem_detail-col2">{transportations}</li>'
+            f'<li class="cassetteitem_detail-col3"><div>{self._age(b)}</div><div>{self._floors(b)}</div></li>'
+            '</ul></div></div></div></div>'
+            f'<div class="cassetteitem-item"><table class="cassetteitem_other"><tbody>{rows}</tbody></table></div>'
+            '</div>'
+        )
+
+    def listing_page(self, query, page=1):
+        """検索条件 query の page ページ目の一覧ページ。範囲外なら None"""
+        if not 0 <= query < self.n_queries or not 1 <= page <= self.n_pages(query):
+            return None
+        low, high = self.query_bounds[query], self.query_bounds[query + 1]
+        start = low + (page - 1) * BUILDINGS_PER_PAGE
+        buildings = range(start, min(start + BUILDINGS_PER_PAGE, high))
+        n_rooms = int(self.rooms[low:high].sum())
+        pager = (f'<p class="pager_next"><a href="{escape(self.search_path(query, page + 1))}">次へ</a></p>'
+                 if page < self.n_pages(query) else '')
+        return (
+            '<!DOCTYPE html><html lang="ja"><head><meta charset="utf-8">'
+            '<title>賃貸物件の検索結果 - SUUMO</title></head><body>'
+            f'<div class="paginate_set-hit">{n_rooms:,}<span>件</span></div>'
+            f'<div id="js-bukkenList">{"".join(self._cassette(b) for b in buildings)}</div>'
+            f'<div class="pagination pagination_set-nav">{pager}<ol class="pagination-parts"><li><span>{page}</span></li></ol></div>'
+            '</body></html>'
+        )
+
+    def detail_page(self, i):
+        """i 番目の部屋の詳細ページ。範囲外なら None"""
+        if not 0 <= i < self.n_listings:
+            return None
+        b = self.building[i]
+        features = '、'.join(name for name, flag in zip(AMENITY_NAMES, self.amenities[i]) if flag)
+        return (
+            '<!DOCTYPE html><html lang="ja"><head><meta charset="utf-8">'
+            f'<title>{escape(self._building_name(b))} - SUUMO</title></head><body>'
+            f'<h1 class="section_h1-header-title">{escape(self._building_name(b))} {self.floor[i]}階</h1>'
+            # スクレイパーは各行の最初の th / td だけを見るので、1行に1項目ずつ置く
+            '<table class="property_view_table"><tbody>'
+            f'<tr><th>所在地</th><td>{self._address(b)}</td></tr>'
+            f'<tr><th>間取り</th><td>{LAYOUTS[self.layout[i]][0]}</td></tr>'
+            f'<tr><th>専有面積</th><td>{self.area[i]:g}m<sup>2</sup></td></tr>'
+            f'<tr><th>築年数</th><td>{self._age(b)}</td></tr>'
+            f'<tr><th>向き</th><td>{DIRECTIONS[self.direction[i]]}</td></tr>'
+            f'<tr><th>構造</th><td>{STRUCTURES[self.structure[b]]}</td></tr>'
+            f'<tr><th>階建</th><td>{self.floor[i]}階/{self.floors[b]}階建</td></tr>'
+            '</tbody></table>'
+            f'<div id="bkdt-option"><ul class="inline_list"><li>{features}</li></ul></div>'
+            '</body></html>'
+        )
+
+    def render(self, url):
+        """スタブサーバー用。URLのパスとクエリからページを作り、UTF-8のバイト列を返す（なければ None）"""
+        parsed = urlparse(url)
+        if 'ichiran' in parsed.path:
+            query = parse_qs(parsed.query)
+            page = self.listing_page(int(query.get('cb', ['0'])[0]), int(query.get('page', ['1'])[0]))
+        else:
+            match = DETAIL_ID_PATTERN.search(parsed.path)
+            page = self.detail_page(int(match.group(1)) - DETAIL_ID_BASE) if match else None
+        return page.encode('utf-8') if page is not None else None
+
+    def write_html(self, corpus_dir, max_pages=3):
+        """stub_server.load_corpus で読める listing*.html / detail*.html を書き出す（bench_crawl.py, bench_parser.py 用）
+        最初の検索条件の max_pages ページ分と、そこに載る部屋の詳細ページを書く
+        """
+        os.makedirs(corpus_dir, exist_ok=True)
+        n_pages = min(max_pages, self.n_pages(0))
+        for page in range(1, n_pages + 1):
+            with open(os.path.join(corpus_dir, f'listing{page}.html'), 'w', encoding='utf-8') as f:
+                f.write(self.listing_page(0, page))
+        last_building = min(n_pages * BUILDINGS_PER_PAGE, self.query_bounds[1])
+        n_details = int(self.rooms[:last_building].sum())
+        for i in range(n_details):
+            with open(os.path.join(corpus_dir, f'detail{i + 1}.html'), 'w', encoding='utf-8') as f:
+                f.write(self.detail_page(i))
+        return n_pages, n_details
+
+def main():
+    parser = argparse.ArgumentParser(description="SUUMOの一覧・詳細ページと生データのCSVを乱数で作る（ベンチマーク用）")
+    parser.add_argument('--listings', type=int, default=10_000, help="部屋数")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--csv', default=None, help="生データのCSVの書き出し先（スクレイピング結果と同じ形式）")
+    parser.add_argument('--html-dir', default=None, help="listing*.html と detail*.html の書き出し先")
+    parser.add_argument('--pages', type=int, default=3, help="--html-dir に書き出す一覧ページ数")
+    args = parser.parse_args()
+    if not args.csv and not args.html_dir:
+        parser.error("--csv か --html-dir を指定してください")
+
+    corpus = SyntheticCorpus(args.listings, seed=args.seed)
+    if args.csv:
+        corpus.write_csv(args.csv)
+        print(f'Saved {args.listings} rows to {args.csv}')
+    if args.html_dir:
+        n_pages, n_details = corpus.write_html(args.html_dir, args.pages)
+        print(f'Saved {n_pages} listing pages and {n_details} detail pages to {args.html_dir}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# スクリプトは raw_file/ と scraping/ の中で互いを直接 import するので、両方をパスに入れる
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('raw_file', 'scraping'):
+    path = os.path.join(REPO_ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
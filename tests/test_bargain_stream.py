@@ -0,0 +1,67 @@
+import json
+
+import pandas as pd
+
+from bargain_stream import BargainDetector
+from record_writer import RecordWriter
+
+class FakeModel:
+    """家賃の1.5倍を予測する（すべての物件が33%割安になる）"""
+
+    def __init__(self, version='v1'):
+        self.version = version
+        self.batches = []
+
+    def score(self, df):
+        self.batches.append(len(df))
+        rent = df['rent'].astype(float)
+        predicted = rent * 1.5
+        return pd.DataFrame({'predicted_rent': predicted, 'discount_rate': (rent - predicted) / rent})
+
+def _listing(i, rent=8.0):
+    return {'building_name': f'B{i}', 'address': '東京都新宿区西新宿', 'layout': '1K', 'area': '20',
+            'rent': rent, 'detail_url': f'https://suumo.jp/chintai/{i}/'}
+
+def _detector(tmp_path, model):
+    return BargainDetector(model, alert_path=str(tmp_path / 'alerts.jsonl'), seen_path=str(tmp_path / 'seen.json'),
+                           log=lambda message: None)
+
+def test_scores_once_per_flush_and_skips_unchanged_listings_across_runs(tmp_path):
+    model = FakeModel()
+    detector = _detector(tmp_path, model)
+    writer = RecordWriter(batch_size=4, on_write=detector.observe)
+    for i in range(6):
+        writer.write([_listing(i)])
+    writer.close()
+    detector.save_top(str(tmp_path / 'top.json'))
+    detector.close()
+    assert model.batches == [4, 2]
+    assert detector.alerts == 6
+
+    # 次の実行では、価格の変わった物件と新しい物件だけを予測する
+    detector = _detector(tmp_path, model)
+    detector.load_top(str(tmp_path / 'top.json'))
+    detector.observe([_listing(0), _listing(1, rent=7.0), _listing(6)])
+    detector.close()
+    assert model.batches == [4, 2, 2]
+    assert detector.alerts == 2
+    assert sum(len(entries) for entries in detector.top().values()) == 7
+    with open(tmp_path / 'alerts.jsonl', encoding='utf-8') as f:
+        assert len(f.readlines()) == 8
+
+    # モデルが変わればすべて予測し直す
+    other = FakeModel('v2')
+    detector = _detector(tmp_path, other)
+    detector.observe([_listing(0)])
+    detector.close()
+    assert other.batches == [1]
+    with open(tmp_path / 'seen.json', encoding='utf-8') as f:
+        assert json.load(f)['model_version'] == 'v2'
+
+def test_bad_listing_is_skipped(tmp_path):
+    model = FakeModel()
+    detector = _detector(tmp_path, model)
+    detector.observe([_listing(0), dict(_listing(1), rent='不明'), {'rent': 1.0}])
+    detector.close()
+    assert detector.scored == 1
+    assert detector.errors == 2
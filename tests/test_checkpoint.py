@@ -0,0 +1,21 @@
+from checkpoint import CrawlCheckpoint
+
+def test_resume_from_saved_frontier(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = CrawlCheckpoint(path, min_interval=0)
+    a = {'detail_url': 'http://example.com/a', 'rent': '8万円'}
+    b = {'detail_url': 'http://example.com/b', 'rent': '9万円'}
+    checkpoint.advance('http://example.com/search', 'http://example.com/search?page=2', [a, b])
+    checkpoint.mark_written([a])
+
+    # 中断後に読み直すと、次の一覧ページと書き出せなかった物件から再開する
+    resumed = CrawlCheckpoint(path)
+    assert resumed.load()
+    assert resumed.resume_url('http://example.com/search') == 'http://example.com/search?page=2'
+    assert resumed.resume_url('http://example.com/other') == 'http://example.com/other'
+    assert resumed.take_pending() == [b]
+
+    resumed.advance('http://example.com/search', None, [])
+    assert resumed.resume_url('http://example.com/search') is None
+    resumed.finish()
+    assert not CrawlCheckpoint(path).load()
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from cv_engine import CVEngine, TrialStore, search_key
+
+def _engine():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame({'area': rng.uniform(15, 60, 300), 'age': rng.integers(0, 40, 300)})
+    y = np.log1p(3 + X['area'] * 0.2 - X['age'] * 0.05 + rng.normal(0, 0.3, 300))
+    return CVEngine(X, y, n_splits=3, n_jobs=2)
+
+def test_early_stopping_rows_come_from_training_fold():
+    engine = _engine()
+    for train_index, val_index in engine.folds:
+        fit_index, stop_index = engine.stopping_split(train_index)
+        assert len(np.intersect1d(fit_index, stop_index)) == 0
+        assert np.array_equal(np.sort(np.concatenate([fit_index, stop_index])), np.sort(train_index))
+        # 評価するfoldの行は早期終了の判定に使わない
+        assert len(np.intersect1d(stop_index, val_index)) == 0
+        assert np.array_equal(engine.stopping_split(train_index)[1], stop_index)
+
+def test_successive_halving_reuses_stored_trials(tmp_path):
+    path = str(tmp_path / 'trials.jsonl')
+    engine = _engine()
+    settings = dict(n_trials=3, min_rounds=5, max_rounds=15, eta=3, early_stopping_rounds=5, seed=1)
+    key = search_key('data-a', 3, 42, 3, 5, 15, 3, 5, 1)
+
+    first = engine.successive_halving(store=TrialStore(path, key=key), log=lambda message: None, **settings)
+    logs = []
+    second = engine.successive_halving(store=TrialStore(path, key=key), log=logs.append, **settings)
+    assert second == first
+    assert logs == ['Rung with 5 rounds: 3 trials (3 already done)', 'Rung with 15 rounds: 1 trials (1 already done)']
+
+    # 学習データが変われば再利用しない
+    other = search_key('data-b', 3, 42, 3, 5, 15, 3, 5, 1)
+    logs = []
+    engine.successive_halving(store=TrialStore(path, key=other), log=logs.append, **settings)
+    assert logs[0] == 'Rung with 5 rounds: 3 trials (0 already done)'
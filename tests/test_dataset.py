@@ -0,0 +1,53 @@
+import pandas as pd
+
+from dataset import import_csv, read_raw, write_raw
+
+def _listings(rent):
+    return pd.DataFrame({
+        'building_name': ['A', 'B', 'C'],
+        'address': ['東京都渋谷区神南1', '東京都新宿区西新宿2', '東京都港区赤坂3'],
+        'rent': rent,
+        'detail_url': [f'https://suumo.jp/chintai/jnc_{i}/' for i in range(3)],
+    })
+
+def test_read_raw_keeps_latest_snapshot_per_listing(tmp_path):
+    path = str(tmp_path / 'raw')
+    write_raw(_listings([8.0, 9.0, 10.0]), path=path, scrape_date='2024-01-01')
+    write_raw(_listings([8.5, 9.0, 10.0]), path=path, scrape_date='2024-01-08')
+
+    assert len(read_raw(path=path, latest_only=False)) == 6
+    df = read_raw(path=path)
+    assert len(df) == 3
+    assert df['detail_url'].is_unique
+    assert (df['scrape_date'] == '2024-01-08').all()
+    assert df.loc[df['building_name'] == 'A', 'rent'].item() == 8.5
+
+def test_read_raw_columns_without_key_columns(tmp_path):
+    path = str(tmp_path / 'raw')
+    write_raw(_listings([8.0, 9.0, 10.0]), path=path, scrape_date='2024-01-01')
+    write_raw(_listings([8.0, 9.0, 10.0]), path=path, scrape_date='2024-01-08')
+
+    df = read_raw(columns=['row_id', 'rent'], path=path)
+    assert list(df.columns) == ['row_id', 'rent']
+    assert len(df) == 3
+
+def test_import_csv_adds_only_new_or_repriced_listings(tmp_path):
+    path = str(tmp_path / 'raw')
+    csv_path = str(tmp_path / 'suumo_data_final.csv')
+    _listings([8.0, 9.0, 10.0]).to_csv(csv_path, index=False, encoding='utf-8-sig')
+    assert import_csv(csv_path, path=path, scrape_date='2024-01-01') == (3, 3)
+    assert import_csv(csv_path, path=path, scrape_date='2024-01-08') == (0, 3)
+
+    # スクレイパーは価格の変わった物件と新しい物件をCSVに追記する
+    appended = pd.DataFrame({'building_name': ['A', 'D'], 'address': ['東京都渋谷区神南1', '東京都港区赤坂4'],
+                             'rent': [7.5, 6.0], 'detail_url': ['https://suumo.jp/chintai/jnc_0/',
+                                                               'https://suumo.jp/chintai/jnc_3/']})
+    pd.concat([_listings([8.0, 9.0, 10.0]), appended]).to_csv(csv_path, index=False, encoding='utf-8-sig')
+    assert import_csv(csv_path, path=path, scrape_date='2024-01-15') == (2, 5)
+    # 同じ取得日で取り込み直してもパーティションを置き換えるだけ
+    assert import_csv(csv_path, path=path, scrape_date='2024-01-15') == (2, 5)
+
+    assert len(read_raw(path=path, latest_only=False)) == 5
+    df = read_raw(path=path)
+    assert sorted(df['building_name']) == ['A', 'B', 'C', 'D']
+    assert df.loc[df['building_name'] == 'A', 'rent'].item() == 7.5
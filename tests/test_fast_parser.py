@@ -0,0 +1,18 @@
+import pytest
+
+import fast_parser
+import suumo_scraper
+from synthetic_corpus import SyntheticCorpus
+
+@pytest.mark.parametrize('html', ['', '   ', '\n\t', '<!-- empty -->'])
+def test_empty_page_matches_bs4(html):
+    assert fast_parser.parse_listing(html) == suumo_scraper.parse_listing(html) == {'properties': [], 'next_url': None}
+    assert fast_parser.parse_detail_page(html) == suumo_scraper.parse_detail_page(html)
+
+def test_synthetic_pages_match_bs4():
+    corpus = SyntheticCorpus(30, seed=3)
+    page = corpus.listing_page(0)
+    assert fast_parser.parse_listing(page) == suumo_scraper.parse_listing(page)
+    for i in range(len(corpus)):
+        page = corpus.detail_page(i)
+        assert fast_parser.parse_detail_page(page) == suumo_scraper.parse_detail_page(page)
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from geo_index import NEIGHBOR_COLUMNS, GeoIndex
+from geocoder import build_gazetteer
+
+TOWNS = [('渋谷区', '神南一丁目', 35.6640, 139.6990), ('渋谷区', '神南二丁目', 35.6660, 139.6960),
+         ('渋谷区', '宇田川町', 35.6610, 139.6970), ('新宿区', '西新宿一丁目', 35.6900, 139.6970),
+         ('新宿区', '西新宿二丁目', 35.6890, 139.6920)]
+
+def _gazetteer(tmp_path):
+    csv_path = tmp_path / 'towns.csv'
+    pd.DataFrame([('東京都', city, town, lat, lon) for city, town, lat, lon in TOWNS],
+                 columns=['都道府県名', '市区町村名', '大字町丁目名', '緯度', '経度']).to_csv(csv_path, index=False)
+    path = str(tmp_path / 'geo')
+    build_gazetteer([str(csv_path)], path, encoding='utf-8')
+    return path
+
+def _listings():
+    addresses = ['東京都渋谷区神南1', '東京都渋谷区神南2', '東京都渋谷区宇田川町', '東京都新宿区西新宿1',
+                 '東京都新宿区西新宿2', '東京都渋谷区どこか町']
+    return pd.DataFrame({'address': addresses * 4, 'rent': np.linspace(6, 15, 24), 'area': 25.0})
+
+def test_neighbor_features_need_town_level_coordinates(tmp_path):
+    df = _listings()
+    index = GeoIndex(gazetteer_path=_gazetteer(tmp_path), k=3).fit(df)
+    assert index.neighbor_columns == NEIGHBOR_COLUMNS
+    features = index.transform(df)
+    town_level = features['geo_level'] >= 2
+    assert town_level.sum() == 20
+    assert features.loc[town_level, NEIGHBOR_COLUMNS].notna().all().all()
+    # 市区町村の代表点しかない物件は近傍を集計しない
+    assert features.loc[~town_level, NEIGHBOR_COLUMNS].isna().all().all()
+    oof = index.out_of_fold_neighbors(df, n_splits=4)
+    assert oof.loc[~town_level].isna().all().all()
+    assert oof.loc[town_level].notna().all().all()
+
+def test_no_neighbor_features_without_gazetteer(tmp_path):
+    df = _listings()
+    index = GeoIndex(gazetteer_path=str(tmp_path / 'missing'), k=3).fit(df)
+    assert index.neighbor_columns == []
+    features = index.transform(df)
+    assert not set(NEIGHBOR_COLUMNS) & set(features.columns)
+    assert (features['geo_level'].iloc[:5] == 1).all()
@@ -0,0 +1,21 @@
+from functools import partial
+
+import fast_parser
+import suumo_scraper
+from http_client import ResponseCache, parser_id
+
+def test_parsed_results_are_cached_per_parser(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    bs4_id = parser_id(partial(suumo_scraper.parse_listing, root='http://example.com'))
+    lxml_id = parser_id(partial(fast_parser.parse_listing, root='http://example.com'))
+    assert bs4_id != lxml_id
+    assert bs4_id.endswith(f'.v{suumo_scraper.PARSER_VERSION}')
+
+    cache.put('http://example.com/a', '<html></html>')
+    cache.put_parsed('http://example.com/a', bs4_id, {'backend': 'bs4'})
+    assert cache.get_parsed('http://example.com/a', bs4_id) == {'backend': 'bs4'}
+    assert cache.get_parsed('http://example.com/a', lxml_id) is None
+
+    # 本文が変わったら、どの解析関数の結果も使わない
+    cache.put('http://example.com/a', '<html><body></body></html>')
+    assert cache.get_parsed('http://example.com/a', bs4_id) is None
@@ -0,0 +1,46 @@
+import csv
+
+from listing_store import ListingStore
+from record_writer import RecordWriter
+
+COLUMNS = ['building_name', 'rent', 'admin_fee', 'deposit', 'gratuity', 'detail_url', 'structure',
+           'has_separate_bath_toilet']
+
+def _listing(name, rent, **details):
+    return dict({'building_name': name, 'rent': rent, 'admin_fee': 5000, 'deposit': 1.0, 'gratuity': 0.0,
+                 'detail_url': f'https://suumo.jp/chintai/{name}/'}, **details)
+
+def _rows(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return list(csv.DictReader(f))
+
+def test_incremental_run_keeps_history_and_appends_changes(tmp_path):
+    csv_path = str(tmp_path / 'suumo_data_final.csv')
+    # 差分クロールを使う前の通常のクロールで書いたCSV
+    writer = RecordWriter(csv_path, columns=COLUMNS)
+    writer.write([_listing('A', 8.0, structure='RC', has_separate_bath_toilet=1),
+                  _listing('B', 9.5, structure='木造', has_separate_bath_toilet=0),
+                  _listing('C', 7.0)])
+    writer.close()
+
+    store = ListingStore(str(tmp_path / 'listings.sqlite'))
+    assert store.is_empty()
+    assert store.import_csv(csv_path) == 3
+
+    # 価格が同じなら前回の詳細情報を使い、変わっていれば詳細ページを取り直す
+    assert store.known_details(_listing('A', 8.0)) == {'structure': 'RC', 'has_separate_bath_toilet': 1}
+    assert store.known_details(_listing('B', 9.0)) is None
+    # 詳細ページを取れていなかった物件は取り直す
+    assert store.known_details(_listing('C', 7.0)) is None
+
+    writer = RecordWriter(csv_path, columns=COLUMNS, store=store)
+    writer.write([_listing('A', 8.0, structure='RC', has_separate_bath_toilet=1),
+                  _listing('B', 9.0, structure='木造', has_separate_bath_toilet=0),
+                  _listing('D', 6.5, structure='S', has_separate_bath_toilet=1)])
+    writer.close()
+
+    # CSVは書き直さず、価格の変わった物件と新しい物件だけを追記する
+    assert [(row['building_name'], row['rent']) for row in _rows(csv_path)] == \
+        [('A', '8.0'), ('B', '9.5'), ('C', '7.0'), ('B', '9.0'), ('D', '6.5')]
+    assert store.price_keys()['https://suumo.jp/chintai/B/'] == '9.0|5000|1.0|0.0'
+    store.close()
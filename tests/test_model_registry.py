@@ -0,0 +1,16 @@
+import pandas as pd
+
+from dataset import write_processed
+from model_registry import dataset_fingerprint
+
+def test_dataset_fingerprint_ignores_file_names(tmp_path):
+    path = str(tmp_path / 'processed')
+    df = pd.DataFrame({'row_id': [0, 1, 2], 'area_m2': [20.0, 30.5, 41.0], 'rent_log': [2.1, 2.3, 2.5],
+                       'area_name': ['渋谷区', '新宿区', '渋谷区']})
+    write_processed(df, path=path)
+    first = dataset_fingerprint(path)
+    write_processed(df, path=path)
+    assert dataset_fingerprint(path) == first
+
+    write_processed(df.assign(area_m2=[20.0, 30.5, 42.0]), path=path)
+    assert dataset_fingerprint(path) != first
@@ -0,0 +1,28 @@
+import pipeline
+from pipeline import Stage, code_dependencies, select, stage_key, up_to_date
+
+def test_code_dependencies_follow_imports():
+    code = code_dependencies('scraping/suumo_scraper.py')
+    for path in ['scraping/async_crawler.py', 'scraping/fast_parser.py', 'scraping/rent_planner.py',
+                 'raw_file/metrics.py']:
+        assert path in code
+    assert 'raw_file/cv_engine.py' in code_dependencies('raw_file/train_model.py')
+
+def test_search_runs_only_when_requested():
+    assert [stage.name for stage in select(['train'])] == ['scrape', 'import', 'preprocess', 'train']
+    assert 'search' in [stage.name for stage in select(['search', 'train'])]
+
+def test_changed_input_or_lost_output_invalidates_stage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'in.csv').write_text('a\n1\n')
+    (tmp_path / 'out.csv').write_text('b\n')
+    stage = Stage('import', 'raw_file/dataset.py', inputs=['in.csv'], outputs=['out.csv'])
+    key = stage_key(stage)
+    state = {'import': {'key': key, 'outputs': pipeline.content_hash(stage.outputs)}}
+    assert up_to_date(stage, key, state)
+
+    (tmp_path / 'in.csv').write_text('a\n2\n')
+    assert stage_key(stage) != key
+
+    (tmp_path / 'out.csv').unlink()
+    assert not up_to_date(stage, key, state)
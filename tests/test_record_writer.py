@@ -0,0 +1,39 @@
+import csv
+
+from record_writer import RecordWriter
+
+COLUMNS = ['building_name', 'rent', 'admin_fee', 'area', 'detail_url']
+
+def _rows(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return list(csv.DictReader(f))
+
+def test_resume_skips_listings_already_in_csv(tmp_path):
+    path = str(tmp_path / 'listings.csv')
+    writer = RecordWriter(path, columns=COLUMNS)
+    writer.write([{'building_name': 'A', 'rent': 1.0, 'admin_fee': 5000, 'area': 20.0, 'detail_url': 'https://suumo.jp/a/'},
+                  {'building_name': 'B', 'rent': 8.5, 'admin_fee': 0, 'area': 25.5, 'detail_url': 'https://suumo.jp/b/'}])
+    writer.close()
+
+    # 再開後は値の書式が違っても（1.0 と 1）同じ物件・同じ価格なら書かない
+    writer = RecordWriter(path, columns=COLUMNS)
+    writer.write([{'building_name': 'A', 'rent': 1, 'admin_fee': 5000.0, 'area': 20, 'detail_url': 'https://suumo.jp/a/'},
+                  {'building_name': 'C', 'rent': 7.0, 'admin_fee': 0, 'area': 18.0, 'detail_url': 'https://suumo.jp/c/'},
+                  {'building_name': 'C', 'rent': 7.0, 'admin_fee': 0, 'area': 18.0, 'detail_url': 'https://suumo.jp/c/'}])
+    writer.close()
+
+    assert [row['building_name'] for row in _rows(path)] == ['A', 'B', 'C']
+    assert writer.duplicates == 2
+
+def test_repriced_listing_is_written_again(tmp_path):
+    path = str(tmp_path / 'listings.csv')
+    writer = RecordWriter(path, columns=COLUMNS)
+    writer.write([{'building_name': 'A', 'rent': 8.0, 'admin_fee': 5000, 'area': 20.0, 'detail_url': 'https://suumo.jp/a/'}])
+    writer.close()
+
+    writer = RecordWriter(path, columns=COLUMNS)
+    writer.write([{'building_name': 'A', 'rent': 7.5, 'admin_fee': 5000, 'area': 20.0, 'detail_url': 'https://suumo.jp/a/'}])
+    writer.close()
+
+    assert [row['rent'] for row in _rows(path)] == ['8.0', '7.5']
+    assert writer.duplicates == 0
@@ -0,0 +1,50 @@
+import json
+from urllib.parse import parse_qs, urlparse
+
+from rent_planner import ITEMS_PER_PAGE, RENT_BOUNDARIES, RentPlanner
+
+AREAS = [('新宿区', '13', '13104')]
+
+def _fetcher(rents, fail=()):
+    """検索URLの賃料の下限・上限（両端を含む）に入る物件数を返す。fail の範囲は取得に失敗する"""
+    def fetch(url):
+        query = parse_qs(urlparse(url).query)
+        lo, hi = float(query['cb'][0]), float(query['ct'][0])
+        if (lo, hi) in fail:
+            return None
+        return sum(lo <= rent <= hi for rent in rents)
+    return fetch
+
+def _true_count(rents, lo, hi):
+    return sum(lo <= rent <= hi for rent in rents)
+
+def test_leaves_fit_target_with_listings_on_boundaries(tmp_path):
+    # キリのよい賃料（X.0万・X.5万）の物件が多く、分割の境界にちょうど乗る
+    rents = [8.0] * 300 + [8.5] * 200 + [9.0] * 250 + [7.3] * 120 + [12.0] * 90
+    planner = RentPlanner(cache_path=str(tmp_path / 'plan.json'), target_pages=2, count_fetcher=_fetcher(rents))
+    ranges = planner.plan(AREAS)['13104']
+
+    assert ranges[0][0] == RENT_BOUNDARIES[0] and ranges[-1][1] == RENT_BOUNDARIES[-1]
+    for (_, hi, _), (lo, _, _) in zip(ranges, ranges[1:]):
+        assert hi == lo
+    for lo, hi, count in ranges:
+        assert count >= _true_count(rents, lo, hi)
+        single_step = RENT_BOUNDARIES.index(hi) - RENT_BOUNDARIES.index(lo) == 1
+        assert single_step or _true_count(rents, lo, hi) <= 2 * ITEMS_PER_PAGE
+
+def test_plan_with_failed_probe_is_not_cached(tmp_path):
+    cache_path = tmp_path / 'plan.json'
+    rents = [5.0 + 0.1 * i for i in range(400)]
+    mid = RENT_BOUNDARIES[(len(RENT_BOUNDARIES) - 1) // 2]
+    planner = RentPlanner(cache_path=str(cache_path), target_pages=2,
+                          count_fetcher=_fetcher(rents, fail={(RENT_BOUNDARIES[0], mid)}))
+    ranges = planner.plan(AREAS)['13104']
+    assert planner.failed_probes == 1
+    assert (RENT_BOUNDARIES[0], mid, None) in ranges
+    assert not cache_path.exists()
+
+    # 次の実行では問い合わせ直し、成功した計画を保存する
+    planner = RentPlanner(cache_path=str(cache_path), target_pages=2, count_fetcher=_fetcher(rents))
+    ranges = planner.plan(AREAS)['13104']
+    assert all(count is not None for _, _, count in ranges)
+    assert json.loads(cache_path.read_text(encoding='utf-8'))['13104']['ranges'] == [list(r) for r in ranges]
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from station_index import StationIndex, parse_route
+
+def test_parse_route_ignores_bus_walk():
+    assert parse_route('ＪＲ山手線/渋谷駅 歩5分') == ('ＪＲ山手線', '渋谷駅', 5.0)
+    line, station, minutes = parse_route('東急バス/渋谷駅 バス10分 (バス停)大橋 歩3分')
+    assert (line, station) == ('東急バス', '渋谷駅') and np.isnan(minutes)
+
+def test_fit_transform_and_reload(tmp_path):
+    df = pd.DataFrame({
+        'transportation_1': ['ＪＲ山手線/渋谷駅 歩5分'] * 3 + ['東京メトロ銀座線/新橋駅 歩2分'],
+        'transportation_2': ['東京メトロ銀座線/渋谷駅 歩8分', 'ＪＲ山手線/原宿駅 歩15分', None, None],
+        'transportation_3': [None, None, None, None],
+        'rent': [10.0, 12.0, 14.0, 9.0],
+    })
+    index = StationIndex().fit(df)
+    features = index.transform(df)
+    assert features['min_walk_minutes'].tolist() == [5.0, 5.0, 5.0, 2.0]
+    assert features['lines_within_10min'].tolist() == [2.0, 1.0, 1.0, 1.0]
+    # 物件数が MIN_STATION_LISTINGS に満たない新橋駅は欠損
+    assert features['station_median_rent'].iloc[0] == 12.0
+    assert np.isnan(features['station_median_rent'].iloc[3])
+
+    path = str(tmp_path / 'station_index.json')
+    index.save(path)
+    pd.testing.assert_frame_equal(StationIndex.load(path).transform(df), features)